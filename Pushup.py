@@ -1,10 +1,10 @@
-import cv2
-import numpy as np
+import time
 import mediapipe as mp
+from landmarks import LandmarkFrame, LEFT_ANKLE, LEFT_ELBOW, LEFT_HIP, LEFT_KNEE, LEFT_SHOULDER, LEFT_WRIST
+from kinematics import BilateralKinematics
 
 # Initialize MediaPipe Pose
 mp_pose = mp.solutions.pose
-mp_draw = mp.solutions.drawing_utils
 
 # Define ideal angles and thresholds
 IDEAL_ANGLES = {
@@ -18,33 +18,45 @@ IDEAL_ANGLES = {
 
 THRESHOLD = 20  # Acceptable deviation in degrees
 
+# MediaPipe Pose confidence, the inference pool builds this session's graph with it too
+POSE_OPTIONS = dict(min_detection_confidence=0.9, min_tracking_confidence=0.95)
+
 class PushUpExerciseProcessor:
+    pose_options = POSE_OPTIONS
+    
     def __init__(self):
-        self.pose = mp_pose.Pose(min_detection_confidence=0.9, min_tracking_confidence=0.95, static_image_mode=False)
+        self._pose = None  # MediaPipe graph, created on first inference
         self.rep_count = 0
         self.pose_history = []
         self.exercise_type = "pushup"
         self.last_position = None
+        
+        # Angles for both sides in one pass, the more visible side is used
+        self.kinematics = BilateralKinematics({
+            "elbow_angle": (LEFT_SHOULDER, LEFT_ELBOW, LEFT_WRIST),
+            "hip_angle": (LEFT_SHOULDER, LEFT_HIP, LEFT_KNEE),
+            "knee_angle": (LEFT_HIP, LEFT_KNEE, LEFT_ANKLE)
+        })
+    
+    @property
+    def pose(self):
+        """MediaPipe graph, analysis-only instances never create one"""
+        if self._pose is None:
+            self._pose = mp_pose.Pose(static_image_mode=False, **self.pose_options)
+        return self._pose
+    
+    def close(self):
+        """Close the MediaPipe graph if one was created"""
+        if self._pose is not None:
+            self._pose.close()
+            self._pose = None
     
     def reset_state(self):
         """Reset exercise state"""
         self.rep_count = 0
         self.pose_history = []
         self.last_position = None
-    
-    def calculate_angle(self, a, b, c):
-        """Calculate angle between three points"""
-        a = np.array(a)  # Point A
-        b = np.array(b)  # Point B
-        c = np.array(c)  # Point C
-
-        radians = np.arctan2(c[1] - b[1], c[0] - b[0]) - np.arctan2(a[1] - b[1], a[0] - b[0])
-        angle = np.abs(radians * 180.0 / np.pi)
-
-        if angle > 180.0:
-            angle = 360 - angle
-
-        return angle
+        self.kinematics.reset()
     
     def calculate_angle_accuracy(self, actual_angle, target_angle, threshold=THRESHOLD):
         """Calculate accuracy based on angle deviation"""
@@ -57,30 +69,15 @@ class PushUpExerciseProcessor:
 
         return accuracy
     
-    def calculate_posture_accuracy(self, landmarks, position):
+    def calculate_posture_accuracy(self, angles, position):
         """Calculate posture accuracy based on exercise type"""
-        if not landmarks:
+        if not angles:
             return 0
         
         if self.exercise_type == "pushup":
-            # Extract key landmarks for pushups
-            shoulder = [landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x,
-                        landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y]
-            elbow = [landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].x,
-                     landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].y]
-            wrist = [landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].x,
-                     landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].y]
-            hip = [landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].x,
-                   landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].y]
-            knee = [landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value].x,
-                    landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value].y]
-            ankle = [landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value].x,
-                    landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value].y]
-
-            # Calculate angles
-            elbow_angle = self.calculate_angle(shoulder, elbow, wrist)
-            hip_angle = self.calculate_angle(shoulder, hip, knee)
-            knee_angle = self.calculate_angle(hip, knee, ankle)
+            elbow_angle = angles["elbow_angle"]
+            hip_angle = angles["hip_angle"]
+            knee_angle = angles["knee_angle"]
 
             # Get target angle based on position
             if position == "up":
@@ -110,39 +107,31 @@ class PushUpExerciseProcessor:
             "message": "Unsupported exercise type"
         }
     
-    def process_frame(self, img):
-        """Process video frame using MediaPipe Pose"""
-        print("pushup received frame")
-        # Convert to RGB for MediaPipe
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        
-        # Process the image
+    def detect_landmarks(self, img_rgb):
+        """Run MediaPipe Pose on an RGB frame already scaled to inference size"""
         results = self.pose.process(img_rgb)
-        
-        # Convert back to BGR
-        processed_img = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2BGR)
-        
-        landmarks = None
-        if results.pose_landmarks:
-            landmarks = results.pose_landmarks.landmark
-            mp_draw.draw_landmarks(processed_img, results.pose_landmarks, mp_pose.POSE_CONNECTIONS)
-        
-        return processed_img, landmarks
+        if not results.pose_landmarks:
+            return None
+        return LandmarkFrame.from_mediapipe(results.pose_landmarks.landmark, time.time())
     
     def analyze_exercise(self, landmarks):
         """Analyze exercise form and count reps"""
-        # position = None
+        kinematics = self.kinematics.compute(landmarks) if landmarks else None
+        
+        # Skip the frame entirely when the joints we need are occluded
+        if kinematics is None:
+            return {
+                "form": "Joints not visible",
+                "accuracy": 0,
+                "position": self.last_position,
+                "repCount": self.rep_count,
+                "angles": {}
+            }
         
         # Extract exercise-specific angles for rep counting
-        if self.exercise_type == "pushup" and landmarks:
-            shoulder = [landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x,
-                       landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y]
-            elbow = [landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].x,
-                    landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].y]
-            wrist = [landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].x,
-                    landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].y]
-            
-            elbow_angle = self.calculate_angle(shoulder, elbow, wrist)
+        angles = kinematics["angles"]
+        if self.exercise_type == "pushup":
+            elbow_angle = angles["elbow_angle"]
             
             # Push-up counting logic
             if elbow_angle > 160:
@@ -153,19 +142,14 @@ class PushUpExerciseProcessor:
                 self.last_position = "down"
         
         position = self.last_position
-        # Update position history
-        # self.last_position = position
         
         # Calculate accuracy and form feedback
-        # accuracy_data = self.calculate_posture_accuracy(landmarks, position)
+        accuracy_data = self.calculate_posture_accuracy(angles, position)
         
-        # if isinstance(accuracy_data, dict) and "overall" in accuracy_data:
-        #     accuracy = accuracy_data["overall"]
-        # else:
-        #     accuracy = 0
-        
-        # just for testing 
-        accuracy = 93
+        if isinstance(accuracy_data, dict) and "overall" in accuracy_data:
+            accuracy = accuracy_data["overall"]
+        else:
+            accuracy = 0
         
         # Generate form feedback based on accuracy
         if accuracy < 50:
@@ -182,7 +166,9 @@ class PushUpExerciseProcessor:
             "accuracy": accuracy,
             "position": position,
             "repCount": self.rep_count,
-            # "angles": accuracy_data if isinstance(accuracy_data, dict) else {}
+            "angles": accuracy_data if isinstance(accuracy_data, dict) else {},
+            "side": kinematics["side"],
+            "symmetry": kinematics["symmetry"]
         }
         
 
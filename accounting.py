@@ -0,0 +1,183 @@
+"""
+Per-session CPU and latency accounting.
+
+Every session charges the time its frames spend in each stage of the live
+path (decode, inference, analysis, overlay, encode) to a bucket keyed by
+exercise and input resolution, next to its frame counts. A session that
+switches exercise or whose sender changes resolution simply fills another
+bucket. The numbers are live in session-stats, and when a session ends its
+summary is appended to SESSION_ACCOUNTING_LOG and added to the worker totals.
+
+CPU time is the event loop thread's own (time.thread_time), latency is wall
+time. Stages are only measured around synchronous code: inside an await the
+loop runs other sessions, whose CPU would be charged here. Inference on the
+onnx and procpool backends is awaited and runs outside the loop, so it only
+records latency. Native helper threads (MediaPipe calculators, the aiortc
+encoder executor, the recorder) are not attributed; "encode" is the output
+frame conversion done on the loop.
+"""
+import json
+import os
+import time
+
+SESSION_ACCOUNTING_LOG = os.environ.get("SESSION_ACCOUNTING_LOG", "accounting/sessions.jsonl")
+
+STAGES = ("decode", "inference", "analysis", "overlay", "encode")
+FRAME_COUNTS = ("received", "inferred", "analyzed", "annotated", "passthrough")
+
+
+class StageTotals:
+    """CPU and wall seconds per stage plus frame counts"""
+
+    def __init__(self):
+        self.cpu = dict.fromkeys(STAGES, 0.0)
+        self.wall = dict.fromkeys(STAGES, 0.0)
+        self.frames = dict.fromkeys(FRAME_COUNTS, 0)
+
+    def merge(self, other):
+        for stage in STAGES:
+            self.cpu[stage] += other.cpu[stage]
+            self.wall[stage] += other.wall[stage]
+        for name in FRAME_COUNTS:
+            self.frames[name] += other.frames[name]
+
+    def empty(self):
+        return not self.frames["received"] and not any(self.wall.values())
+
+    def summary(self):
+        received = self.frames["received"]
+        per_frame = 1000 / received if received else 0
+        return {
+            "frames": dict(self.frames),
+            "cpuMs": round(1000 * sum(self.cpu.values()), 1),
+            "cpuMsPerFrame": round(per_frame * sum(self.cpu.values()), 3),
+            "stages": {
+                stage: {
+                    "cpuMs": round(1000 * self.cpu[stage], 1),
+                    "wallMs": round(1000 * self.wall[stage], 1),
+                    "cpuMsPerFrame": round(per_frame * self.cpu[stage], 3)
+                }
+                for stage in STAGES
+            }
+        }
+
+
+class _StageTimer:
+    """Context manager charging a synchronous block to one stage of a bucket"""
+    __slots__ = ("accounting", "totals", "stage", "cpu", "wall")
+
+    def __init__(self, accounting, stage):
+        self.accounting = accounting
+        self.totals = accounting.current
+        self.stage = stage
+
+    def __enter__(self):
+        self.cpu = time.thread_time()
+        self.wall = time.perf_counter()
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.wall
+        self.totals.cpu[self.stage] += time.thread_time() - self.cpu
+        self.totals.wall[self.stage] += wall
+        self.accounting.loop_seconds += wall
+        return False
+
+
+class SessionAccounting:
+    """Stage costs and frame counts of one session, by exercise and input resolution"""
+
+    def __init__(self, exercise):
+        self.exercise = exercise
+        self.resolution = "unknown"
+        self.buckets = {}  # (exercise, resolution) -> StageTotals
+        self.current = self._bucket()
+        # Time the measured stages held the event loop (they are synchronous,
+        # so their wall time), for costs taken across an await
+        self.loop_seconds = 0.0
+
+    def _bucket(self):
+        key = (self.exercise, self.resolution)
+        if key not in self.buckets:
+            self.buckets[key] = StageTotals()
+        return self.buckets[key]
+
+    def set_exercise(self, exercise):
+        if exercise != self.exercise:
+            self.exercise = exercise
+            self.current = self._bucket()
+
+    def frame(self, width, height):
+        """Count a received frame at its input resolution"""
+        resolution = f"{width}x{height}"
+        if resolution != self.resolution:
+            self.resolution = resolution
+            self.current = self._bucket()
+        self.current.frames["received"] += 1
+
+    def count(self, name):
+        self.current.frames[name] += 1
+
+    def stage(self, stage):
+        """Measure a synchronous block, it must not await"""
+        return _StageTimer(self, stage)
+
+    def add(self, stage, cpu=0.0, wall=0.0):
+        """Charge time measured elsewhere, e.g. the latency of awaited inference"""
+        self.current.cpu[stage] += cpu
+        self.current.wall[stage] += wall
+
+    def totals(self):
+        totals = StageTotals()
+        for bucket in self.buckets.values():
+            totals.merge(bucket)
+        return totals
+
+    def summary(self):
+        return {
+            "total": self.totals().summary(),
+            "buckets": [
+                dict(bucket.summary(), exercise=exercise, resolution=resolution)
+                for (exercise, resolution), bucket in self.buckets.items()
+                if not bucket.empty()
+            ]
+        }
+
+
+class WorkerAccounting:
+    """Totals of the sessions that ended on this worker, and their log"""
+
+    def __init__(self, log_path=SESSION_ACCOUNTING_LOG):
+        self.log_path = log_path
+        self.buckets = {}  # (exercise, resolution) -> StageTotals
+        self.sessions = 0
+
+    def finish(self, session_id, accounting, **details):
+        """Add an ended session to the totals and append its summary to the log"""
+        for key, bucket in accounting.buckets.items():
+            if not bucket.empty():
+                self.buckets.setdefault(key, StageTotals()).merge(bucket)
+        self.sessions += 1
+
+        if not self.log_path:
+            return
+        record = dict(details, sessionId=session_id, endedAt=time.time(), **accounting.summary())
+        try:
+            directory = os.path.dirname(self.log_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.log_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            print(f"Error writing accounting of session {session_id}: {e}")
+
+    def stats(self):
+        return {
+            "sessions": self.sessions,
+            "buckets": [
+                dict(bucket.summary(), exercise=exercise, resolution=resolution)
+                for (exercise, resolution), bucket in sorted(self.buckets.items())
+            ]
+        }
+
+
+worker_accounting = WorkerAccounting()
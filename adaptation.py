@@ -0,0 +1,105 @@
+import os
+import time
+
+from admission import admission
+
+# Sender settings the worker can ask a client for, best first
+RESOLUTION_LADDER = [
+    {"width": 1280, "height": 720, "frameRate": 30, "maxBitrate": 1500000},
+    {"width": 960, "height": 540, "frameRate": 30, "maxBitrate": 1000000},
+    {"width": 640, "height": 480, "frameRate": 30, "maxBitrate": 700000},
+    {"width": 480, "height": 360, "frameRate": 24, "maxBitrate": 450000},
+    {"width": 320, "height": 240, "frameRate": 15, "maxBitrate": 250000},
+]
+
+# Width requested at negotiation time; adaptation never goes above it
+TARGET_WIDTH = int(os.environ.get("TARGET_WIDTH", "640"))
+
+# Seconds of event loop time per second the sessions may use between them.
+# Frames are handled on the single loop thread, so this is at most one core
+# however many cores the inference budget counts.
+LOOP_BUDGET = float(os.environ.get("LOOP_BUDGET", "0.8"))
+
+# How often the measured cost is compared against the session's share of
+# the loop, and the fractions of that share that trigger a step down/up
+ADAPT_INTERVAL = 5.0
+STEP_DOWN_ABOVE = 0.9
+STEP_UP_BELOW = 0.5
+
+
+def initial_level():
+    """Largest ladder entry that fits TARGET_WIDTH"""
+    for level, rung in enumerate(RESOLUTION_LADDER):
+        if rung["width"] <= TARGET_WIDTH:
+            return level
+    return len(RESOLUTION_LADDER) - 1
+
+
+def limit_video_bitrate(sdp, max_bitrate):
+    """Add a b=AS bandwidth line to the video section of an SDP answer"""
+    kbps = max_bitrate // 1000
+    lines = sdp.split("\r\n")
+    out = []
+    in_video = False
+    for line in lines:
+        if line.startswith("m="):
+            in_video = line.startswith("m=video")
+        elif in_video and line.startswith("b=AS:"):
+            continue  # Replaced below
+        out.append(line)
+        if in_video and line.startswith("c="):
+            out.append(f"b=AS:{kbps}")
+    return "\r\n".join(out)
+
+
+class ResolutionController:
+    """Chooses the sender resolution for one session from its measured cost.
+
+    Every ADAPT_INTERVAL it compares the time the worker spent on this
+    session's frames (conversion, inference, drawing) on the event loop to
+    the session's fair share of the loop and moves one rung down or up the
+    ladder.
+    """
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.max_level = initial_level()
+        self.level = self.max_level
+        self.window_start = time.perf_counter()
+        self.busy = 0
+        self.frames = 0
+        self.input_width = None
+
+    def constraints(self):
+        return dict(RESOLUTION_LADDER[self.level])
+
+    def record_frame(self, width, seconds):
+        """Account one handled frame, returns new constraints when a change is due"""
+        self.busy += seconds
+        self.frames += 1
+        self.input_width = width
+
+        now = time.perf_counter()
+        elapsed = now - self.window_start
+        if elapsed < ADAPT_INTERVAL:
+            return None
+
+        utilization = self.busy / elapsed
+        self.window_start = now
+        self.busy = 0
+        self.frames = 0
+
+        share = LOOP_BUDGET / max(1, len(admission.sessions))
+        level = self.level
+        if utilization > share * STEP_DOWN_ABOVE and level < len(RESOLUTION_LADDER) - 1:
+            level += 1
+        elif utilization < share * STEP_UP_BELOW and level > self.max_level:
+            level -= 1
+
+        # Also resend when the client keeps sending well above what we asked for
+        oversized = width > RESOLUTION_LADDER[level]["width"] * 1.1
+        if level == self.level and not oversized:
+            return None
+
+        self.level = level
+        return self.constraints()
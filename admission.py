@@ -0,0 +1,164 @@
+import asyncio
+import os
+import time
+
+# Inference budget of this worker in seconds per second the event loop may
+# spend blocked on inference (one loop, so at most 1)
+MAX_INFERENCE_LOAD = float(os.environ.get("MAX_INFERENCE_LOAD", "0.8"))
+
+# How long and how many offers may wait for capacity before being rejected
+QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "10"))
+MAX_QUEUED = int(os.environ.get("ADMISSION_MAX_QUEUED", "4"))
+
+# Assumed load of a session before it has been measured
+DEFAULT_SESSION_LOAD = 0.15
+
+# Frame sampling per QoS tier: trainer-led sessions always keep the base
+# interval, standard sessions step down as utilization crosses each level
+BASE_SAMPLE_INTERVAL = 5
+DEGRADE_LEVELS = [
+    (0.95, 15),
+    (0.80, 10),
+]
+
+EWMA_ALPHA = 0.2
+
+
+class SessionLoad:
+    """Measured event loop inference demand of one session"""
+
+    def __init__(self, tier):
+        self.tier = tier
+        self.cost = None  # EWMA seconds per inference
+        self.rate = None  # EWMA inferences per second
+        self.window_start = time.perf_counter()
+        self.window_count = 0
+        self.sample_interval = BASE_SAMPLE_INTERVAL
+
+    def record(self, seconds):
+        self.cost = seconds if self.cost is None else self.cost + EWMA_ALPHA * (seconds - self.cost)
+
+        self.window_count += 1
+        now = time.perf_counter()
+        elapsed = now - self.window_start
+        if elapsed >= 1.0:
+            rate = self.window_count / elapsed
+            self.rate = rate if self.rate is None else self.rate + EWMA_ALPHA * (rate - self.rate)
+            self.window_start = now
+            self.window_count = 0
+
+    def demand(self):
+        """CPU-seconds per second this session would use at the base sampling rate"""
+        if self.cost is None or self.rate is None:
+            return DEFAULT_SESSION_LOAD
+        return self.cost * self.rate * self.sample_interval / BASE_SAMPLE_INTERVAL
+
+
+class AdmissionController:
+    """Tracks aggregate inference load, admits or queues sessions and applies QoS.
+
+    Load is the sum of each session's demand normalized to the base sampling
+    rate, so degrading a session doesn't make the worker look idle and flap
+    straight back to full rate.
+    """
+
+    def __init__(self, capacity=MAX_INFERENCE_LOAD):
+        self.capacity = capacity
+        self.sessions = {}
+        self.queued = 0
+        self.changed = asyncio.Condition()
+
+    def load(self):
+        return sum(session.demand() for session in self.sessions.values())
+
+    def utilization(self):
+        return self.load() / self.capacity
+
+    def _estimated_demand(self):
+        if not self.sessions:
+            return DEFAULT_SESSION_LOAD
+        return self.load() / len(self.sessions)
+
+    def has_capacity(self):
+        return self.load() + self._estimated_demand() <= self.capacity
+
+    async def admit(self, session_id, tier="standard"):
+        """Admit a session now, or wait in the queue for capacity. Returns False when rejected."""
+        if session_id in self.sessions:
+            self.sessions[session_id].tier = tier
+            return True
+
+        if not self.has_capacity():
+            if self.queued >= MAX_QUEUED:
+                return False
+
+            self.queued += 1
+            try:
+                async with self.changed:
+                    await asyncio.wait_for(self.changed.wait_for(self.has_capacity), QUEUE_TIMEOUT)
+                    # Take the slot before the next woken offer checks capacity
+                    self._add(session_id, tier)
+                return True
+            except asyncio.TimeoutError:
+                return False
+            finally:
+                self.queued -= 1
+
+        self._add(session_id, tier)
+        return True
+
+    def _add(self, session_id, tier):
+        self.sessions[session_id] = SessionLoad(tier)
+        self._apply_qos()
+
+    async def release(self, session_id):
+        if self.sessions.pop(session_id, None) is None:
+            return
+        self._apply_qos()
+        await self._wake_queued()
+
+    async def _wake_queued(self):
+        async with self.changed:
+            self.changed.notify_all()
+
+    def record_inference(self, session_id, seconds):
+        session = self.sessions.get(session_id)
+        if session:
+            session.record(seconds)
+            if session.rate is not None and session.window_count == 0:
+                self._apply_qos()
+                # A lower measured load can make room for queued offers
+                if self.queued and self.has_capacity():
+                    asyncio.create_task(self._wake_queued())
+
+    def _apply_qos(self):
+        """Pick the sampling interval for every session from the current utilization"""
+        utilization = self.utilization()
+        interval = BASE_SAMPLE_INTERVAL
+        for level, level_interval in DEGRADE_LEVELS:
+            if utilization >= level:
+                interval = level_interval
+                break
+
+        for session in self.sessions.values():
+            session.sample_interval = BASE_SAMPLE_INTERVAL if session.tier == "trainer" else interval
+
+    def sample_interval(self, session_id):
+        session = self.sessions.get(session_id)
+        return session.sample_interval if session else BASE_SAMPLE_INTERVAL
+
+    def retry_after(self):
+        """Rough hint for rejected clients, in seconds"""
+        return QUEUE_TIMEOUT
+
+    def stats(self):
+        return {
+            "sessions": len(self.sessions),
+            "queued": self.queued,
+            "load": self.load(),
+            "capacity": self.capacity,
+            "utilization": self.utilization()
+        }
+
+
+admission = AdmissionController()
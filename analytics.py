@@ -0,0 +1,180 @@
+import time
+
+# Angle that drives the rep cycle for each exercise, the direction it moves
+# during the lifting (concentric) phase and the ideal extremes of a full rep
+REP_PROFILES = {
+    "pushup": {
+        "angle": "elbow_angle",
+        "concentric": "increasing",  # Pressing up opens the elbow
+        "low": 70,
+        "high": 170
+    },
+    "pullup": {
+        "angle": "elbow_angle",
+        "concentric": "decreasing",  # Pulling up closes the elbow
+        "low": 50,
+        "high": 180
+    },
+    "bicepcurl": {
+        "angle": "elbow_angle",
+        "concentric": "decreasing",  # Curling closes the elbow
+        "low": 70,
+        "high": 160
+    },
+    "crunch": {
+        "angle": "back_angle",
+        "concentric": "decreasing",  # Crunching closes the hip
+        "low": 40,
+        "high": 100
+    }
+}
+
+THRESHOLD = 20  # Acceptable deviation in degrees
+
+
+class RepAnalytics:
+    """Streaming per-rep analytics built on top of an exercise processor.
+
+    Every update is O(1): only running extremes, their timestamps and a few
+    counters are kept for the rep in progress. When the processor's rep count
+    goes up a rep event is produced and the running statistics start over.
+    """
+
+    def __init__(self, exercise_type):
+        self.exercise_type = exercise_type if exercise_type in REP_PROFILES else "pushup"
+        self.profile = REP_PROFILES[self.exercise_type]
+        self.reset_state()
+
+    def reset_state(self):
+        """Reset analytics state"""
+        self.last_rep_count = 0
+        self.rep_start = None
+        self.frames = 0
+        self.min_angle = None
+        self.max_angle = None
+        self.min_time = None
+        self.max_time = None
+        self.symmetry_sum = 0
+        self.symmetry_frames = 0
+
+        # Session totals kept as running sums
+        self.total_reps = 0
+        self.total_accuracy = 0
+        self.total_duration = 0
+        self.total_range = 0
+
+    def restart(self):
+        """Start over from the next frame, keeping the session totals"""
+        self.last_rep_count = 0
+        self.rep_start = None
+
+    def _start_rep(self, angle, timestamp):
+        self.rep_start = timestamp
+        self.frames = 0
+        self.min_angle = self.max_angle = angle
+        self.min_time = self.max_time = timestamp
+        self.symmetry_sum = 0
+        self.symmetry_frames = 0
+
+    def calculate_angle_accuracy(self, actual_angle, target_angle, threshold=THRESHOLD):
+        """Calculate accuracy based on angle deviation"""
+        deviation = abs(actual_angle - target_angle)
+
+        if deviation <= threshold:
+            accuracy = 100 - ((deviation / threshold)/5) * 100
+        else:
+            accuracy = max(0, 100 - (deviation - threshold)*3)  # Penalize large deviations
+
+        return accuracy
+
+    def update(self, analysis, timestamp=None):
+        """Feed one analysis result, returns a rep event when a rep completes"""
+        if timestamp is None:
+            timestamp = time.time()
+
+        angle = analysis.get("angles", {}).get(self.profile["angle"])
+        if angle is None:
+            return None
+        angle = float(angle)
+
+        if self.rep_start is None:
+            self._start_rep(angle, timestamp)
+            self.last_rep_count = analysis.get("repCount", 0)
+            return None
+
+        # Running extremes for the rep in progress
+        self.frames += 1
+        if angle < self.min_angle:
+            self.min_angle = angle
+            self.min_time = timestamp
+        if angle > self.max_angle:
+            self.max_angle = angle
+            self.max_time = timestamp
+
+        # Left/right difference of the driving angle when both sides are visible
+        symmetry = analysis.get("symmetry", {}).get(self.profile["angle"])
+        if symmetry is not None:
+            self.symmetry_sum += symmetry
+            self.symmetry_frames += 1
+
+        rep_count = analysis.get("repCount", 0)
+        if rep_count <= self.last_rep_count:
+            self.last_rep_count = rep_count  # Processor state was reset
+            return None
+
+        event = self._build_event(rep_count, timestamp)
+        self.last_rep_count = rep_count
+        self._start_rep(angle, timestamp)
+        return event
+
+    def _build_event(self, rep_count, end_time):
+        """Summarize the rep that just finished"""
+        # The turning point splits the rep into its lowering and lifting phases
+        if self.profile["concentric"] == "increasing":
+            turn_time = self.min_time
+        else:
+            turn_time = self.max_time
+
+        duration = end_time - self.rep_start
+        eccentric = turn_time - self.rep_start
+        concentric = end_time - turn_time
+        range_of_motion = self.max_angle - self.min_angle
+
+        low_accuracy = self.calculate_angle_accuracy(self.min_angle, self.profile["low"])
+        high_accuracy = self.calculate_angle_accuracy(self.max_angle, self.profile["high"])
+        accuracy = (low_accuracy + high_accuracy) / 2
+
+        self.total_reps += 1
+        self.total_accuracy += accuracy
+        self.total_duration += duration
+        self.total_range += range_of_motion
+
+        return {
+            "exercise": self.exercise_type,
+            "rep": rep_count,
+            "startTime": self.rep_start,
+            "endTime": end_time,
+            "duration": duration,
+            "eccentricDuration": eccentric,
+            "concentricDuration": concentric,
+            "tempoRatio": eccentric / concentric if concentric > 0 else 0,
+            "minAngle": self.min_angle,
+            "maxAngle": self.max_angle,
+            "rangeOfMotion": range_of_motion,
+            "accuracy": accuracy,
+            # Mean left/right angle difference in degrees, None if one side was never seen
+            "symmetry": self.symmetry_sum / self.symmetry_frames if self.symmetry_frames else None,
+            "frames": self.frames
+        }
+
+    def summary(self):
+        """Session averages over all completed reps"""
+        if self.total_reps == 0:
+            return {"reps": 0, "avgAccuracy": 0, "avgDuration": 0, "avgRangeOfMotion": 0}
+
+        return {
+            "reps": self.total_reps,
+            "avgAccuracy": self.total_accuracy / self.total_reps,
+            "avgDuration": self.total_duration / self.total_reps,
+            "avgRangeOfMotion": self.total_range / self.total_reps
+        }
@@ -6,6 +6,10 @@ import { createServer } from "http";
 config();
 import cors from 'cors';
 import morgan from 'morgan';
+import mongoose from 'mongoose';
+import WorkoutRollup from './models/workoutRollup.model.js';
+import socketAuth from './middlewares/socketAuth.middleware.js';
+import Group from './models/group.model.js';
 
 const PORT = process.env.PORT || 5001;
 const WEBSOCKET_PORT = 5002;
@@ -25,27 +29,95 @@ const io = new Server(server, {
   transports: ["websocket", "polling"]  // Ensure both WebSocket & polling are supported
 });
 
-// Track connected clients
-let pythonSocket = null;
+// Every socket's identity is checked once at the handshake, see socketAuth
+io.use(socketAuth);
+
+// Python workers keyed by their workerId. A prefork supervisor runs several,
+// and every session sticks to the worker that took its offer.
+const pythonWorkers = new Map(); // workerId -> { socket, draining }
+const sessionWorkers = new Map(); // sessionId -> workerId
+const sessionClients = new Map(); // sessionId -> { socketId, userId } of the client that owns it
 const connectedClients = new Map(); // Map to track client connections
 
+const workerIdOf = (socket) => connectedClients.get(socket.id)?.workerId;
+const isWorker = (socket) => pythonWorkers.get(workerIdOf(socket))?.socket === socket;
+const hasWorkers = () => pythonWorkers.size > 0;
+const isAdmin = (socket) => Boolean(socket.data.user?.admin);
+
+// Worker a session is pinned to, if it is connected
+const sessionWorker = (sessionId = "default") => pythonWorkers.get(sessionWorkers.get(sessionId))?.socket || null;
+
+// Pinned worker, or pin the session to the least busy worker that isn't draining
+const workerFor = (sessionId = "default") => {
+  const pinned = sessionWorker(sessionId);
+  if (pinned) return pinned;
+
+  const load = new Map();
+  for (const workerId of sessionWorkers.values()) {
+    load.set(workerId, (load.get(workerId) || 0) + 1);
+  }
+  let best = null;
+  for (const [workerId, worker] of pythonWorkers) {
+    if (!worker.draining && (!best || (load.get(workerId) || 0) < (load.get(best) || 0))) {
+      best = workerId;
+    }
+  }
+  if (!best) return null;
+  sessionWorkers.set(sessionId, best);
+  return pythonWorkers.get(best).socket;
+};
+
+// Events about one session go only to the client that owns it
+const toSessionClient = (event, data) => {
+  const client = sessionClients.get(data?.sessionId || "default");
+  if (client) {
+    io.to(client.socketId).emit(event, data);
+  }
+};
+
+const toAllWorkers = (event, data) => {
+  for (const { socket } of pythonWorkers.values()) {
+    socket.emit(event, data);
+  }
+};
+
 // Log connected clients count every minute
 
 io.on("connection", (socket) => {
   console.log(`✅ Client connected: ${socket.id}`);
   connectedClients.set(socket.id, { type: 'unknown', connectedAt: new Date() });
+  if (isAdmin(socket)) {
+    socket.join("admins");
+  }
+  // Worker stats go to admins and to tools holding the worker token
+  if (isAdmin(socket) || socket.data.worker) {
+    socket.join("monitors");
+  }
   
   socket.on("disconnect", () => {
     console.log(`🔄 Client disconnected: ${socket.id}`);
-    connectedClients.delete(socket.id);
+    const clientInfo = connectedClients.get(socket.id);
     
-    if (socket.id === pythonSocket?.id) {
-      console.log("⚠️ Python WebRTC server disconnected!");
-      pythonSocket = null;
+    if (isWorker(socket)) {
+      // Session pins are kept, a worker that reconnects keeps its sessions
+      console.log(`⚠️ Python WebRTC worker ${clientInfo.workerId} disconnected!`);
+      pythonWorkers.delete(clientInfo.workerId);
       
-      // Notify all clients that Python server is disconnected
-      io.emit("python-disconnected");
+      // Notify all clients once no worker is left
+      if (!hasWorkers()) {
+        io.emit("python-disconnected");
+      }
+    } else {
+      // Stop any dashboard stream this client was following
+      toAllWorkers("dashboard-unsubscribe", { subscriberId: socket.id });
+      clientInfo?.sessions?.forEach((sessionId) => {
+        sessionWorkers.delete(sessionId);
+        if (sessionClients.get(sessionId)?.socketId === socket.id) {
+          sessionClients.delete(sessionId);
+        }
+      });
     }
+    connectedClients.delete(socket.id);
   });
   
   socket.on("error", (error) => {
@@ -53,24 +125,55 @@ io.on("connection", (socket) => {
   });
   
   // Python server connection
-  socket.on("connect-python", () => {
-    pythonSocket = socket;
-    connectedClients.set(socket.id, { type: 'python', connectedAt: new Date() });
-    console.log(`🐍 Python WebRTC server connected! Socket ID: ${pythonSocket.id}`);
+  socket.on("connect-python", (data) => {
+    if (!socket.data.worker) {
+      console.error(`❌ Socket ${socket.id} tried to register as a Python worker without the worker token`);
+      return;
+    }
+    const workerId = data?.workerId || socket.id;
+    pythonWorkers.set(workerId, { socket, draining: Boolean(data?.draining) });
+    connectedClients.set(socket.id, { type: 'python', workerId, connectedAt: new Date() });
+    console.log(`🐍 Python WebRTC worker ${workerId} connected! Socket ID: ${socket.id}`);
+    
+    // Clients keep their sessions through a worker reconnect
+    socket.broadcast.emit("python-connected");
   });
   
   // Handle WebRTC offer from React client
   socket.on("webrtc-offer", (data) => {
     console.log("📡 Received SDP Offer from React, sending to Python...");
+    const sessionId = data?.sessionId || "default";
+    const user = socket.data.user;
     
-    // Check if Python server is connected
-    if (pythonSocket) {
-      // Forward offer with exercise type to Python
-      pythonSocket.emit("webrtc-offer", data);
+    // A session belongs to the user that opened it, nobody else may renegotiate it
+    const owner = sessionClients.get(sessionId);
+    if (owner && owner.userId !== user?.id) {
+      console.error(`❌ Socket ${socket.id} sent an offer for a session it does not own`);
+      socket.emit("webrtc-rejected", { sessionId, reason: "forbidden" });
+      return;
+    }
+    
+    // Who trains is taken from the checked identity, never from the payload
+    const offer = {
+      ...data,
+      userId: user?.type === "trainee" ? user.id : undefined,
+      trainerId: user?.trainerId,
+      groupId: user?.groupId
+    };
+    delete offer.trainerLed;
+    
+    // Check if a Python worker is connected
+    const worker = workerFor(data.sessionId);
+    if (worker) {
+      // Forward offer with exercise type to the session's worker
+      worker.emit("webrtc-offer", offer);
+      sessionClients.set(sessionId, { socketId: socket.id, userId: user?.id });
+      const clientInfo = connectedClients.get(socket.id);
       connectedClients.set(socket.id, { 
         type: 'react', 
         exerciseType: data.exerciseType,
-        connectedAt: connectedClients.get(socket.id)?.connectedAt || new Date()
+        sessions: new Set(clientInfo?.sessions).add(data.sessionId || "default"),
+        connectedAt: clientInfo?.connectedAt || new Date()
       });
     } else {
       console.error("❌ Python server is not connected!");
@@ -81,18 +184,20 @@ io.on("connection", (socket) => {
   // Handle WebRTC answer from Python
   socket.on("webrtc-answer", (data) => {
     console.log("📡 Received SDP Answer from Python, sending to React...");
-    socket.broadcast.emit("webrtc-answer", data);
+    if (isWorker(socket)) {
+      toSessionClient("webrtc-answer", data);
+    }
   });
   
   // Handle ICE candidate exchange
   socket.on("ice-candidate", (data) => {
     // console.log("📡 Forwarding ICE Candidate...");
-    if (socket.id === pythonSocket?.id) {
-      // From Python to React
-      socket.broadcast.emit("ice-candidate", data);
-    } else if (pythonSocket) {
-      // From React to Python
-      pythonSocket.emit("ice-candidate", data);
+    if (isWorker(socket)) {
+      // From Python to the session's client
+      toSessionClient("ice-candidate", data);
+    } else if (sessionWorker(data?.sessionId)) {
+      // From React to the session's worker
+      sessionWorker(data?.sessionId).emit("ice-candidate", data);
     } else {
       console.error("❌ Python socket is null, cannot forward ICE candidate!");
       socket.emit("python-disconnected");
@@ -102,17 +207,13 @@ io.on("connection", (socket) => {
   // Handle frames-ready event from React
   socket.on("frames-ready", (data) => {
     console.log("📊 Client reports frames are ready to flow");
-    if (pythonSocket) {
-      pythonSocket.emit("frames-ready", data);
-    }
+    sessionWorker(data?.sessionId)?.emit("frames-ready", data);
   });
 
   // Handle connection-ready event from React
   socket.on("connection-ready", (data) => {
     console.log("📊 Client reports WebRTC connection is ready");
-    if (pythonSocket) {
-      pythonSocket.emit("connection-ready", data);
-    }
+    sessionWorker(data?.sessionId)?.emit("connection-ready", data);
   });
 
   // Handle request-frames event from Python
@@ -124,8 +225,9 @@ io.on("connection", (socket) => {
   // Handle exercise type changes
   socket.on("exercise-change", (data) => {
     // console.log(`📊 Exercise type changed to: ${data.exerciseType}`);
-    if (pythonSocket) {
-      pythonSocket.emit("exercise-change", data);
+    const worker = sessionWorker(data?.sessionId);
+    if (worker) {
+      worker.emit("exercise-change", data);
       
       // Update client information
       const clientInfo = connectedClients.get(socket.id);
@@ -140,15 +242,173 @@ io.on("connection", (socket) => {
   
   // Handle exercise feedback from Python to React
   socket.on("exercise-feedback", (data) => {
-    // console.log("📊 Received exercise feedback from Python, broadcasting to clients...");
-    // Broadcast to all clients except the sender (Python)
-    socket.broadcast.emit("exercise-feedback", data);
+    // A worker serves many sessions, each trainee only gets their own
+    if (isWorker(socket)) {
+      toSessionClient("exercise-feedback", data);
+    }
+  });
+
+  // Handle admission control signals from Python to React
+  socket.on("webrtc-queued", (data) => {
+    if (!isWorker(socket)) return;
+    console.log("⏳ Python worker at capacity, offer queued");
+    toSessionClient("webrtc-queued", data);
+  });
+
+  socket.on("webrtc-rejected", (data) => {
+    if (!isWorker(socket)) return;
+    console.log("⛔ Python worker at capacity, offer rejected");
+    // The retry of a session turned away by a draining worker goes to another one
+    if (data?.reason === "draining" && data.sessionId) {
+      sessionWorkers.delete(data.sessionId);
+    }
+    toSessionClient("webrtc-rejected", data);
+  });
+
+  // Handle sender resolution requests from Python to React
+  socket.on("video-constraints", (data) => {
+    if (isWorker(socket)) {
+      toSessionClient("video-constraints", data);
+    }
+  });
+
+  // Exercise recognized by the Python worker in auto mode
+  socket.on("exercise-detected", (data) => {
+    if (isWorker(socket)) {
+      toSessionClient("exercise-detected", data);
+    }
+  });
+
+  // Handle per-rep analytics from Python to React
+  socket.on("rep-event", (data) => {
+    if (isWorker(socket)) {
+      toSessionClient("rep-event", data);
+    }
   });
   
+  // Admin requests to profile the Python worker at runtime
+  socket.on("profiler-start", (data) => {
+    if (!isAdmin(socket)) {
+      console.error(`❌ Socket ${socket.id} is not allowed to start the profiler`);
+      return;
+    }
+    console.log("🔬 Starting Python worker profiler");
+    if (data?.sessionId) {
+      sessionWorker(data.sessionId)?.emit("profiler-start", data);
+    } else {
+      toAllWorkers("profiler-start", data);
+    }
+  });
+
+  socket.on("profiler-stop", (data) => {
+    if (!isAdmin(socket)) {
+      console.error(`❌ Socket ${socket.id} is not allowed to stop the profiler`);
+      return;
+    }
+    console.log("🔬 Stopping Python worker profiler");
+    if (data?.sessionId) {
+      sessionWorker(data.sessionId)?.emit("profiler-stop", data);
+    } else {
+      toAllWorkers("profiler-stop", data);
+    }
+  });
+
+  // A worker being recycled finishes its sessions but takes no new ones
+  socket.on("worker-draining", () => {
+    const worker = pythonWorkers.get(workerIdOf(socket));
+    if (worker) {
+      console.log(`♻️ Python worker ${workerIdOf(socket)} is draining`);
+      worker.draining = true;
+    }
+  });
+
+  // Live session, task and pose graph counts of the Python workers
+  socket.on("session-stats", (data) => {
+    if (!socket.data.worker) return;
+    toAllWorkers("session-stats", data);
+  });
+
+  socket.on("worker-stats", (data) => {
+    if (!isWorker(socket)) return;
+    socket.to("monitors").emit("worker-stats", data);
+  });
+
+  // Finished sessions from the Python worker go straight into the daily rollups.
+  // Only workers may report them, and the userId is the one the relay put
+  // into the session's offer from the authenticated socket.
+  socket.on("session-summary", async (data) => {
+    if (!isWorker(socket)) {
+      return;
+    }
+    if (!mongoose.isValidObjectId(data?.userId) || !Array.isArray(data.exercises)) {
+      return;
+    }
+    // An auto-mode session reports every exercise it went through
+    for (const { exercise, repCount, duration, accuracy } of data.exercises) {
+      if (!exercise || !repCount) continue;
+      try {
+        await WorkoutRollup.addSession({
+          user: data.userId,
+          exercise,
+          count: repCount,
+          duration: duration / 60, // Seconds to minutes
+          accuracy,
+          date: new Date(data.startTime * 1000),
+          sessionId: data.sessionId
+        });
+      } catch (err) {
+        console.error("❌ Failed to record session summary:", err.message);
+      }
+    }
+  });
+
+  socket.on("profiler-result", (data) => {
+    if (!isWorker(socket)) return;
+    console.log(`🔬 Profile written to ${data.path} (${data.samples} samples)`);
+    io.to("admins").emit("profiler-result", data);
+  });
+
+  // Trainer dashboards get one coalesced stream for all their trainees
+  // Only an authenticated trainer subscribes, to their own trainees or to a
+  // group they head
+  socket.on("dashboard-subscribe", async (data) => {
+    const user = socket.data.user;
+    if (user?.type !== "trainer") {
+      console.error(`❌ Socket ${socket.id} is not a trainer, dashboard subscription refused`);
+      return;
+    }
+    let groupId;
+    if (data?.groupId) {
+      const group = mongoose.isValidObjectId(data.groupId)
+        ? await Group.findOne({ _id: data.groupId, head: user.id }).select("_id")
+        : null;
+      if (!group) {
+        console.error(`❌ Trainer ${user.id} does not head group ${data.groupId}`);
+        return;
+      }
+      groupId = group.id;
+    }
+    toAllWorkers("dashboard-subscribe", {
+      trainerId: groupId ? undefined : user.id,
+      groupId,
+      maxRate: data?.maxRate,
+      subscriberId: socket.id
+    });
+  });
+
+  socket.on("dashboard-unsubscribe", () => {
+    toAllWorkers("dashboard-unsubscribe", { subscriberId: socket.id });
+  });
+
+  socket.on("trainer-dashboard", (data) => {
+    if (!isWorker(socket)) return;
+    io.to(data.subscriberId).emit("trainer-dashboard", data);
+  });
+
   // Health check for clients
   socket.on("ping", () => {
     socket.emit("pong", { 
-      pythonConnected: pythonSocket !== null,
+      pythonConnected: hasWorkers(),
       timestamp: Date.now()
     });
   });
@@ -190,7 +450,7 @@ app.use(cookieParser());
 app.get('/ping', (_req, res) => {
   res.json({
     status: 'ok',
-    pythonConnected: pythonSocket !== null,
+    pythonConnected: hasWorkers(),
     clientsCount: connectedClients.size,
     timestamp: new Date().toISOString()
   });
@@ -199,7 +459,8 @@ app.get('/ping', (_req, res) => {
 // WebRTC status endpoint
 app.get('/api/webrtc/status', (_req, res) => {
   res.json({
-    pythonServerConnected: pythonSocket !== null,
+    pythonServerConnected: hasWorkers(),
+    pythonWorkers: pythonWorkers.size,
     connectedClients: connectedClients.size,
     websocketServerRunning: true
   });
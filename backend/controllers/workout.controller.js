@@ -3,6 +3,7 @@ import AppError from '../utils/appError.js';
 import mongoose from 'mongoose';
 import PushUp from "../models/pushup.mode.js";
 import User from "../models/trainee.model.js";
+import WorkoutRollup, { rollupDay } from "../models/workoutRollup.model.js";
 
 /**
  * @ACCEPT_TRAINER_REQUEST
@@ -11,7 +12,7 @@ import User from "../models/trainee.model.js";
  */
 
 export const postWorkoutRecord = asyncHandler(async (req, res, next) => {
-    const {exercise, count, startTime, stopTime} = req.body;
+    const {exercise, count, startTime, stopTime, sessionId} = req.body;
     const userId = req.user.id; // Extract trainee ID from authenticated request
 
       // Validate if userId exists
@@ -36,8 +37,11 @@ export const postWorkoutRecord = asyncHandler(async (req, res, next) => {
             name: exercise,
             count: count,
             duration: duration,
-            date: Date.now(),
-            user: user._id
+            // The rollup is keyed on the same timestamp, so the record and
+            // its rollup land on the same day
+            date: start,
+            user: user._id,
+            sessionId
           });
 
           try {
@@ -45,6 +49,23 @@ export const postWorkoutRecord = asyncHandler(async (req, res, next) => {
           } catch (err) {
             return next(new AppError("creating record failed, try again later", 500));
           }
+
+          // Keep the daily rollup current, a session the worker already
+          // reported is not counted again. The record is saved either way,
+          // records left without rolledUp are merged by the rollup rebuild
+          try {
+            await WorkoutRollup.addSession({
+              user: user._id,
+              exercise,
+              count,
+              duration,
+              date: start,
+              sessionId
+            });
+            await PushUp.updateOne({ _id: createRecord._id }, { rolledUp: true });
+          } catch (err) {
+            console.error(`❌ Rollup update failed for record ${createRecord._id}:`, err.message);
+          }
         
           // Return the course created
           res.status(201).json({ record: createRecord });
@@ -124,50 +145,27 @@ export const fetchWorkoutByDay = asyncHandler(async (req, res, next) => {
         const startDate = new Date();
         startDate.setDate(startDate.getDate() - daysCount);
 
-        // Aggregate workout records for the user within date range
-        const records = await PushUp.aggregate([
-            {
-                $match: {
-                    name: exercise,
-                    user: new mongoose.Types.ObjectId(trainee._id),
-                    date: {
-                        $gte: startDate,
-                        $lte: endDate
-                    }
-                }
-            },
-            {
-                $group: {
-                    _id: {
-                        $dateToString: { format: "%Y-%m-%d", date: "$date" }
-                    },
-                    // Store a reference date for this group (first occurrence)
-                    createdAt: { $first: "$date" },
-                    totalDuration: { $sum: "$duration" },
-                    totalCount: { $sum: "$count" },
-                    recordCount: { $sum: 1 }
-                }
-            },
-            {
-                $sort: { _id: 1 } // Sort by date ascending
-            },
-            {
-                $project: {
-                    _id: 1,
-                    createdAt: 1,
-                    totalDuration: 1,
-                    totalCount: 1,
-                    recordCount: 1,
-                    date: {
-                        $dateToString: {
-                            format: "%B %d, %Y",
-                            date: "$createdAt",
-                            timezone: "Asia/Kolkata"
-                        }
-                    }
-                }
-            }
-        ]).exec();
+        // Point lookups on the daily rollup, one document per day
+        const rollups = await WorkoutRollup.find({
+            user: trainee._id,
+            exercise,
+            day: { $gte: rollupDay(startDate), $lte: rollupDay(endDate) }
+        }).sort({ day: 1 }).lean().exec();
+
+        const records = rollups.map(rollup => ({
+            _id: rollup.day,
+            createdAt: rollup.date,
+            totalDuration: rollup.totalDuration,
+            totalCount: rollup.totalCount,
+            recordCount: rollup.recordCount,
+            avgAccuracy: rollup.accuracyCount ? rollup.accuracySum / rollup.accuracyCount : null,
+            date: new Date(rollup.date).toLocaleDateString('en-IN', {
+                year: 'numeric',
+                month: 'long',
+                day: 'numeric',
+                timeZone: 'Asia/Kolkata'
+            })
+        }));
         
         // If no records found
         if (!records || records.length === 0) {
@@ -213,6 +211,7 @@ function fillMissingDays(records, startDate, endDate) {
                 totalDuration: 0,
                 totalCount: 0,
                 recordCount: 0,
+                avgAccuracy: null,
                 date: currentDate.toLocaleDateString('en-IN', {
                     year: 'numeric',
                     month: 'long',
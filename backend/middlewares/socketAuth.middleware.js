@@ -0,0 +1,66 @@
+import jwt from "jsonwebtoken";
+import Trainee from "../models/trainee.model.js";
+import Trainer from "../models/trainer.model.js";
+import Group from "../models/group.model.js";
+
+// Users allowed to run admin socket commands (profiler), comma separated ids
+const ADMIN_USER_IDS = new Set(
+  (process.env.ADMIN_USER_IDS || "").split(",").map((id) => id.trim()).filter(Boolean)
+);
+
+if (!process.env.WORKER_TOKEN) {
+  console.warn("⚠️ WORKER_TOKEN is not set, no socket can register as a Python worker");
+}
+
+const cookieToken = (cookie = "") =>
+  cookie.split(";").map((part) => part.trim()).find((part) => part.startsWith("accessToken="))?.slice("accessToken=".length);
+
+const resolveUser = async (token) => {
+  const decodedToken = jwt.verify(token, process.env.ACCESS_TOKEN_SECRET);
+  const id = decodedToken?._id;
+
+  const trainee = await Trainee.findById(id).select("trainer");
+  if (trainee) {
+    const group = await Group.findOne({ members: trainee._id }).select("_id head");
+    return {
+      id: trainee.id,
+      type: "trainee",
+      trainerId: group?.head?.toString() || trainee.trainer?.[0]?.toString(),
+      groupId: group?.id,
+      admin: ADMIN_USER_IDS.has(trainee.id)
+    };
+  }
+
+  const trainer = await Trainer.findById(id).select("_id");
+  if (trainer) {
+    return { id: trainer.id, type: "trainer", admin: ADMIN_USER_IDS.has(trainer.id) };
+  }
+  return null;
+};
+
+/**
+ * Socket.IO handshake check. The identity of a socket is taken from its
+ * access token (handshake auth or the accessToken cookie) once, here, and
+ * kept in socket.data; event payloads are never trusted for it. Sockets
+ * without a valid token still connect, but have no user.
+ */
+const socketAuth = async (socket, next) => {
+  const { token, workerToken } = socket.handshake.auth || {};
+
+  // Python workers authenticate with a shared secret, without one configured
+  // nobody gets the worker role
+  socket.data.worker = Boolean(process.env.WORKER_TOKEN) && workerToken === process.env.WORKER_TOKEN;
+
+  const accessToken = token || cookieToken(socket.handshake.headers.cookie);
+  socket.data.user = null;
+  if (accessToken) {
+    try {
+      socket.data.user = await resolveUser(accessToken);
+    } catch (error) {
+      console.log(`🔒 Socket ${socket.id} presented an invalid access token: ${error.message}`);
+    }
+  }
+  next();
+};
+
+export default socketAuth;
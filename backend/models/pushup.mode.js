@@ -7,6 +7,8 @@ const pushUpSchema = new Schema(
     duration: { type: Number, required: true }, // e.g., "5 min"
     date: { type: Date, default: Date.now },
     user: { type: Schema.Types.ObjectId, ref: 'User', required: true },
+    sessionId: { type: String }, // Live session the record was saved from
+    rolledUp: { type: Boolean, default: false }, // Already counted in the daily rollups
   },
   { timestamps: true }
 );
@@ -0,0 +1,55 @@
+import { Schema, model } from 'mongoose';
+
+// One document per user, exercise and day, updated in place as sessions end
+const workoutRollupSchema = new Schema(
+  {
+    user: { type: Schema.Types.ObjectId, ref: 'User', required: true },
+    exercise: { type: String, required: true },
+    day: { type: String, required: true }, // YYYY-MM-DD (UTC), same keys as fillMissingDays
+    date: { type: Date, required: true }, // First session of the day
+    totalCount: { type: Number, default: 0 },
+    totalDuration: { type: Number, default: 0 }, // Minutes
+    recordCount: { type: Number, default: 0 },
+    accuracySum: { type: Number, default: 0 },
+    accuracyCount: { type: Number, default: 0 },
+    sessionIds: { type: [String], default: [] }, // Sessions already counted
+  },
+  { timestamps: true }
+);
+
+workoutRollupSchema.index({ user: 1, exercise: 1, day: 1 }, { unique: true });
+
+export const rollupDay = (date) => new Date(date).toISOString().split('T')[0];
+
+/**
+ * Add one finished session to its day. Sessions with an id are counted once,
+ * so the worker summary and the saved workout of the same session don't add up.
+ */
+workoutRollupSchema.statics.addSession = async function ({ user, exercise, count, duration, accuracy, date, sessionId }) {
+  const filter = { user, exercise, day: rollupDay(date) };
+  const update = {
+    $setOnInsert: { date: new Date(date) },
+    $inc: { totalCount: count, totalDuration: duration || 0, recordCount: 1 },
+  };
+  if (typeof accuracy === 'number') {
+    update.$inc.accuracySum = accuracy;
+    update.$inc.accuracyCount = 1;
+  }
+  if (sessionId) {
+    filter.sessionIds = { $ne: sessionId };
+    update.$push = { sessionIds: sessionId };
+  }
+
+  try {
+    return await this.findOneAndUpdate(filter, update, { upsert: true, new: true });
+  } catch (err) {
+    // The day exists but already holds this session: the upsert hit the unique index
+    if (err.code === 11000 && sessionId) {
+      return null;
+    }
+    throw err;
+  }
+};
+
+const WorkoutRollup = model('WorkoutRollup', workoutRollupSchema);
+export default WorkoutRollup;
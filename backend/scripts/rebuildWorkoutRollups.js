@@ -0,0 +1,81 @@
+import { config } from 'dotenv';
+config();
+import mongoose from 'mongoose';
+import connectToDB from '../configs/dbconnection.js';
+import PushUp from '../models/pushup.mode.js';
+import WorkoutRollup from '../models/workoutRollup.model.js';
+
+const BATCH_SIZE = 1000;
+
+// Merges the raw workout records that are not in the daily rollups yet:
+// everything written before the rollups were deployed, and records whose
+// rollup update failed. Days that already have a rollup get the missing
+// records added on top, and every merged record is marked rolledUp, so
+// running it again only picks up what is still missing.
+const rebuild = async () => {
+  await connectToDB();
+  const pending = { rolledUp: { $ne: true } };
+
+  // Records saved from a live session go through addSession, which skips
+  // sessions the worker already reported
+  let sessions = 0;
+  const sessionRecords = PushUp.find({ ...pending, sessionId: { $exists: true, $ne: null } }).cursor();
+  for await (const record of sessionRecords) {
+    await WorkoutRollup.addSession({
+      user: record.user,
+      exercise: record.name,
+      count: record.count,
+      duration: record.duration,
+      date: record.date,
+      sessionId: record.sessionId
+    });
+    await PushUp.updateOne({ _id: record._id }, { rolledUp: true });
+    sessions += 1;
+  }
+
+  // Older records have no session, they are added up per day
+  const days = await PushUp.aggregate([
+    { $match: { ...pending, sessionId: { $in: [null] } } },
+    {
+      $group: {
+        _id: {
+          user: "$user",
+          exercise: "$name",
+          day: { $dateToString: { format: "%Y-%m-%d", date: "$date" } }
+        },
+        date: { $min: "$date" },
+        totalCount: { $sum: "$count" },
+        totalDuration: { $sum: "$duration" },
+        recordCount: { $sum: 1 },
+        records: { $push: "$_id" }
+      }
+    }
+  ]).allowDiskUse(true).exec();
+
+  let merged = 0;
+  for (let i = 0; i < days.length; i += BATCH_SIZE) {
+    const batch = days.slice(i, i + BATCH_SIZE);
+    const operations = batch.map(({ _id, date, totalCount, totalDuration, recordCount }) => ({
+      updateOne: {
+        filter: { user: _id.user, exercise: _id.exercise, day: _id.day },
+        update: {
+          $min: { date },
+          $inc: { totalCount, totalDuration, recordCount }
+        },
+        upsert: true
+      }
+    }));
+    await WorkoutRollup.bulkWrite(operations, { ordered: false });
+    // A crash between these two writes counts the batch twice on the next run
+    await PushUp.updateMany({ _id: { $in: batch.flatMap((day) => day.records) } }, { rolledUp: true });
+    merged += batch.length;
+  }
+
+  console.log(`Rollups: merged ${merged} days of records and ${sessions} session records`);
+  await mongoose.disconnect();
+};
+
+rebuild().catch((err) => {
+  console.error(err);
+  process.exit(1);
+});
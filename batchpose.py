@@ -0,0 +1,319 @@
+"""
+Cross-session batched pose inference backend.
+
+Frames submitted by all sessions within a short window are stacked and run
+through an ONNX Runtime CPU model as one batch. The model is expected to be a
+BlazePose landmark network exported with a dynamic batch dimension: it takes
+a letterboxed RGB image and outputs 39x5 landmark values (x, y, z, visibility,
+presence in input pixels) plus a pose presence score. Results are returned as
+LandmarkFrame objects, the same type the MediaPipe path produces.
+
+The landmark model expects a person-sized crop, like MediaPipe's. There is
+no detector stage here: a session's first frame, and any frame after the
+pose was lost, runs on the whole letterboxed frame, and later frames run on
+a region of interest around the session's previous landmarks, which is
+MediaPipe's tracking path. A person who is small in the frame can therefore
+be missed until they come closer. Because of that the backend only starts
+for a model that passed the accuracy check against the MediaPipe path:
+
+    python batchpose.py --check clip.mp4
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from landmarks import LandmarkFrame, NUM_LANDMARKS
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+# Backend configuration
+POSE_MODEL_PATH = os.environ.get("POSE_ONNX_MODEL", "pose_landmark_full.onnx")
+BATCH_WINDOW = float(os.environ.get("POSE_BATCH_WINDOW_MS", "8")) / 1000
+MAX_BATCH = int(os.environ.get("POSE_MAX_BATCH", "16"))
+INTRA_OP_THREADS = int(os.environ.get("POSE_ONNX_THREADS", "0"))
+
+PRESENCE_THRESHOLD = 0.5
+
+# Region of interest from the previous landmarks: their bounding box grown by
+# ROI_SCALE, from the joints at least ROI_VISIBILITY visible
+ROI_SCALE = 1.25
+ROI_VISIBILITY = 0.5
+ROI_MIN_POINTS = 4
+
+# Accuracy check against the MediaPipe path: mean distance of the key joints
+# in normalized coordinates, written next to the model
+POSE_CHECK_PATH = os.environ.get("POSE_ONNX_CHECK", POSE_MODEL_PATH + ".check.json")
+MAX_CHECK_ERROR = float(os.environ.get("POSE_ONNX_MAX_ERROR", "0.03"))
+CHECK_FRAMES = 300
+
+
+def sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+class BatchedPoseBackend:
+    """Gathers frames from concurrent sessions and runs them as one batch"""
+
+    def __init__(self, model_path=POSE_MODEL_PATH, batch_window=BATCH_WINDOW, max_batch=MAX_BATCH):
+        if ort is None:
+            raise RuntimeError("onnxruntime is required for the batched pose backend")
+
+        options = ort.SessionOptions()
+        if INTRA_OP_THREADS:
+            options.intra_op_num_threads = INTRA_OP_THREADS
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.channels_first = model_input.shape[1] == 3
+        if self.channels_first:
+            self.input_height, self.input_width = model_input.shape[2], model_input.shape[3]
+        else:
+            self.input_height, self.input_width = model_input.shape[1], model_input.shape[2]
+
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.pending = []
+        self.flush_handle = None
+        self.rois = {}  # session_id -> (x, y, width, height) in frame pixels
+
+        # Throughput counters
+        self.batches = 0
+        self.frames = 0
+        self.inference_time = 0
+
+    def _roi(self, coords, frame_w, frame_h):
+        """Square crop around a pose in frame pixels, or None when too little of it is visible"""
+        visible = coords[coords[:, 3] >= ROI_VISIBILITY]
+        if len(visible) < ROI_MIN_POINTS:
+            return None
+        x_min, y_min = visible[:, 0].min() * frame_w, visible[:, 1].min() * frame_h
+        x_max, y_max = visible[:, 0].max() * frame_w, visible[:, 1].max() * frame_h
+        side = max(x_max - x_min, y_max - y_min) * ROI_SCALE
+        center_x, center_y = (x_min + x_max) / 2, (y_min + y_max) / 2
+
+        # Clipped to the frame, the letterbox keeps a clipped crop undistorted
+        x0, y0 = max(0, int(center_x - side / 2)), max(0, int(center_y - side / 2))
+        x1, y1 = min(frame_w, int(center_x + side / 2)), min(frame_h, int(center_y + side / 2))
+        if x1 - x0 < 2 or y1 - y0 < 2:
+            return None
+        return x0, y0, x1 - x0, y1 - y0
+
+    def _preprocess(self, img_rgb, roi=None):
+        """Letterbox an RGB frame, or its region of interest, into the model input.
+        Returns the input and the mapping back to normalized frame coordinates."""
+        frame_h, frame_w = img_rgb.shape[:2]
+        crop_x, crop_y, w, h = roi or (0, 0, frame_w, frame_h)
+        crop = img_rgb[crop_y:crop_y + h, crop_x:crop_x + w]
+
+        scale = min(self.input_width / w, self.input_height / h)
+        new_w, new_h = max(1, int(w * scale)), max(1, int(h * scale))
+        pad_x = (self.input_width - new_w) // 2
+        pad_y = (self.input_height - new_h) // 2
+
+        canvas = np.zeros((self.input_height, self.input_width, 3), dtype=np.float32)
+        resized = cv2.resize(crop, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+        canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = resized * (1.0 / 255.0)
+
+        if self.channels_first:
+            canvas = canvas.transpose(2, 0, 1)
+
+        return canvas, (pad_x, pad_y, new_w, new_h, crop_x, crop_y, w, h, frame_w, frame_h)
+
+    def _decode(self, raw, presence, mapping):
+        """Convert one row of model output into a LandmarkFrame"""
+        if sigmoid(float(presence)) < PRESENCE_THRESHOLD:
+            return None
+
+        pad_x, pad_y, new_w, new_h, crop_x, crop_y, crop_w, crop_h, frame_w, frame_h = mapping
+        values = raw.reshape(-1, 5)[:NUM_LANDMARKS]
+
+        # Undo the letterbox and the crop so coordinates are normalized to the frame
+        coords = np.empty((NUM_LANDMARKS, 4), dtype=np.float32)
+        coords[:, 0] = ((values[:, 0] - pad_x) / new_w * crop_w + crop_x) / frame_w
+        coords[:, 1] = ((values[:, 1] - pad_y) / new_h * crop_h + crop_y) / frame_h
+        coords[:, 2] = values[:, 2] / new_w * crop_w / frame_w
+        coords[:, 3] = sigmoid(values[:, 3])
+        return LandmarkFrame(coords, time.time())
+
+    def _run_batch(self, inputs):
+        """Runs in an executor thread, onnxruntime releases the GIL"""
+        start = time.perf_counter()
+        outputs = self.session.run(None, {self.input_name: np.stack(inputs)})
+        self.inference_time += time.perf_counter() - start
+        # Landmarks first, pose presence score second
+        return outputs[0].reshape(len(inputs), -1), outputs[1].reshape(len(inputs), -1)[:, 0]
+
+    async def detect(self, img_rgb, session_id=None):
+        """Queue a frame for the next batch and wait for its landmarks. With a
+        session id the crop follows that session's previous landmarks."""
+        loop = asyncio.get_running_loop()
+        model_input, mapping = self._preprocess(img_rgb, self.rois.get(session_id))
+        future = loop.create_future()
+        self.pending.append((model_input, mapping, future))
+
+        if len(self.pending) >= self.max_batch:
+            self._flush()
+        elif self.flush_handle is None:
+            self.flush_handle = loop.call_later(self.batch_window, self._flush)
+
+        landmarks = await future
+        if session_id is not None:
+            # Lost poses fall back to the whole frame
+            roi = self._roi(landmarks.coords, *mapping[-2:]) if landmarks else None
+            if roi:
+                self.rois[session_id] = roi
+            else:
+                self.rois.pop(session_id, None)
+        return landmarks
+
+    def forget(self, session_id):
+        """Drop the region of interest of an ended session"""
+        self.rois.pop(session_id, None)
+
+    def _flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+        batch, self.pending = self.pending, []
+        if batch:
+            asyncio.ensure_future(self._infer(batch))
+
+    async def _infer(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            landmarks, presence = await loop.run_in_executor(
+                None, self._run_batch, [item[0] for item in batch])
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.frames += len(batch)
+        for i, (_, mapping, future) in enumerate(batch):
+            if not future.done():
+                future.set_result(self._decode(landmarks[i], presence[i], mapping))
+
+    def stats(self):
+        """Average batch size and per-frame inference cost so far"""
+        return {
+            "batches": self.batches,
+            "frames": self.frames,
+            "avgBatchSize": self.frames / self.batches if self.batches else 0,
+            "msPerFrame": 1000 * self.inference_time / self.frames if self.frames else 0
+        }
+
+
+def model_digest(model_path=POSE_MODEL_PATH):
+    """SHA-256 of the model file, the accuracy check is tied to it"""
+    digest = hashlib.sha256()
+    with open(model_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def checked(model_path=POSE_MODEL_PATH, check_path=POSE_CHECK_PATH):
+    """Whether this model file passed the accuracy check"""
+    try:
+        with open(check_path) as f:
+            check = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return check.get("passed") is True and check.get("model") == model_digest(model_path)
+
+
+_backend = None
+
+
+def get_pose_backend():
+    """Shared backend for all sessions in this worker"""
+    global _backend
+    if _backend is None:
+        if not checked():
+            raise RuntimeError(f"{POSE_MODEL_PATH} has not passed the accuracy check against MediaPipe, "
+                               f"run: python batchpose.py --check <video>")
+        _backend = BatchedPoseBackend()
+    return _backend
+
+
+async def _compare(video_path, frames):
+    """Mean key joint distance between this backend and MediaPipe on a video"""
+    import mediapipe as mp
+    from tracking import KEY_JOINTS
+
+    backend = BatchedPoseBackend(batch_window=0)
+    pose = mp.solutions.pose.Pose(static_image_mode=False, model_complexity=1,
+                                  min_detection_confidence=0.5, min_tracking_confidence=0.5)
+    capture = cv2.VideoCapture(video_path)
+    errors = []
+    both = either = 0
+    try:
+        while len(errors) < frames:
+            ok, bgr = capture.read()
+            if not ok:
+                break
+            rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+            results = pose.process(rgb)
+            reference = results.pose_landmarks and LandmarkFrame.from_mediapipe(results.pose_landmarks.landmark)
+            landmarks = await backend.detect(rgb, "check")
+            if reference or landmarks:
+                either += 1
+            if not (reference and landmarks):
+                # A pose only one of them found counts as fully wrong
+                if reference or landmarks:
+                    errors.append(1.0)
+                continue
+            both += 1
+            distance = np.linalg.norm(landmarks.coords[KEY_JOINTS, :2] - reference.coords[KEY_JOINTS, :2], axis=1)
+            errors.append(float(distance.mean()))
+    finally:
+        capture.release()
+        pose.close()
+    return {
+        "frames": either,
+        "bothDetected": both,
+        "meanError": float(np.mean(errors)) if errors else None
+    }
+
+
+def run_check(video_path, frames=CHECK_FRAMES, max_error=MAX_CHECK_ERROR):
+    """Compare the model with MediaPipe on a video and record the result"""
+    result = asyncio.run(_compare(video_path, frames))
+    result.update(
+        model=model_digest(),
+        modelPath=POSE_MODEL_PATH,
+        video=video_path,
+        maxError=max_error,
+        checkedAt=time.time(),
+        passed=result["meanError"] is not None and result["meanError"] <= max_error
+    )
+    with open(POSE_CHECK_PATH, "w") as f:
+        json.dump(result, f, indent=2)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the ONNX pose model against the MediaPipe path")
+    parser.add_argument("--check", metavar="VIDEO", required=True, help="Video with a person exercising")
+    parser.add_argument("--frames", type=int, default=CHECK_FRAMES, help="Frames to compare")
+    parser.add_argument("--max-error", type=float, default=MAX_CHECK_ERROR,
+                        help="Largest mean key joint distance, normalized coordinates")
+    args = parser.parse_args()
+
+    result = run_check(args.check, args.frames, args.max_error)
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if result["passed"] else 1)
@@ -0,0 +1,303 @@
+"""
+Analyzer microbenchmarks on synthetic landmark streams.
+
+Generates LandmarkFrame trajectories for every exercise from a joint angle
+profile (rep duration, hold at the turning points, sampling rate, landmark
+noise and occluded frames) and feeds them straight into the processors'
+analyze_exercise, so the analysis layer is measured without MediaPipe or
+video. For every case it reports time per call, peak bytes allocated per
+call (tracemalloc) and whether the rep count matches the synthesized reps.
+
+Results can be saved as a baseline and later runs compared against it:
+
+    python benchmark.py --save-baseline benchmark_baseline.json
+    python benchmark.py --baseline benchmark_baseline.json
+
+A comparison fails on a rep count mismatch, or when a case got slower or
+allocates more than the allowed tolerance. Every run also replays the same
+movement at several analyzed frame rates, the rep counts must not change,
+and checks that auto mode recognizes the exercise of every case.
+"""
+import argparse
+import json
+import math
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from landmarks import (
+    LandmarkFrame, NUM_LANDMARKS, NOSE, LEFT_SHOULDER, LEFT_ELBOW, LEFT_WRIST,
+    LEFT_HIP, LEFT_KNEE, LEFT_ANKLE
+)
+from kinematics import MIRROR
+from exercises import PROCESSORS
+from recognition import CANDIDATES, ExerciseRecognizer
+
+SEGMENT = 0.12  # Upper arm and forearm length in normalized coordinates
+VISIBLE = 0.99
+OCCLUDED = 0.1
+
+# Driving joint angle range per exercise: (angle at rest, angle at the turn)
+ANGLE_RANGES = {
+    "pushup": (175.0, 60.0),  # elbow
+    "pullup": (175.0, 40.0),  # elbow
+    "bicepcurl": (170.0, 40.0),  # elbow
+    "crunch": (130.0, 30.0),  # shoulder-hip-knee
+}
+
+# Shortest pause at rest per exercise, the analyzers only count a rep after
+# a hold there (a dead hang of pullup.py's hold_seconds). Longer rest holds
+# lengthen the rep.
+MIN_REST_SECONDS = {
+    "pullup": 1.0,
+}
+
+
+def _arm_between(wrist, direction, angle):
+    """Shoulder and elbow for an elbow angle with the wrist fixed and the
+    shoulder straight above (direction -1) or below (+1) it"""
+    half = math.radians(angle) / 2
+    gap = 2 * SEGMENT * math.sin(half)
+    shoulder = (wrist[0], wrist[1] + direction * gap)
+    elbow = (wrist[0] + SEGMENT * math.cos(half), (wrist[1] + shoulder[1]) / 2)
+    return shoulder, elbow
+
+
+def pose_points(exercise, angle):
+    """Left-side landmark positions of an exercise at a driving angle"""
+    if exercise == "pushup":
+        wrist = (0.3, 0.8)
+        shoulder, elbow = _arm_between(wrist, -1, angle)
+        ankle = (0.9, 0.8)
+        hip = (shoulder[0] + 0.5 * (ankle[0] - shoulder[0]), shoulder[1] + 0.5 * (ankle[1] - shoulder[1]))
+        knee = (shoulder[0] + 0.75 * (ankle[0] - shoulder[0]), shoulder[1] + 0.75 * (ankle[1] - shoulder[1]))
+        nose = (shoulder[0] - 0.08, shoulder[1])
+    elif exercise == "pullup":
+        wrist = (0.5, 0.15)
+        shoulder, elbow = _arm_between(wrist, 1, angle)
+        hip = (shoulder[0], shoulder[1] + 0.25)
+        knee = (shoulder[0], shoulder[1] + 0.45)
+        ankle = (shoulder[0], shoulder[1] + 0.65)
+        nose = (shoulder[0], shoulder[1] - 0.08)
+    elif exercise == "bicepcurl":
+        shoulder = (0.5, 0.3)
+        elbow = (0.5, 0.3 + 1.25 * SEGMENT)
+        radians = math.radians(angle)
+        wrist = (elbow[0] + SEGMENT * math.sin(radians), elbow[1] - SEGMENT * math.cos(radians))
+        hip, knee, ankle = (0.5, 0.7), (0.5, 0.85), (0.5, 1.0)
+        nose = (0.5, 0.22)
+    else:
+        # Crunch: hip, bent knee and feet fixed, the torso rotates about the hip
+        hip, knee, ankle = (0.5, 0.8), (0.6, 0.627), (0.75, 0.8)
+        direction = math.radians(60 + angle)
+        shoulder = (hip[0] + 0.25 * math.cos(direction), hip[1] - 0.25 * math.sin(direction))
+        nose = (hip[0] + 0.33 * math.cos(direction), hip[1] - 0.33 * math.sin(direction))
+        wrist = (nose[0] + 0.03, nose[1])
+        elbow = ((shoulder[0] + wrist[0]) / 2 + 0.05, (shoulder[1] + wrist[1]) / 2)
+
+    return {
+        NOSE: nose, LEFT_SHOULDER: shoulder, LEFT_ELBOW: elbow, LEFT_WRIST: wrist,
+        LEFT_HIP: hip, LEFT_KNEE: knee, LEFT_ANKLE: ankle
+    }
+
+
+def angle_profile(rest, turn, reps, rep_seconds, hold_seconds, fps, lead_seconds=0.5, rest_seconds=None):
+    """Timestamps and driving angles: rest, move to the turn, hold, move back, hold"""
+    move = max(rep_seconds - 2 * hold_seconds, 0.1) / 2
+    # A longer hold at rest is added on top of the rep, and the set starts
+    # with one as well
+    if rest_seconds is not None and rest_seconds > hold_seconds:
+        rep_seconds += rest_seconds - hold_seconds
+        lead_seconds = max(lead_seconds, rest_seconds)
+    duration = 2 * lead_seconds + reps * rep_seconds
+    times = np.arange(0, duration, 1.0 / fps)
+
+    phase = np.clip(times - lead_seconds, 0, reps * rep_seconds) % rep_seconds
+    # Within a rep: move [0, move), hold at the turn, move back, hold at rest
+    progress = np.where(
+        phase < move, phase / move,
+        np.where(phase < move + hold_seconds, 1.0,
+                 np.where(phase < 2 * move + hold_seconds, 1 - (phase - move - hold_seconds) / move, 0.0)))
+    # Past the last rep the profile stays at rest
+    progress[times >= lead_seconds + reps * rep_seconds] = 0.0
+    eased = (1 - np.cos(np.pi * progress)) / 2
+    return times, rest + (turn - rest) * eased
+
+
+def synthesize(exercise, reps=10, rep_seconds=2.0, hold_seconds=0.3, fps=30,
+               noise=0.0, occlusion=0.0, seed=0):
+    """LandmarkFrames of a synthetic set of reps"""
+    rng = np.random.default_rng(seed)
+    rest, turn = ANGLE_RANGES[exercise]
+    times, angles = angle_profile(rest, turn, reps, rep_seconds, hold_seconds, fps,
+                                  rest_seconds=MIN_REST_SECONDS.get(exercise))
+
+    frames = []
+    for timestamp, angle in zip(times, angles):
+        coords = np.zeros((NUM_LANDMARKS, 4), dtype=np.float32)
+        coords[:, :2] = 0.5
+        coords[:, 3] = VISIBLE
+        for index, (x, y) in pose_points(exercise, float(angle)).items():
+            # Both sides overlap, as seen from the side
+            coords[index, :2] = coords[MIRROR[index], :2] = (x, y)
+        if noise:
+            coords[:, :2] += rng.normal(0, noise, (NUM_LANDMARKS, 2))
+        if occlusion and rng.random() < occlusion:
+            coords[11:, 3] = OCCLUDED
+        frames.append(LandmarkFrame(coords, float(timestamp)))
+    return frames
+
+
+# name -> synthesize() arguments, every case is run for every exercise
+CASES = {
+    "clean": {},
+    "noisy": {"noise": 0.004},
+    "occluded": {"occlusion": 0.1},
+    "fast": {"rep_seconds": 1.2, "hold_seconds": 0.2},
+}
+
+
+# Analyzed frame rates the same movement is replayed at
+INVARIANCE_RATES = (30, 15, 6, 3)
+
+
+def count_reps(exercise, frames):
+    processor = PROCESSORS[exercise]()
+    result = None
+    for landmarks in frames:
+        result = processor.analyze_exercise(landmarks)
+    return result["repCount"]
+
+
+def rate_invariance(exercises, reps, seed, rates=INVARIANCE_RATES):
+    """Rep counts of one movement sampled at each rate, as failure messages"""
+    failures = []
+    for exercise in exercises:
+        for case in ("clean", "noisy"):
+            counts = {fps: count_reps(exercise, synthesize(exercise, reps=reps, fps=fps, seed=seed, **CASES[case]))
+                      for fps in rates}
+            line = " ".join(f"{fps}fps={count}" for fps, count in counts.items())
+            print(f"{exercise + '/' + case:22s} {line}")
+            if len(set(counts.values())) != 1 or counts[rates[0]] != reps:
+                failures.append(f"{exercise}/{case}: rep count depends on the frame rate ({line})")
+    return failures
+
+
+def recognition(exercises, reps, seed):
+    """Exercise recognized in auto mode from every case, as failure messages"""
+    failures = []
+    for exercise in exercises:
+        for case, options in CASES.items():
+            recognizer = ExerciseRecognizer()
+            for landmarks in synthesize(exercise, reps=reps, seed=seed, **options):
+                recognizer.update(landmarks)
+            scores = sorted(recognizer.last_scores.items(), key=lambda item: item[1], reverse=True)
+            line = " ".join(f"{name}={score:.3f}" for name, score in scores)
+            print(f"{exercise + '/' + case:22s} recognized {recognizer.current} ({line})")
+            if recognizer.current != exercise:
+                failures.append(f"{exercise}/{case}: recognized as {recognizer.current} ({line})")
+    return failures
+
+
+def measure(exercise, frames, repeat):
+    """Seconds per call, peak bytes per call and the rep count of one stream"""
+    processor = PROCESSORS[exercise]()
+
+    # Timing, best of several passes over the stream
+    best = float("inf")
+    for _ in range(repeat):
+        processor.reset_state()
+        start = time.perf_counter()
+        for landmarks in frames:
+            processor.analyze_exercise(landmarks)
+        best = min(best, time.perf_counter() - start)
+
+    # Allocations of a separate, traced pass, which also yields the rep count
+    processor.reset_state()
+    peaks = 0
+    tracemalloc.start()
+    for landmarks in frames:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        result = processor.analyze_exercise(landmarks)
+        peaks += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    processor.close()
+
+    return best / len(frames), peaks / len(frames), result["repCount"]
+
+
+def run(args):
+    results = {}
+    for exercise in args.exercises:
+        for case, options in CASES.items():
+            options = dict(options, reps=args.reps, fps=args.fps, seed=args.seed)
+            frames = synthesize(exercise, **options)
+            seconds, peak_bytes, reps = measure(exercise, frames, args.repeat)
+            name = f"{exercise}/{case}"
+            results[name] = {
+                "frames": len(frames),
+                "usPerCall": seconds * 1e6,
+                "peakBytesPerCall": peak_bytes,
+                "reps": reps,
+                "expectedReps": args.reps
+            }
+            print(f"{name:22s} {seconds * 1e6:8.1f} us/call {peak_bytes:9.0f} B/call "
+                  f"reps {reps}/{args.reps}{'' if reps == args.reps else '  MISMATCH'}")
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Regressions of results against a baseline, as messages"""
+    failures = []
+    for name, result in results.items():
+        if result["reps"] != result["expectedReps"]:
+            failures.append(f"{name}: counted {result['reps']} reps, expected {result['expectedReps']}")
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for metric in ("usPerCall", "peakBytesPerCall"):
+            if base[metric] and result[metric] > base[metric] * (1 + tolerance):
+                failures.append(f"{name}: {metric} {result[metric]:.1f} vs baseline {base[metric]:.1f}")
+    return failures
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the exercise analyzers on synthetic landmarks")
+    parser.add_argument("--exercises", nargs="+", default=list(PROCESSORS), choices=list(PROCESSORS))
+    parser.add_argument("--reps", type=int, default=10, help="Reps synthesized per stream")
+    parser.add_argument("--fps", type=float, default=30, help="Analyzed frames per second")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed passes per stream, the best is kept")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for noise and occlusion")
+    parser.add_argument("--baseline", help="Baseline JSON to compare against")
+    parser.add_argument("--save-baseline", help="Write the results to this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown/allocation growth")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = run(args)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {args.save_baseline}")
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    failures = compare(results, baseline, args.tolerance)
+    failures += rate_invariance(args.exercises, args.reps, args.seed)
+    failures += recognition([exercise for exercise in args.exercises if exercise in CANDIDATES],
+                            args.reps, args.seed)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,10 @@
-import cv2
+import time
 import mediapipe as mp
-import numpy as np
+from landmarks import LandmarkFrame, LEFT_ELBOW, LEFT_HIP, LEFT_SHOULDER, LEFT_WRIST
+from kinematics import BilateralKinematics, FrameClock, point_angle
 
 # Initialize MediaPipe Pose
 mp_pose = mp.solutions.pose
-mp_drawing = mp.solutions.drawing_utils
 
 # Define ideal angles and thresholds
 IDEAL_ANGLES = {
@@ -16,44 +16,57 @@ IDEAL_ANGLES = {
     }
 }
 
+# MediaPipe Pose confidence, the inference pool builds this session's graph with it too
+POSE_OPTIONS = dict(min_detection_confidence=0.9, min_tracking_confidence=0.9)
+
 class BicepCurlExerciseProcessor:
+    pose_options = POSE_OPTIONS
+    
     def __init__(self):
-        self.pose = mp_pose.Pose(min_detection_confidence=0.9, min_tracking_confidence=0.9, static_image_mode=False)
+        self._pose = None  # MediaPipe graph, created on first inference
         self.rep_count = 0
         self.curl_down = False
-        self.hold_frames = 0
-        self.frame_hold_threshold = 0
+        self.hold_time = 0
+        self.hold_seconds = 0  # Time curled before a rep counts
         self.accuracy_per_curl = 0
         self.accuracy_up = 0
         self.accuracy_down = 0
         self.exercise_type = "bicepcurl"
         self.last_position = None
+        self.clock = FrameClock()
         
         # Constants for curl detection
         self.UP_THRESHOLD = 80
         self.DOWN_THRESHOLD = 140
+        
+        # Angles for both arms in one pass, the more visible side is used
+        self.kinematics = BilateralKinematics({
+            "elbow_angle": (LEFT_SHOULDER, LEFT_ELBOW, LEFT_WRIST),
+            "shoulder_angle": (LEFT_HIP, LEFT_SHOULDER, LEFT_ELBOW)
+        })
+    
+    @property
+    def pose(self):
+        """MediaPipe graph, analysis-only instances never create one"""
+        if self._pose is None:
+            self._pose = mp_pose.Pose(static_image_mode=False, **self.pose_options)
+        return self._pose
+    
+    def close(self):
+        """Close the MediaPipe graph if one was created"""
+        if self._pose is not None:
+            self._pose.close()
+            self._pose = None
     
     def reset_state(self):
         """Reset exercise state"""
         self.rep_count = 0
         self.curl_down = False
-        self.hold_frames = 0
+        self.hold_time = 0
         self.accuracy_per_curl = 0
         self.last_position = None
-    
-    def calculate_angle(self, a, b, c):
-        """Calculate angle between three points"""
-        a = np.array(a)
-        b = np.array(b)
-        c = np.array(c)
-
-        ba = a - b
-        bc = c - b
-
-        cosine_angle = np.dot(ba, bc) / (np.linalg.norm(ba) * np.linalg.norm(bc))
-        angle = np.arccos(np.clip(cosine_angle, -1.0, 1.0))
-
-        return np.degrees(angle)
+        self.clock.reset()
+        self.kinematics.reset()
     
     def posture_accuracy(self, elbow_angle, shoulder_angle, back_angle):
         """Calculate posture accuracy based on ideal angles"""
@@ -84,23 +97,12 @@ class BicepCurlExerciseProcessor:
         overall_accuracy = (elbow_accuracy * 0.2) + (shoulder_accuracy * 0.4) + (back_accuracy * 0.4)
         return overall_accuracy
     
-    def process_frame(self, img):
-        """Process video frame using MediaPipe Pose"""
-        # Convert to RGB for MediaPipe
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        
-        # Process the image
+    def detect_landmarks(self, img_rgb):
+        """Run MediaPipe Pose on an RGB frame already scaled to inference size"""
         results = self.pose.process(img_rgb)
-        
-        # Convert back to BGR
-        processed_img = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2BGR)
-        
-        landmarks = None
-        if results.pose_landmarks:
-            landmarks = results.pose_landmarks.landmark
-            mp_drawing.draw_landmarks(processed_img, results.pose_landmarks, mp_pose.POSE_CONNECTIONS)
-        
-        return processed_img, landmarks
+        if not results.pose_landmarks:
+            return None
+        return LandmarkFrame.from_mediapipe(results.pose_landmarks.landmark, time.time())
     
     def analyze_exercise(self, landmarks):
         """Analyze exercise form and count reps"""
@@ -113,45 +115,51 @@ class BicepCurlExerciseProcessor:
                 "angles": {}
             }
         
-        # Extract key landmarks for bicep curls
-        shoulder = [landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x,
-                    landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y]
-        elbow = [landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].x,
-                landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].y]
-        wrist = [landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].x,
-                landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].y]
-        hip = [landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].x,
-                landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].y]
-
-        # Calculate angles
-        elbow_angle = self.calculate_angle(shoulder, elbow, wrist)
-        shoulder_angle = self.calculate_angle(hip, shoulder, elbow)
+        # Time since the previous analyzed frame
+        frame_time = self.clock.tick(landmarks.timestamp)
+        
+        # Calculate angles, skip the frame when the arm is occluded
+        kinematics = self.kinematics.compute(landmarks)
+        if kinematics is None:
+            return {
+                "form": "Joints not visible",
+                "accuracy": self.accuracy_per_curl,
+                "position": self.last_position,
+                "repCount": self.rep_count,
+                "angles": {}
+            }
+        
+        elbow_angle = kinematics["angles"]["elbow_angle"]
+        shoulder_angle = kinematics["angles"]["shoulder_angle"]
+        
         # Create a vertical reference slightly above the shoulder to calculate back angle
-        back_angle = self.calculate_angle(hip, shoulder, [shoulder[0], shoulder[1] - 0.1])
+        shoulder = self.kinematics.point(landmarks, LEFT_SHOULDER)
+        hip = self.kinematics.point(landmarks, LEFT_HIP)
+        back_angle = point_angle(hip, shoulder, [shoulder[0], shoulder[1] - 0.1])
         
         # Curl logic
         if elbow_angle > self.DOWN_THRESHOLD and not self.curl_down:
             self.curl_down = True
-            self.hold_frames = 0
+            self.hold_time = 0
             
             # TODO inspect later
             self.last_position = "down"
             self.accuracy_down = self.posture_accuracy(elbow_angle, shoulder_angle, back_angle)
 
         if not self.curl_down and elbow_angle <= self.UP_THRESHOLD:
-            self.hold_frames += 1
+            self.hold_time += frame_time
             
             self.last_position = "up"
 
-        if self.curl_down and elbow_angle > self.DOWN_THRESHOLD and self.hold_frames >= self.frame_hold_threshold:
+        if self.curl_down and elbow_angle > self.DOWN_THRESHOLD and self.hold_time >= self.hold_seconds:
             self.accuracy_down = self.posture_accuracy(elbow_angle, shoulder_angle, back_angle)
             self.curl_down = False
 
-        if not self.curl_down and elbow_angle <= self.UP_THRESHOLD and self.hold_frames >= self.frame_hold_threshold:
+        if not self.curl_down and elbow_angle <= self.UP_THRESHOLD and self.hold_time >= self.hold_seconds:
             self.accuracy_up = self.posture_accuracy(elbow_angle, shoulder_angle, back_angle)
             self.accuracy_per_curl = (self.accuracy_up + self.accuracy_down) / 2 
             self.rep_count += 1
-            self.hold_frames = 0
+            self.hold_time = 0
             self.curl_down = True
             
         # Generate form feedback based on accuracy
@@ -173,5 +181,7 @@ class BicepCurlExerciseProcessor:
                 "elbow_angle": elbow_angle,
                 "shoulder_angle": shoulder_angle,
                 "back_angle": back_angle
-            }
+            },
+            "side": kinematics["side"],
+            "symmetry": kinematics["symmetry"]
         }
\ No newline at end of file
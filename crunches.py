@@ -1,11 +1,11 @@
-import cv2
-import numpy as np
+import time
 import mediapipe as mp
+from landmarks import LandmarkFrame, LEFT_ANKLE, LEFT_HIP, LEFT_KNEE, LEFT_SHOULDER, LEFT_WRIST, NOSE
+from kinematics import BilateralKinematics, FrameClock
 
 
 # Initialize MediaPipe Pose
 mp_pose = mp.solutions.pose
-mp_draw = mp.solutions.drawing_utils
 
 # Define ideal angles and thresholds for exercises
 IDEAL_ANGLES = {
@@ -19,11 +19,18 @@ IDEAL_ANGLES = {
 
 # Acceptable deviation thresholds
 THRESHOLD = 20
-FRAME_HOLD_THRESHOLD = 3
+# Time lying flat before a crunch can count. The old 3-frame hold, at the
+# live analysis rate (every BASE_SAMPLE_INTERVAL = 5th frame of 30 fps)
+HOLD_SECONDS = 0.5
+
+# MediaPipe Pose confidence, the inference pool builds this session's graph with it too
+POSE_OPTIONS = dict(min_detection_confidence=0.8, min_tracking_confidence=0.8)
 
 class CrunchExerciseProcessor:
+    pose_options = POSE_OPTIONS
+    
     def __init__(self):
-        self.pose = mp_pose.Pose(min_detection_confidence=0.8, min_tracking_confidence=0.8, static_image_mode=False)
+        self._pose = None  # MediaPipe graph, created on first inference
         self.rep_count = 0
         self.pose_history = []
         self.exercise_type = "crunch"
@@ -31,7 +38,7 @@ class CrunchExerciseProcessor:
         
         # Specific for crunch tracking
         self.crunch_up = False
-        self.hold_frames = 0
+        self.hold_time = 0
         self.knee_angle_up = 0
         self.knee_angle_down = 0
         self.hand_distance_up = 0
@@ -39,6 +46,32 @@ class CrunchExerciseProcessor:
         self.back_dist_up = 0
         self.back_dist_down = 0
         self.accuracy_per_crunch = 0
+        self.clock = FrameClock()
+        
+        # Metrics for both sides in one pass, the more visible side is used
+        self.kinematics = BilateralKinematics(
+            {
+                "knee_angle": (LEFT_ANKLE, LEFT_KNEE, LEFT_HIP),
+                "back_angle": (LEFT_SHOULDER, LEFT_HIP, LEFT_KNEE)
+            },
+            {
+                "hand_distance": (LEFT_WRIST, NOSE),  # Normalized hand-to-head distance
+                "back_dist": (LEFT_SHOULDER, LEFT_HIP)  # Distance between shoulder and hip
+            }
+        )
+    
+    @property
+    def pose(self):
+        """MediaPipe graph, analysis-only instances never create one"""
+        if self._pose is None:
+            self._pose = mp_pose.Pose(static_image_mode=False, **self.pose_options)
+        return self._pose
+    
+    def close(self):
+        """Close the MediaPipe graph if one was created"""
+        if self._pose is not None:
+            self._pose.close()
+            self._pose = None
     
     def reset_state(self):
         """Reset exercise state"""
@@ -46,7 +79,7 @@ class CrunchExerciseProcessor:
         self.pose_history = []
         self.last_position = None
         self.crunch_up = False
-        self.hold_frames = 0
+        self.hold_time = 0
         self.knee_angle_up = 0
         self.knee_angle_down = 0
         self.hand_distance_up = 0
@@ -54,38 +87,15 @@ class CrunchExerciseProcessor:
         self.back_dist_up = 0
         self.back_dist_down = 0
         self.accuracy_per_crunch = 0
+        self.clock.reset()
+        self.kinematics.reset()
     
-    def calculate_angle(self, a, b, c):
-        """Calculate angle between three points"""
-        a = np.array(a)  # Point A
-        b = np.array(b)  # Point B
-        c = np.array(c)  # Point C
-
-        radians = np.arctan2(c[1] - b[1], c[0] - b[0]) - np.arctan2(a[1] - b[1], a[0] - b[0])
-        angle = np.abs(radians * 180.0 / np.pi)
-
-        if angle > 180.0:
-            angle = 360 - angle
-
-        return angle
-    
-    def process_frame(self, img):
-        """Process video frame using MediaPipe Pose"""
-        # Convert to RGB for MediaPipe
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        
-        # Process the image
+    def detect_landmarks(self, img_rgb):
+        """Run MediaPipe Pose on an RGB frame already scaled to inference size"""
         results = self.pose.process(img_rgb)
-        
-        # Convert back to BGR
-        processed_img = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2BGR)
-        
-        landmarks = None
-        if results.pose_landmarks:
-            landmarks = results.pose_landmarks.landmark
-            mp_draw.draw_landmarks(processed_img, results.pose_landmarks, mp_pose.POSE_CONNECTIONS)
-        
-        return processed_img, landmarks
+        if not results.pose_landmarks:
+            return None
+        return LandmarkFrame.from_mediapipe(results.pose_landmarks.landmark, time.time())
     
     def posture_accuracy(self):
         """Calculate posture accuracy based on collected metrics"""
@@ -150,43 +160,38 @@ class CrunchExerciseProcessor:
                 "repCount": self.rep_count
             }
         
-        # Extract key points for crunch analysis
-        shoulder = [landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x,
-                   landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y]
-        hip = [landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].x,
-               landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].y]
-        knee = [landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value].x,
-                landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value].y]
-        ankle = [landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value].x,
-                 landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value].y]
-        wrist = [landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].x,
-                 landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].y]
-        head = [landmarks[mp_pose.PoseLandmark.NOSE.value].x,
-                landmarks[mp_pose.PoseLandmark.NOSE.value].y]
-        
-        # Calculate key metrics
-        knee_angle = self.calculate_angle(ankle, knee, hip)
-        back_angle = self.calculate_angle(shoulder, hip, knee)
-        
-        # Calculate hand distance (normalized)
-        hand_distance = np.linalg.norm(np.array(wrist) - np.array(head))
-        
-        # Calculate vertical distance between shoulder and hip
-        back_dist = np.linalg.norm(np.array(shoulder) - np.array(hip))
+        # Time since the previous analyzed frame
+        frame_time = self.clock.tick(landmarks.timestamp)
+        
+        # Calculate key metrics, skip the frame when the joints are occluded
+        kinematics = self.kinematics.compute(landmarks)
+        if kinematics is None:
+            return {
+                "form": "Joints not visible",
+                "accuracy": self.accuracy_per_crunch,
+                "position": None,
+                "repCount": self.rep_count
+            }
+        
+        metrics = kinematics["angles"]
+        knee_angle = metrics["knee_angle"]
+        back_angle = metrics["back_angle"]
+        hand_distance = metrics["hand_distance"]
+        back_dist = metrics["back_dist"]
         
         position = None
         
         # Check if crunch is at down position (lying flat)
         if back_angle >= IDEAL_ANGLES[self.exercise_type]["back_angle_down"] and not self.crunch_up:
-            self.hold_frames += 1
+            self.hold_time += frame_time
             position = "down"
             
-            if self.hold_frames >= FRAME_HOLD_THRESHOLD:
+            if self.hold_time >= HOLD_SECONDS:
                 self.knee_angle_down = knee_angle
                 self.hand_distance_down = hand_distance
                 self.back_dist_down = back_dist
                 self.crunch_up = True
-                self.hold_frames = 0
+                self.hold_time = 0
         
         # Check if crunch is at up position (crunched)
         elif back_angle <= IDEAL_ANGLES[self.exercise_type]["back_angle_up"] and self.crunch_up:
@@ -217,5 +222,7 @@ class CrunchExerciseProcessor:
                 "back_angle": back_angle,
                 "hand_distance": hand_distance,
                 "back_dist": back_dist
-            }
+            },
+            "side": kinematics["side"],
+            "symmetry": kinematics["symmetry"]
         }
\ No newline at end of file
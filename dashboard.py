@@ -0,0 +1,163 @@
+import asyncio
+import time
+
+# How often subscribers are checked, the default per-subscriber delta rate
+# and how often a full snapshot is resent so late or lossy clients recover
+TICK_INTERVAL = 0.1
+DEFAULT_MAX_RATE = 2.0
+SNAPSHOT_INTERVAL = 10.0
+
+# Subscribers can't be served faster than the ticker runs
+MAX_RATE = 1.0 / TICK_INTERVAL
+
+# Analysis fields a trainer dashboard shows
+STATE_FIELDS = ("repCount", "accuracy", "form", "position")
+
+
+def subscriber_rate(requested=None):
+    """Delta rate of a subscriber, the default when none was asked for, capped at MAX_RATE"""
+    try:
+        rate = float(requested) if requested else DEFAULT_MAX_RATE
+    except (TypeError, ValueError):
+        rate = DEFAULT_MAX_RATE
+    # Also catches NaN
+    if not rate > 0:
+        return DEFAULT_MAX_RATE
+    return min(rate, MAX_RATE)
+
+
+class Subscriber:
+    """A dashboard client following one trainer or group"""
+
+    def __init__(self, subscriber_id, trainer_id, group_id, max_rate):
+        self.subscriber_id = subscriber_id
+        self.trainer_id = trainer_id
+        self.group_id = group_id
+        self.min_interval = 1.0 / max_rate if max_rate > 0 else 0
+        self.next_send = 0
+        self.next_snapshot = 0
+        self.sent_versions = {}  # session_id -> version last sent
+        self.removed = set()  # Sent sessions that ended since the last message
+
+    def follows(self, session):
+        # Sessions without a trainer or group belong to nobody's dashboard
+        if self.group_id is not None:
+            return session["groupId"] == self.group_id
+        return self.trainer_id is not None and session["trainerId"] == self.trainer_id
+
+
+class DashboardPublisher:
+    """Coalesces the latest state of all sessions into per-trainer streams.
+
+    Sessions only overwrite their latest state, which is O(1) per analysis.
+    A single ticker then sends each subscriber the sessions that changed
+    since its last message, at most max_rate times per second, plus a
+    periodic full snapshot. However many trainees are in a class, the
+    trainer gets one stream.
+    """
+
+    def __init__(self, emit):
+        self.emit = emit
+        self.sessions = {}
+        self.subscribers = {}
+
+    def register(self, session_id, trainer_id=None, group_id=None, trainee_id=None, exercise=None):
+        self.sessions[session_id] = {
+            "trainerId": trainer_id,
+            "groupId": group_id,
+            "traineeId": trainee_id,
+            "exercise": exercise,
+            "state": {},
+            "updatedAt": time.time(),
+            "version": 0
+        }
+
+    def unregister(self, session_id):
+        self.sessions.pop(session_id, None)
+        for subscriber in self.subscribers.values():
+            if subscriber.sent_versions.pop(session_id, None) is not None:
+                subscriber.removed.add(session_id)
+
+    def set_exercise(self, session_id, exercise):
+        session = self.sessions.get(session_id)
+        if session is not None:
+            session["exercise"] = exercise
+            session["version"] += 1
+
+    def update(self, session_id, analysis, rep_counts=None):
+        session = self.sessions.get(session_id)
+        if session is None:
+            return
+        state = {field: analysis.get(field) for field in STATE_FIELDS}
+        # Reps per exercise so far, repCount only covers the current one
+        state["repCounts"] = rep_counts or {}
+        if state != session["state"]:
+            session["state"] = state
+            session["updatedAt"] = time.time()
+            session["version"] += 1
+
+    def subscribe(self, subscriber_id, trainer_id=None, group_id=None, max_rate=DEFAULT_MAX_RATE):
+        """Start a stream; the first tick sends a full snapshot. Returns False
+        when there is neither a trainer nor a group to follow."""
+        if trainer_id is None and group_id is None:
+            return False
+        self.subscribers[subscriber_id] = Subscriber(subscriber_id, trainer_id, group_id, max_rate)
+        return True
+
+    def unsubscribe(self, subscriber_id):
+        self.subscribers.pop(subscriber_id, None)
+
+    def _entry(self, session_id, session):
+        return dict(session["state"], sessionId=session_id, traineeId=session["traineeId"],
+                    exercise=session["exercise"], updatedAt=session["updatedAt"])
+
+    async def tick(self):
+        now = time.monotonic()
+
+        for subscriber in list(self.subscribers.values()):
+            followed = {sid: s for sid, s in self.sessions.items() if subscriber.follows(s)}
+
+            if now >= subscriber.next_snapshot:
+                subscriber.next_snapshot = now + SNAPSHOT_INTERVAL
+                subscriber.next_send = now + subscriber.min_interval
+                subscriber.sent_versions = {sid: s["version"] for sid, s in followed.items()}
+                subscriber.removed.clear()
+                await self.emit({
+                    "type": "snapshot",
+                    "subscriberId": subscriber.subscriber_id,
+                    "trainerId": subscriber.trainer_id,
+                    "groupId": subscriber.group_id,
+                    "sessions": [self._entry(sid, s) for sid, s in followed.items()]
+                })
+                continue
+
+            if now < subscriber.next_send:
+                continue
+
+            changed = [sid for sid, s in followed.items() if subscriber.sent_versions.get(sid) != s["version"]]
+            if not changed and not subscriber.removed:
+                continue
+
+            subscriber.next_send = now + subscriber.min_interval
+            for sid in changed:
+                subscriber.sent_versions[sid] = followed[sid]["version"]
+            removed = list(subscriber.removed)
+            subscriber.removed.clear()
+            await self.emit({
+                "type": "delta",
+                "subscriberId": subscriber.subscriber_id,
+                "trainerId": subscriber.trainer_id,
+                "groupId": subscriber.group_id,
+                "updates": [self._entry(sid, followed[sid]) for sid in changed],
+                "removed": removed
+            })
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(TICK_INTERVAL)
+            try:
+                await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error publishing dashboard updates: {e}")
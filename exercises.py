@@ -0,0 +1,21 @@
+"""
+Exercise processors by name, the one mapping the worker, the file pipeline
+and the benchmark create their analyzers from.
+"""
+from Pushup import PushUpExerciseProcessor
+from crunches import CrunchExerciseProcessor
+from pullup import PullUpExerciseProcessor
+from bicepcurl import BicepCurlExerciseProcessor
+
+PROCESSORS = {
+    "pushup": PushUpExerciseProcessor,
+    "crunch": CrunchExerciseProcessor,
+    "pullup": PullUpExerciseProcessor,
+    "bicepcurl": BicepCurlExerciseProcessor,
+}
+
+
+def get_exercise_processor(exercise_type):
+    """Returns the appropriate exercise processor based on type"""
+    # Unknown exercises default to the pushup processor
+    return PROCESSORS.get(exercise_type.lower(), PushUpExerciseProcessor)()
@@ -1,5 +1,6 @@
 import React, { createContext, useMemo, useContext, useEffect, useState } from "react";
 import { io } from "socket.io-client";
+import useAuth from "../hooks/useAuth";
 
 const BASE_URL = 'http://localhost:5002';
 const SocketContext = createContext(null);
@@ -10,11 +11,16 @@ export const useSocket = () => {
 
 export const SocketProvider = ({ children }) => {
   const [socket, setSocket] = useState(null);
+  const { auth } = useAuth();
+  const token = auth?.accessToken;
 
+  // Reconnects when the user logs in or the token is refreshed: the server
+  // takes the user's identity from this token at the handshake
   useEffect(() => {
     const newSocket = io(BASE_URL, {
       transports: ["websocket"], // Explicitly use WebSocket
       withCredentials: true, // Support CORS
+      auth: token ? { token } : {},
       reconnectionAttempts: 5,
       reconnectionDelay: 1000,
     });
@@ -36,7 +42,7 @@ export const SocketProvider = ({ children }) => {
     return () => {
       newSocket.disconnect(); // Clean up WebSocket connection on unmount
     };
-  }, []);
+  }, [token]);
 
   return (
     <SocketContext.Provider value={socket}>
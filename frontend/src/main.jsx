@@ -10,11 +10,11 @@ createRoot(document.getElementById('root')).render(
   <StrictMode>
     <Router>
 
-      <SocketProvider>
       <AuthProvider>
+      <SocketProvider>
         <App/>
-      </AuthProvider>
       </SocketProvider>
+      </AuthProvider>
     </Router>
   </StrictMode>,
 )
\ No newline at end of file
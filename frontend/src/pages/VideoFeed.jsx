@@ -7,6 +7,11 @@ import PeerService from "../service/peer";
 import useAxiosPrivate from "../hooks/useAxiosPrivate";
 import "./VideoFeed.css";
 
+// Renegotiation attempts after the WebRTC connection drops, and how long a
+// "disconnected" connection may try to recover by itself first
+const MAX_RECONNECT_ATTEMPTS = 3;
+const RECONNECT_GRACE_MS = 2000;
+
 const VideoFeed = () => {
   const { auth } = useAuth();
 
@@ -17,6 +22,10 @@ const VideoFeed = () => {
   const socket = useSocket();
   const webcamRef = useRef(null);
   const remoteVideoRef = useRef(null);
+  // Stable id for one recording, a reconnect with the same id resumes the session on the AI server
+  const sessionIdRef = useRef(null);
+  const reconnectAttemptsRef = useRef(0);
+  const reconnectTimerRef = useRef(null);
   const [isRecording, setIsRecording] = useState(false);
   const [currentExercise, setCurrentExercise] = useState("pushup");
   const [feedback, setFeedback] = useState(null);
@@ -29,13 +38,19 @@ const VideoFeed = () => {
   const [remoteStreamInfo, setRemoteStreamInfo] = useState(null);
   const [showRemoteVideo, setShowRemoteVideo] = useState(true);
   const [connectionPhase, setConnectionPhase] = useState("disconnected");
+  const [detectedExercise, setDetectedExercise] = useState(null);
+  // Reps per exercise: of the running session as reported by the AI server,
+  // and summed over the recordings not saved yet (auto mode)
+  const sessionExerciseCountsRef = useRef({});
+  const [exerciseCounts, setExerciseCounts] = useState({});
 
   const exercises = [
     { id: "pushup", name: "Push-ups" },
     { id: "pullup", name: "Pull-ups" },
     { id: "squat", name: "Squats" },
     { id: "crunch", name: "Crunches" },
-    { id: "bicepcurl", name: "Bicep Curls" }
+    { id: "bicepcurl", name: "Bicep Curls" },
+    { id: "auto", name: "Auto-detect (circuit)" }
   ];
 
   const axiosPrivate = useAxiosPrivate();
@@ -47,6 +62,7 @@ const VideoFeed = () => {
     setRepCount(0);
     setFeedback(null);
     setSessionRepCount(0);
+    setExerciseCounts({});
   };
 
   // WHEN SAVED RECORD BUTTON IS CLICKED
@@ -56,22 +72,36 @@ const VideoFeed = () => {
       return;
     }
     
-    const workoutData = {
-      exercise: currentExercise,
-      count: repCount,
-      startTime: startTime.toISOString(),
-      stopTime: endTime.toISOString(),
-    };
-  
-    try {
-      const response = await axiosPrivate.post("/api/trainee/workout", workoutData);
-      console.log("Workout saved successfully:", response.data);
-    } catch (error) {
-      console.error("Error saving workout:", error);
+    // An auto-mode circuit is saved as one record per exercise, the time
+    // split between them by their share of the reps
+    const counts = currentExercise === "auto" ? Object.entries(exerciseCounts) : [[currentExercise, repCount]];
+    const totalReps = counts.reduce((sum, [, count]) => sum + count, 0);
+    const totalMs = endTime - startTime;
+    let segmentStart = startTime.getTime();
+
+    for (const [exercise, count] of counts) {
+      const segmentEnd = segmentStart + (totalReps ? totalMs * count / totalReps : 0);
+      const workoutData = {
+        exercise,
+        count,
+        startTime: new Date(segmentStart).toISOString(),
+        stopTime: new Date(segmentEnd).toISOString(),
+        // The worker reports the same session to the daily rollup, it is counted once
+        sessionId: sessionIdRef.current,
+      };
+      segmentStart = segmentEnd;
+
+      try {
+        const response = await axiosPrivate.post("/api/trainee/workout", workoutData);
+        console.log("Workout saved successfully:", response.data);
+      } catch (error) {
+        console.error("Error saving workout:", error);
+      }
     }
     setStartTime(null);
     setEndTime(null);
     setRepCount(0);
+    setExerciseCounts({});
     setFeedback(null);
   };
 
@@ -149,7 +179,7 @@ const VideoFeed = () => {
         const videoTrack = webcamRef.current.srcObject.getVideoTracks()[0];
         if (videoTrack) {
           // Signal that frames should be flowing
-          socket.emit("frames-flowing", { exerciseType: currentExercise });
+          socket.emit("frames-flowing", { exerciseType: currentExercise, sessionId: sessionIdRef.current });
           console.log("Signaled that frames should be flowing");
         }
       }
@@ -157,10 +187,20 @@ const VideoFeed = () => {
 
     // Receive answer and set you local description else log error
     socket.on("webrtc-answer", async (answer) => {
+      // Answers for other sessions are relayed to every client
+      if (answer.sessionId && answer.sessionId !== sessionIdRef.current) return;
       console.log("Received SDP answer from server");
       try {
         await PeerService.peer.setRemoteDescription(new RTCSessionDescription(answer));
         console.log("Remote description set successfully");
+        setConnectionError(null);
+        if (answer.resumed) {
+          console.log(`Resumed session at ${answer.repCount} reps`);
+          setSessionRepCount(answer.repCount);
+        }
+        if (answer.videoConstraints) {
+          await applyVideoConstraints(answer.videoConstraints);
+        }
       } catch (err) {
         console.error("Error setting remote description:", err);
         setConnectionError(`Failed to establish connection: ${err.message}`);
@@ -185,17 +225,59 @@ const VideoFeed = () => {
     
     // get the feedback from websocket and update Feedback and RepCount
     socket.on("exercise-feedback", (data) => {
+      if (data?.sessionId !== sessionIdRef.current) return;
       console.log("📊 Received exercise feedback:", data);
       setFeedback(data.feedback);
       // setRepCount(data.repCount);
       setSessionRepCount(data.repCount);
+      sessionExerciseCountsRef.current = data.repCounts || {};
+    });
+
+    // In auto mode the AI server tells us which exercise it recognized
+    socket.on("exercise-detected", (data) => {
+      if (data?.sessionId !== sessionIdRef.current) return;
+      console.log("🔎 Detected exercise:", data);
+      setDetectedExercise(data.exerciseType);
+    });
+
+    // The AI server asks for a different sender resolution, frame rate or bitrate
+    socket.on("video-constraints", (constraints) => {
+      if (constraints?.sessionId !== sessionIdRef.current) return;
+      console.log("📐 Server requested video constraints:", constraints);
+      applyVideoConstraints(constraints);
     });
 
-    // If the python files gets disconnected then Set Connection Error
+    // The AI server is busy and is holding our offer until a slot frees up
+    socket.on("webrtc-queued", (data) => {
+      if (data?.sessionId !== sessionIdRef.current) return;
+      console.log("⏳ AI processing server is busy, waiting for a slot");
+      setConnectionError("AI processing server is busy, waiting for a free slot...");
+    });
+
+    // The AI server is at capacity and turned our session away
+    socket.on("webrtc-rejected", (data) => {
+      if (data?.sessionId !== sessionIdRef.current) return;
+      console.log("⛔ AI processing server rejected the session:", data);
+      // A worker shutting down, the relay sends the retry to another one
+      if (data?.reason === "draining") {
+        reconnectPeer();
+        return;
+      }
+      const reason = data?.reason === "overload" ? "overloaded" : "at capacity";
+      setConnectionError(`AI processing server is ${reason}, please retry in ${Math.ceil(data?.retryAfter || 10)} seconds`);
+      stopRecording();
+    });
+
+    // The AI server lost its signaling link. Media keeps flowing peer to peer
+    // and the server reconnects quickly, so keep recording.
     socket.on("python-disconnected", () => {
       console.log("❌ AI processing server is offline");
-      setConnectionError("AI processing server is offline");
-      stopRecording();
+      setConnectionError("AI processing server is offline, reconnecting...");
+    });
+
+    socket.on("python-connected", () => {
+      console.log("✅ AI processing server is back");
+      setConnectionError(null);
     });
 
     // Disconnection yourself from server
@@ -217,10 +299,53 @@ const VideoFeed = () => {
       socket.off("ice-candidate");
       socket.off("exercise-feedback");
       socket.off("python-disconnected");
+      socket.off("python-connected");
+      socket.off("webrtc-queued");
+      socket.off("webrtc-rejected");
+      socket.off("video-constraints");
+      socket.off("exercise-detected");
       socket.off("refresh-frames");
     };
   }, [socket]);
 
+  // Scale the outgoing video to what the AI server asked for, without renegotiating
+  const applyVideoConstraints = async (constraints) => {
+    const sender = PeerService.peer?.getSenders().find(s => s.track?.kind === "video");
+    if (!sender) return;
+
+    try {
+      const settings = sender.track.getSettings();
+      const params = sender.getParameters();
+      if (!params.encodings || params.encodings.length === 0) {
+        params.encodings = [{}];
+      }
+      params.encodings[0].scaleResolutionDownBy = Math.max(1, (settings.width || constraints.width) / constraints.width);
+      params.encodings[0].maxFramerate = constraints.frameRate;
+      params.encodings[0].maxBitrate = constraints.maxBitrate;
+      await sender.setParameters(params);
+      console.log("Applied video constraints:", params.encodings[0]);
+    } catch (err) {
+      console.error("Error applying video constraints:", err);
+    }
+  };
+
+  // Worker-to-client control messages (sender constraints) come over this
+  // channel straight from the AI server, the relay is only the fallback
+  const openControlChannel = () => {
+    const channel = PeerService.peer.createDataChannel("control");
+    channel.onmessage = (event) => {
+      try {
+        const message = JSON.parse(event.data);
+        if (message.type === "video-constraints" && message.sessionId === sessionIdRef.current) {
+          console.log("📐 Server requested video constraints:", message);
+          applyVideoConstraints(message);
+        }
+      } catch (err) {
+        console.error("Invalid control message:", err);
+      }
+    };
+  };
+
   // Cleanup the PeerService and stop recording
   useEffect(() => {
     // Cleanup function to ensure WebRTC is properly cleaned up when component unmounts
@@ -245,6 +370,8 @@ const startRecording = async () => {
     setConnectionError(null);
     setRemoteStreamInfo(null);
     setConnectionPhase("connecting");
+    sessionIdRef.current = crypto.randomUUID();
+    reconnectAttemptsRef.current = 0;
 
     // Initialize PeerService
     console.log("Initializing PeerService...");
@@ -286,11 +413,12 @@ const startRecording = async () => {
     if (track.kind === 'video') {
       track.onunmute = () => {
         console.log("Video track is unmuted and ready to send");
-        socket.emit("frames-ready", { exerciseType: currentExercise });
+        socket.emit("frames-ready", { exerciseType: currentExercise, sessionId: sessionIdRef.current });
       };
     }
     
     });
+    openControlChannel();
 
     // Create and send SDP Offer with exercise type
     console.log("Creating SDP offer with tracks...");
@@ -299,7 +427,8 @@ const startRecording = async () => {
     socket.emit("webrtc-offer", { 
       sdp: offer.sdp, 
       type: offer.type,
-      exerciseType: currentExercise 
+      exerciseType: currentExercise,
+      sessionId: sessionIdRef.current
     });
 
     // After offer is created, set up explicit signal for when ICE is completed
@@ -307,7 +436,7 @@ const startRecording = async () => {
       if (PeerService.peer.iceConnectionState === "connected" || 
           PeerService.peer.iceConnectionState === "completed") {
         console.log("ICE connection established, notifying server media is ready");
-        socket.emit("media-ready", { exerciseType: currentExercise });
+        socket.emit("media-ready", { exerciseType: currentExercise, sessionId: sessionIdRef.current });
       }
     });
 
@@ -331,7 +460,7 @@ const startRecording = async () => {
             console.log("Video track status:", sender.track.readyState);
             if (sender.track.readyState === 'live') {
               console.log("Confirming video frames are flowing");
-              socket.emit("frames-flowing", { exerciseType: currentExercise });
+              socket.emit("frames-flowing", { exerciseType: currentExercise, sessionId: sessionIdRef.current });
               
               // Schedule a check to ensure frames continue flowing
               setTimeout(() => {
@@ -356,6 +485,7 @@ const startRecording = async () => {
     }
     setEndTime(null);
     setSessionRepCount(0);
+    sessionExerciseCountsRef.current = {};
   } catch (err) {
     console.error("Error starting recording:", err);
     setConnectionError(`Failed to access camera: ${err.message}`);
@@ -470,7 +600,7 @@ const startRecording = async () => {
       if (event.candidate) {
         console.log("📡 ICE candidate generated:", event.candidate);
         try {
-          socket.emit("ice-candidate", event.candidate);
+          socket.emit("ice-candidate", { ...event.candidate.toJSON(), sessionId: sessionIdRef.current });
         } catch (err) {
           console.error("❌ Failed to send ICE candidate to server:", err);
         }
@@ -490,13 +620,9 @@ const startRecording = async () => {
       } else if (state === "connected" || state === "completed") {
         setConnectionPhase("connected");
       } else if (state === "failed" || state === "disconnected" || state === "closed") {
+        // Recovery is driven by the connection state handler
         console.error(`ICE Connection state: ${state}`);
-        setConnectionError(`ICE Connection ${state}`);
         setConnectionPhase("disconnected");
-        
-        if (isRecording) {
-          stopRecording();
-        }
       }
     };
   
@@ -513,15 +639,29 @@ const startRecording = async () => {
 
       if (PeerService.peer.connectionState === "connected") {
         console.log("WebRTC connection established successfully!");
-        socket.emit("connection-established", { exerciseType: currentExercise });
+        socket.emit("connection-established", { exerciseType: currentExercise, sessionId: sessionIdRef.current });
+        reconnectAttemptsRef.current = 0;
+        clearTimeout(reconnectTimerRef.current);
+        setConnectionError(null);
       }
       
-      if (state === "failed" || state === "disconnected" || state === "closed") {
-        console.error(`WebRTC connection ${state}`);
-        setConnectionError(`WebRTC connection ${state}`);
+      if (state === "disconnected") {
+        // Often recovers by itself, renegotiate only if it doesn't
+        console.error("WebRTC connection disconnected");
+        setConnectionError("Connection unstable, reconnecting...");
+        clearTimeout(reconnectTimerRef.current);
+        reconnectTimerRef.current = setTimeout(() => {
+          if (PeerService.peer?.connectionState !== "connected") {
+            reconnectPeer();
+          }
+        }, RECONNECT_GRACE_MS);
+      } else if (state === "failed") {
+        console.error("WebRTC connection failed");
+        reconnectPeer();
+      } else if (state === "closed") {
+        console.error("WebRTC connection closed");
+        setConnectionError("WebRTC connection closed");
         stopRecording();
-      } else if (state === "connected") {
-        console.log("WebRTC connection established successfully!");
       }
     };
 
@@ -532,17 +672,51 @@ const startRecording = async () => {
         
         // Allow a moment for media pipeline to initialize
         setTimeout(() => {
-          socket.emit("connection-ready", { exerciseType: currentExercise });
+          socket.emit("connection-ready", { exerciseType: currentExercise, sessionId: sessionIdRef.current });
           console.log("Notified backend that connection is ready");
         }, 1000);
       }
     });
   };
 
+  // Renegotiate with the same session id, the AI server resumes the session
+  // with its rep count and warm pose graph
+  const reconnectPeer = async () => {
+    clearTimeout(reconnectTimerRef.current);
+    const stream = webcamRef.current?.srcObject;
+    if (!stream || reconnectAttemptsRef.current >= MAX_RECONNECT_ATTEMPTS) {
+      setConnectionError("Connection lost");
+      stopRecording();
+      return;
+    }
+    
+    reconnectAttemptsRef.current += 1;
+    console.log(`Reconnecting session ${sessionIdRef.current} (attempt ${reconnectAttemptsRef.current})`);
+    setConnectionError("Connection lost, reconnecting...");
+    
+    try {
+      PeerService.init();
+      setupConnectionMonitoring();
+      stream.getTracks().forEach((track) => PeerService.peer.addTrack(track, stream));
+      openControlChannel();
+      const offer = await PeerService.getOffer();
+      socket.emit("webrtc-offer", {
+        sdp: offer.sdp,
+        type: offer.type,
+        exerciseType: currentExercise,
+        sessionId: sessionIdRef.current
+      });
+    } catch (err) {
+      console.error("Error reconnecting:", err);
+      stopRecording();
+    }
+  };
+
   const stopRecording = () => {
     
     console.log("Stopping recording...");
     setIsRecording(false);
+    clearTimeout(reconnectTimerRef.current);
     
     // Stop all tracks from webcam
     if (webcamRef.current?.srcObject) {
@@ -571,7 +745,19 @@ const startRecording = async () => {
     }
     
     setEndTime(new Date());
-    setRepCount(prevTotal => prevTotal + sessionRepCount);
+    // In auto mode the rep count only covers the current exercise, add up all of them
+    const sessionCounts = sessionExerciseCountsRef.current;
+    const sessionTotal = currentExercise === "auto"
+      ? Object.values(sessionCounts).reduce((sum, count) => sum + count, 0)
+      : sessionRepCount;
+    setRepCount(prevTotal => prevTotal + sessionTotal);
+    setExerciseCounts(prevCounts => {
+      const counts = { ...prevCounts };
+      for (const [exercise, count] of Object.entries(sessionCounts)) {
+        counts[exercise] = (counts[exercise] || 0) + count;
+      }
+      return counts;
+    });
     console.log("Recording stopped");
   };
 
@@ -590,7 +776,7 @@ const startRecording = async () => {
 
             videoTrack.onunmute = () => {
               console.log("Video track is unmuted and ready to send");
-              socket.emit("frames-ready", { exerciseType: currentExercise });
+              socket.emit("frames-ready", { exerciseType: currentExercise, sessionId: sessionIdRef.current });
             };            
             
             if (videoTrack.readyState === "live" && !videoTrack.muted) {
@@ -612,7 +798,7 @@ const startRecording = async () => {
     if (isRecording && isConnected) {
       console.log(`Sending exercise change to: ${currentExercise}`);
       // Send exercise type update to server
-      socket.emit("exercise-change", { exerciseType: currentExercise });
+      socket.emit("exercise-change", { exerciseType: currentExercise, sessionId: sessionIdRef.current });
     }
   }, [currentExercise, isRecording, isConnected, socket]);
 
@@ -746,7 +932,10 @@ const startRecording = async () => {
       <div className="stats-panel">
         <div className="stat-item">
           <h3>Exercise</h3>
-          <p>{exercises.find((e) => e.id === currentExercise)?.name}</p>
+          <p>
+            {exercises.find((e) => e.id === currentExercise)?.name}
+            {currentExercise === "auto" && detectedExercise && ` - ${exercises.find((e) => e.id === detectedExercise)?.name}`}
+          </p>
         </div>
         <div className="stat-item">
           <h3>Rep Count</h3>
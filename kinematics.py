@@ -0,0 +1,143 @@
+import numpy as np
+
+from landmarks import (
+    NOSE, LEFT_SHOULDER, RIGHT_SHOULDER, LEFT_ELBOW, RIGHT_ELBOW, LEFT_WRIST, RIGHT_WRIST,
+    LEFT_HIP, RIGHT_HIP, LEFT_KNEE, RIGHT_KNEE, LEFT_ANKLE, RIGHT_ANKLE
+)
+
+# Left landmark -> matching right landmark, center landmarks map to themselves
+MIRROR = {
+    NOSE: NOSE,
+    LEFT_SHOULDER: RIGHT_SHOULDER,
+    LEFT_ELBOW: RIGHT_ELBOW,
+    LEFT_WRIST: RIGHT_WRIST,
+    LEFT_HIP: RIGHT_HIP,
+    LEFT_KNEE: RIGHT_KNEE,
+    LEFT_ANKLE: RIGHT_ANKLE
+}
+
+SIDES = ("left", "right")
+MIN_VISIBILITY = 0.5  # Every required joint of a side must reach this
+SIDE_SWITCH_MARGIN = 0.1  # Mean visibility lead needed to switch sides
+
+# Longest gap between analyzed frames that counts towards a hold, so a
+# dropout can't complete a hold on its own
+MAX_FRAME_GAP = 0.5
+
+
+def joint_angles(coords, triplets):
+    """Angles in degrees at b for every (a, b, c) row of triplets, in one pass.
+
+    coords is (33, 4) for one frame or (frames, 33, 4) for a window.
+    """
+    a = coords[..., triplets[:, 0], :2]
+    b = coords[..., triplets[:, 1], :2]
+    c = coords[..., triplets[:, 2], :2]
+
+    radians = (np.arctan2(c[..., 1] - b[..., 1], c[..., 0] - b[..., 0])
+               - np.arctan2(a[..., 1] - b[..., 1], a[..., 0] - b[..., 0]))
+    angles = np.abs(np.degrees(radians))
+    return np.where(angles > 180.0, 360 - angles, angles)
+
+
+POINT_TRIPLET = np.array([(0, 1, 2)], dtype=np.int32)
+
+
+def point_angle(a, b, c):
+    """Angle in degrees at b between three [x, y] points"""
+    return float(joint_angles(np.array([a, b, c], dtype=np.float64), POINT_TRIPLET)[0])
+
+
+class BilateralKinematics:
+    """Computes an exercise's angles and distances for both body sides at once.
+
+    Angles and distances are declared with left-side landmarks and mirrored
+    for the right side. Each frame the side whose required joints are most
+    visible is selected, with a small margin so it doesn't flip back and
+    forth. When neither side has all its joints visible the frame is
+    unusable and compute() returns None.
+    """
+
+    def __init__(self, angles, distances=None, min_visibility=MIN_VISIBILITY):
+        distances = distances or {}
+        self.angle_names = list(angles)
+        self.distance_names = list(distances)
+        self.min_visibility = min_visibility
+
+        left_angles = np.array([angles[name] for name in self.angle_names], dtype=np.int32).reshape(-1, 3)
+        left_distances = np.array([distances[name] for name in self.distance_names], dtype=np.int32).reshape(-1, 2)
+        self.triplets = np.concatenate([left_angles, self._mirror(left_angles)])
+        self.pairs = np.concatenate([left_distances, self._mirror(left_distances)])
+
+        left_required = np.unique(np.concatenate([left_angles.ravel(), left_distances.ravel()]))
+        self.required = np.stack([left_required, self._mirror(left_required)])
+
+        self.side = None
+
+    def _mirror(self, indices):
+        return np.vectorize(MIRROR.get, otypes=[np.int32])(indices) if indices.size else indices
+
+    def reset(self):
+        self.side = None
+
+    def _select_side(self, coords):
+        visibility = coords[self.required, 3]
+        usable = visibility.min(axis=1) >= self.min_visibility
+        if not usable.any():
+            return None, usable
+
+        score = visibility.mean(axis=1)
+        side = self.side
+        other = 1 - side if side is not None else None
+        if side is None or not usable[side] or (usable[other] and score[other] > score[side] + SIDE_SWITCH_MARGIN):
+            side = int(np.argmax(np.where(usable, score, -1)))
+        return side, usable
+
+    def compute(self, landmarks):
+        """Returns {"side", "angles", "symmetry"} for the selected side, or None if occluded"""
+        coords = landmarks.coords
+        side, usable = self._select_side(coords)
+        if side is None:
+            return None
+        self.side = side
+
+        angles = joint_angles(coords, self.triplets).reshape(2, -1)
+        values = dict(zip(self.angle_names, angles[side].tolist()))
+
+        if self.distance_names:
+            deltas = coords[self.pairs[:, 0], :2] - coords[self.pairs[:, 1], :2]
+            distances = np.hypot(deltas[:, 0], deltas[:, 1]).reshape(2, -1)
+            values.update(zip(self.distance_names, distances[side].tolist()))
+
+        # Left/right angle difference, only meaningful when both sides are seen
+        symmetry = {}
+        if usable.all():
+            symmetry = dict(zip(self.angle_names, np.abs(angles[0] - angles[1]).tolist()))
+
+        return {"side": SIDES[side], "angles": values, "symmetry": symmetry}
+
+    def point(self, landmarks, left_index):
+        """[x, y] of a landmark on the currently selected side"""
+        index = MIRROR[left_index] if self.side == 1 else left_index
+        return landmarks.point(index)
+
+
+class FrameClock:
+    """Time covered by each analyzed frame, from the landmark timestamps.
+
+    Holds add up these intervals instead of counting frames, so a movement
+    takes the same time to register at any analyzed frame rate.
+    """
+
+    def __init__(self, max_gap=MAX_FRAME_GAP):
+        self.max_gap = max_gap
+        self.last = None
+
+    def reset(self):
+        self.last = None
+
+    def tick(self, timestamp):
+        """Seconds since the previous analyzed frame, 0 for the first one"""
+        interval = 0.0 if self.last is None else min(max(timestamp - self.last, 0.0), self.max_gap)
+        self.last = timestamp
+        return interval
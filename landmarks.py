@@ -0,0 +1,55 @@
+import numpy as np
+
+# MediaPipe Pose landmark indices used by the analyzers
+NOSE = 0
+LEFT_SHOULDER = 11
+RIGHT_SHOULDER = 12
+LEFT_ELBOW = 13
+RIGHT_ELBOW = 14
+LEFT_WRIST = 15
+RIGHT_WRIST = 16
+LEFT_HIP = 23
+RIGHT_HIP = 24
+LEFT_KNEE = 25
+RIGHT_KNEE = 26
+LEFT_ANKLE = 27
+RIGHT_ANKLE = 28
+
+NUM_LANDMARKS = 33
+
+
+class LandmarkFrame:
+    """Pose landmarks of one frame as a single (33, 4) float32 array.
+
+    Columns are x, y, z and visibility with x/y normalized to the frame. It is
+    built once right after inference so analyzers, queues and logs never hold
+    on to MediaPipe result objects.
+    """
+    __slots__ = ("coords", "timestamp")
+
+    def __init__(self, coords, timestamp=0.0):
+        self.coords = coords
+        self.timestamp = timestamp
+
+    @classmethod
+    def from_mediapipe(cls, landmark_list, timestamp=0.0):
+        """Copy a MediaPipe landmark repeated field"""
+        coords = np.array([(lm.x, lm.y, lm.z, lm.visibility) for lm in landmark_list], dtype=np.float32)
+        return cls(coords, timestamp)
+
+    def point(self, index):
+        """[x, y] of a landmark as Python floats"""
+        return self.coords[index, :2].tolist()
+
+    def visibility(self, index):
+        return float(self.coords[index, 3])
+
+    def copy(self, timestamp=None):
+        return LandmarkFrame(self.coords.copy(), self.timestamp if timestamp is None else timestamp)
+
+    def __len__(self):
+        return len(self.coords)
+
+    def to_dict(self):
+        """JSON-friendly form for logs and feedback"""
+        return {"timestamp": self.timestamp, "landmarks": self.coords.round(4).tolist()}
@@ -0,0 +1,339 @@
+"""
+Synthetic WebRTC load generator for capacity testing.
+
+Starts a local signaling stand-in for the Node.js relay, launches the
+mlModels.py worker against it and ramps up N aiortc client peers that each
+stream a recorded video file. For every step it records per-session frame
+rate, feedback latency and dropped frames together with worker CPU and RSS.
+
+Usage:
+    python loadtest.py --video squat1.mp4 --steps 1,2,4,8 --duration 30
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+
+import socketio
+from aiohttp import web
+from aiortc import RTCPeerConnection, RTCSessionDescription, MediaStreamTrack
+from aiortc.contrib.media import MediaPlayer
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+class SignalingStandIn:
+    """Minimal stand-in for the Node.js relay that routes by sessionId"""
+
+    def __init__(self, port):
+        self.port = port
+        self.sio = socketio.AsyncServer(async_mode="aiohttp", cors_allowed_origins="*")
+        self.app = web.Application()
+        self.sio.attach(self.app, socketio_path="/socket.io/")
+        self.runner = None
+        self.worker_sid = None
+        self.worker_connected = asyncio.Event()
+        self.clients = {}  # sessionId -> client sid
+
+        self.sio.on("connect-python", self.on_connect_python)
+        self.sio.on("webrtc-offer", self.on_offer)
+        for event in ("webrtc-answer", "ice-candidate", "exercise-feedback", "rep-event",
+                      "webrtc-queued", "webrtc-rejected"):
+            self.sio.on(event, self._make_router(event))
+
+    async def start(self):
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", self.port).start()
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+
+    async def on_connect_python(self, sid, data=None):
+        self.worker_sid = sid
+        self.worker_connected.set()
+
+    async def on_offer(self, sid, data):
+        self.clients[data["sessionId"]] = sid
+        if self.worker_sid:
+            await self.sio.emit("webrtc-offer", data, to=self.worker_sid)
+
+    def _make_router(self, event):
+        async def route(sid, data):
+            client_sid = self.clients.get(data.get("sessionId")) if isinstance(data, dict) else None
+            if client_sid:
+                await self.sio.emit(event, data, to=client_sid)
+        return route
+
+
+class CountingTrack(MediaStreamTrack):
+    """Wraps the player track and counts the frames handed to the encoder"""
+    kind = "video"
+
+    def __init__(self, source):
+        super().__init__()
+        self.source = source
+        self.frames_sent = 0
+
+    async def recv(self):
+        frame = await self.source.recv()
+        self.frames_sent += 1
+        return frame
+
+
+class LoadClient:
+    """One synthetic trainee streaming a video file to the worker"""
+
+    def __init__(self, url, video, exercise_type):
+        self.url = url
+        self.video = video
+        self.exercise_type = exercise_type
+        self.session_id = f"load-{uuid.uuid4().hex[:8]}"
+        self.sio = socketio.AsyncClient()
+        self.pc = None
+        self.player = None
+        self.sender_track = None
+        self.answered = asyncio.Event()
+        self.rejected = None  # The worker's rejection, if it turned the session away
+        self.consumer = None
+        self.reset_counters()
+
+        self.sio.on("webrtc-answer", self.on_answer)
+        self.sio.on("webrtc-rejected", self.on_rejected)
+        self.sio.on("exercise-feedback", self.on_feedback)
+
+    def reset_counters(self):
+        self.window_start = time.time()
+        self.frames_received = 0
+        self.sent_offset = self.sender_track.frames_sent if self.sender_track else 0
+        self.latencies = []
+
+    async def start(self):
+        await self.sio.connect(self.url, socketio_path="/socket.io/", transports=["websocket"])
+
+        self.pc = RTCPeerConnection()
+        self.player = MediaPlayer(self.video, loop=True)
+        self.sender_track = CountingTrack(self.player.video)
+        self.pc.addTrack(self.sender_track)
+
+        @self.pc.on("track")
+        def on_track(track):
+            if track.kind == "video":
+                self.consumer = asyncio.create_task(self._consume(track))
+
+        offer = await self.pc.createOffer()
+        await self.pc.setLocalDescription(offer)
+        await self.sio.emit("webrtc-offer", {
+            "sdp": self.pc.localDescription.sdp,
+            "type": self.pc.localDescription.type,
+            "exerciseType": self.exercise_type,
+            "sessionId": self.session_id
+        })
+        await asyncio.wait_for(self.answered.wait(), timeout=30)
+        self.reset_counters()
+
+    async def stop(self):
+        if self.consumer:
+            self.consumer.cancel()
+        if self.pc:
+            await self.pc.close()
+        if self.sio.connected:
+            await self.sio.disconnect()
+
+    async def on_answer(self, data):
+        await self.pc.setRemoteDescription(RTCSessionDescription(sdp=data["sdp"], type=data["type"]))
+        self.answered.set()
+
+    async def on_rejected(self, data):
+        self.rejected = data
+        self.answered.set()
+
+    async def on_feedback(self, data):
+        # frameTime is when the worker received the analyzed frame, so the
+        # latency covers decode, inference, analysis and the way back
+        frame_time = data.get("frameTime")
+        if frame_time:
+            self.latencies.append(time.time() - frame_time)
+
+    async def _consume(self, track):
+        while True:
+            try:
+                await track.recv()
+            except Exception:
+                break
+            self.frames_received += 1
+
+    def stats(self):
+        elapsed = max(time.time() - self.window_start, 1e-6)
+        sent = self.sender_track.frames_sent - self.sent_offset
+        latencies = sorted(self.latencies)
+        return {
+            "sessionId": self.session_id,
+            "fps": self.frames_received / elapsed,
+            "framesSent": sent,
+            "framesReceived": self.frames_received,
+            "droppedFrames": max(0, sent - self.frames_received),
+            "feedbackCount": len(latencies),
+            "latencyP50": percentile(latencies, 0.5),
+            "latencyP95": percentile(latencies, 0.95)
+        }
+
+
+def percentile(values, q):
+    """Percentile of an already sorted list"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class WorkerSampler:
+    """Samples CPU and RSS of the worker process"""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.process = psutil.Process(pid) if psutil else None
+        self.samples = []
+        self.last_cpu = None
+
+    def _cpu_seconds(self):
+        if self.process:
+            times = self.process.cpu_times()
+            return times.user + times.system
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    def _rss(self):
+        if self.process:
+            return self.process.memory_info().rss
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+        return 0
+
+    def sample(self):
+        now = time.time()
+        cpu = self._cpu_seconds()
+        if self.last_cpu:
+            last_time, last_cpu = self.last_cpu
+            self.samples.append({
+                "cpuPercent": 100 * (cpu - last_cpu) / max(now - last_time, 1e-6),
+                "rss": self._rss()
+            })
+        self.last_cpu = (now, cpu)
+
+    def reset(self):
+        self.samples = []
+
+    def stats(self):
+        if not self.samples:
+            return {"cpuPercent": None, "rssMax": None}
+        return {
+            "cpuPercent": sum(s["cpuPercent"] for s in self.samples) / len(self.samples),
+            "rssMax": max(s["rss"] for s in self.samples)
+        }
+
+
+async def run(args):
+    signaling = SignalingStandIn(args.port)
+    await signaling.start()
+    url = f"http://127.0.0.1:{args.port}"
+
+    env = dict(os.environ, SIGNALING_URL=url)
+    worker = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "mlModels.py")],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL if not args.verbose else None
+    )
+    sampler = WorkerSampler(worker.pid)
+    clients = []
+    results = []
+
+    try:
+        await asyncio.wait_for(signaling.worker_connected.wait(), timeout=60)
+
+        for step in args.steps:
+            # Ramp up to the number of sessions for this step
+            while len(clients) < step:
+                client = LoadClient(url, args.video, args.exercise)
+                await client.start()
+                clients.append(client)
+
+            await asyncio.sleep(args.warmup)
+            for client in clients:
+                client.reset_counters()
+            sampler.reset()
+            sampler.sample()
+
+            for _ in range(int(args.duration)):
+                await asyncio.sleep(1)
+                sampler.sample()
+
+            sessions = [client.stats() for client in clients]
+            fps = [s["fps"] for s in sessions]
+            result = {
+                "sessions": step,
+                "worker": sampler.stats(),
+                "minFps": min(fps),
+                "avgFps": sum(fps) / len(fps),
+                "perSession": sessions
+            }
+            results.append(result)
+            print_step(result)
+    finally:
+        for client in clients:
+            await client.stop()
+        worker.terminate()
+        try:
+            worker.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            worker.kill()
+        await signaling.stop()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+def print_step(result):
+    worker = result["worker"]
+    latencies = [s["latencyP95"] for s in result["perSession"] if s["latencyP95"] is not None]
+    dropped = sum(s["droppedFrames"] for s in result["perSession"])
+    cpu = f"{worker['cpuPercent']:.0f}%" if worker["cpuPercent"] is not None else "n/a"
+    rss = f"{worker['rssMax'] / 2**20:.0f}MB" if worker["rssMax"] else "n/a"
+    p95 = f"{max(latencies) * 1000:.0f}ms" if latencies else "n/a"
+    print(f"sessions={result['sessions']:3d} fps(avg/min)={result['avgFps']:.1f}/{result['minFps']:.1f} "
+          f"p95 latency={p95} dropped={dropped} cpu={cpu} rss={rss}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Ramp up synthetic WebRTC sessions against the worker")
+    parser.add_argument("--video", required=True, help="Recorded video file each client streams")
+    parser.add_argument("--exercise", default="pushup", help="exerciseType sent with every offer")
+    parser.add_argument("--steps", default="1,2,4,8", help="Comma separated session counts to ramp through")
+    parser.add_argument("--duration", type=float, default=30, help="Measurement window per step in seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="Settling time after each ramp in seconds")
+    parser.add_argument("--port", type=int, default=5102, help="Port of the local signaling stand-in")
+    parser.add_argument("--output", help="Write per-step results as JSON")
+    parser.add_argument("--verbose", action="store_true", help="Show worker stderr")
+    args = parser.parse_args()
+    args.steps = [int(n) for n in args.steps.split(",")]
+    return args
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(run(parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,180 @@
+"""
+Event loop lag watchdog with graded self-protection.
+
+A heartbeat task sleeps a fixed interval and measures how late it wakes up,
+which is how long every other callback on the loop had to wait. A separate
+thread notices when the heartbeat stops altogether and records where the
+loop thread is stuck, so long stalls are attributed to the code and session
+that caused them.
+
+The mean lag of each window picks a degradation level. Levels step up as
+soon as a window crosses their threshold and step down one at a time after
+lag has stayed well below the current level for a while. Shedding is the
+exception: a session is only shed in a window whose lag is at the shedding
+threshold, and the first window below it leaves that level right away.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+import profiling
+
+HEARTBEAT_INTERVAL = 0.05
+WINDOW_SECONDS = 1.0
+
+# The heartbeat not running for this long counts as a stall
+STALL_THRESHOLD = float(os.environ.get("LOOP_STALL_THRESHOLD", "0.25"))
+
+# Levels by mean window lag in seconds:
+# (name, lag threshold, sampling interval factor, annotate output, shed sessions)
+DEGRADE_LEVELS = [
+    ("normal", 0.0, 1, True, False),
+    ("reduced-sampling", float(os.environ.get("LOOP_LAG_REDUCE", "0.05")), 2, True, False),
+    ("no-overlay", float(os.environ.get("LOOP_LAG_NO_OVERLAY", "0.15")), 3, False, False),
+    ("shedding", float(os.environ.get("LOOP_LAG_SHED", "0.4")), 3, False, True),
+]
+
+# Windows in a row below half the current level's threshold before stepping down
+RECOVER_WINDOWS = 5
+
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _blocking_frame(thread_id):
+    """Innermost frame of our own code on a thread, as "function (file:line)" """
+    frame = sys._current_frames().get(thread_id)
+    innermost = None
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(SOURCE_DIR) and "site-packages" not in filename:
+            return profiling._frame_name(frame)
+        innermost = innermost or profiling._frame_name(frame)
+        frame = frame.f_back
+    return innermost
+
+
+class LoopWatchdog:
+    """Measures event loop lag, attributes stalls and sets the degradation level"""
+
+    def __init__(self, shed=None, levels=DEGRADE_LEVELS):
+        self.levels = levels
+        self.shed = shed  # async callback shedding one session
+        self.level = 0
+        self.calm_windows = 0
+
+        self.lag = 0.0  # Mean lag of the last window
+        self.max_lag = 0.0  # Worst lag of the last window
+        self.last_beat = time.monotonic()
+        self.loop_thread = None
+
+        # Stalls, the monitor thread fills in where, the heartbeat how long
+        self.stall = None
+        self.stalls = deque(maxlen=20)
+        self.stall_counts = {}
+        self.stopped = threading.Event()
+        self.monitor = None
+
+    @property
+    def sampling_factor(self):
+        return self.levels[self.level][2]
+
+    @property
+    def annotate(self):
+        return self.levels[self.level][3]
+
+    def shedding(self):
+        """Whether the last window's lag calls for shedding a session"""
+        _, threshold, _, _, shed = self.levels[self.level]
+        return shed and self.lag >= threshold
+
+    def _monitor(self):
+        """Runs off the loop, catches the loop thread while it is stuck"""
+        while not self.stopped.wait(STALL_THRESHOLD / 2):
+            blocked = time.monotonic() - self.last_beat - HEARTBEAT_INTERVAL
+            if blocked > STALL_THRESHOLD and self.stall is None:
+                self.stall = {
+                    "where": _blocking_frame(self.loop_thread),
+                    "session": profiling._active_session,
+                    "at": time.time()
+                }
+
+    def _end_stall(self, lag):
+        stall, self.stall = self.stall, None
+        stall["seconds"] = lag
+        self.stalls.append(stall)
+        self.stall_counts[stall["where"]] = self.stall_counts.get(stall["where"], 0) + 1
+        session = f" (session {stall['session']})" if stall["session"] else ""
+        print(f"Event loop stalled {lag * 1000:.0f} ms in {stall['where']}{session}")
+
+    def _evaluate(self, lags):
+        self.lag = sum(lags) / len(lags)
+        self.max_lag = max(lags)
+
+        # Step up straight to the highest level whose threshold is crossed
+        level = self.level
+        for index, (_, threshold, *_) in enumerate(self.levels):
+            if index > level and self.lag >= threshold:
+                level = index
+        if level != self.level:
+            self.calm_windows = 0
+            self._set_level(level)
+            return
+
+        # Sessions are only shed while the lag is there, recovery from
+        # shedding doesn't wait for calm windows
+        if self.levels[self.level][4] and self.lag < self.levels[self.level][1]:
+            self.calm_windows = 0
+            self._set_level(self.level - 1)
+            return
+
+        # Step down one level after enough calm windows
+        if self.level and self.lag < self.levels[self.level][1] / 2:
+            self.calm_windows += 1
+            if self.calm_windows >= RECOVER_WINDOWS:
+                self.calm_windows = 0
+                self._set_level(self.level - 1)
+        else:
+            self.calm_windows = 0
+
+    def _set_level(self, level):
+        print(f"Loop lag {self.lag * 1000:.0f} ms: degradation {self.levels[self.level][0]} -> {self.levels[level][0]}")
+        self.level = level
+
+    async def run(self):
+        self.loop_thread = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self.monitor = threading.Thread(target=self._monitor, name="loop-watchdog", daemon=True)
+        self.monitor.start()
+
+        lags = []
+        window_end = self.last_beat + WINDOW_SECONDS
+        try:
+            while True:
+                await asyncio.sleep(HEARTBEAT_INTERVAL)
+                now = time.monotonic()
+                lag = max(0.0, now - self.last_beat - HEARTBEAT_INTERVAL)
+                self.last_beat = now
+                lags.append(lag)
+                if self.stall is not None:
+                    self._end_stall(lag)
+
+                if now >= window_end:
+                    window_end = now + WINDOW_SECONDS
+                    self._evaluate(lags)
+                    lags = []
+                    if self.shedding() and self.shed:
+                        await self.shed()
+        finally:
+            self.stopped.set()
+
+    def stats(self):
+        return {
+            "level": self.levels[self.level][0],
+            "lagMs": self.lag * 1000,
+            "maxLagMs": self.max_lag * 1000,
+            "stalls": list(self.stalls)[-5:],
+            "stallsByLocation": dict(self.stall_counts)
+        }
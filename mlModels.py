@@ -1,4 +1,7 @@
 import asyncio
+import os
+import platform
+import random
 import socketio
 import logging
 import cv2
@@ -6,54 +9,124 @@ import numpy as np
 from aiortc import RTCPeerConnection, RTCSessionDescription, MediaStreamTrack
 from aiortc.contrib.media import MediaRelay
 from av import VideoFrame
-from Pushup import PushUpExerciseProcessor
-from crunches import CrunchExerciseProcessor
-from pullup import PullUpExerciseProcessor
-from bicepcurl import BicepCurlExerciseProcessor
+from exercises import get_exercise_processor
+from analytics import RepAnalytics
+from overlay import HudOverlay, SkeletonRenderer
+from tracking import LandmarkPropagator, FLOW_WIDTH
+from admission import admission
+from adaptation import ResolutionController, limit_video_bitrate
+from profiling import session_scope, start_profiler, stop_profiler, profile_duration, profiler_started, DEFAULT_INTERVAL
+from dashboard import DashboardPublisher, subscriber_rate
+from recognition import ExerciseRecognizer
+from motion import MotionGate
+from recording import SessionRecorder
+from loopwatch import LoopWatchdog
+from accounting import SessionAccounting, worker_accounting
+from session import Session, SessionRegistry, SESSION_IDLE_TIMEOUT, release_processors
 import time
 import json
 from aiortc import RTCIceCandidate
 import fractions
+from contextlib import contextmanager
 
-# Initialize WebSocket client for signaling
+# Initialize WebSocket client for signaling. Reconnects start almost
+# immediately and back off exponentially with jitter.
 sio = socketio.AsyncClient(
     logger=True,
     engineio_logger=True,
     reconnection=True,
-    reconnection_attempts=5,
-    reconnection_delay=2,
-    reconnection_delay_max=5
+    reconnection_attempts=0,
+    reconnection_delay=0.25,
+    reconnection_delay_max=5,
+    randomization_factor=0.5
 )
 
-# WebRTC Peer Connection
-pc = None
+# Backoff for the initial connection and for reconnecting after the client gave up
+RECONNECT_BASE_DELAY = 0.25
+RECONNECT_MAX_DELAY = 10.0
+
+# Signaling server the worker connects to
+SIGNALING_URL = os.environ.get("SIGNALING_URL", "http://localhost:5002")
+
+# Shared secret the signaling relay checks before treating this socket as a worker
+WORKER_TOKEN = os.environ.get("WORKER_TOKEN")
+
+# How long a draining worker waits for its sessions to end
+DRAIN_TIMEOUT = float(os.environ.get("WORKER_DRAIN_TIMEOUT", "300"))
+
+# Set while the worker finishes its sessions before exiting
+draining = False
+
+def worker_id():
+    """Stable for the life of the process, the relay pins sessions to it"""
+    return os.environ.get("WORKER_ID") or f"{platform.node()}-{os.getpid()}"
+
+# Live sessions (peer connection, track, tasks) keyed by session id. Offers
+# without a sessionId (a single browser through the Node.js relay) share the
+# default session.
+DEFAULT_SESSION = "default"
+# States that won't be resumed are reported and released by finish_session
+sessions = SessionRegistry(on_discard=lambda session_id, state: finish_session(session_id, state))
 relay = MediaRelay()
 
-# Global state
-current_exercise = "pushup"
-last_feedback_time = 0
-
-def get_exercise_processor(exercise_type):
-    """Returns the appropriate exercise processor based on type"""
-    if exercise_type.lower() == "crunch":
-        return CrunchExerciseProcessor()
-    elif exercise_type.lower() == "pullup":
-        return PullUpExerciseProcessor()
-    elif exercise_type.lower() == "bicepcurl":
-        return BicepCurlExerciseProcessor()
-    else:
-        # Default to pushup processor
-        return PushUpExerciseProcessor()
+# Coalesced per-trainer view of all live sessions
+async def emit_dashboard(payload):
+    if sio.connected:
+        await sio.emit("trainer-dashboard", payload)
+
+dashboard = DashboardPublisher(emit_dashboard)
+
+# Decode-time resize: when set, frames sent to pose inference are scaled and
+# converted to RGB by PyAV in one pass instead of going through full-size BGR
+INFERENCE_WIDTH = int(os.environ.get("INFERENCE_WIDTH", "0"))
+
+# Whether the returned video carries the skeleton and HUD. Without it the
+# incoming frame is sent back untouched and never converted to BGR.
+ANNOTATE_OUTPUT = os.environ.get("ANNOTATE_OUTPUT", "1") != "0"
+
+# Pose backend: "mediapipe" runs each session's own graph, "onnx" batches
+# frames from all sessions through one ONNX Runtime model (see batchpose.py)
+# and "procpool" runs MediaPipe in a pool of processes (see procpool.py)
+POSE_BACKEND = os.environ.get("POSE_BACKEND", "mediapipe")
+if POSE_BACKEND == "onnx":
+    from batchpose import get_pose_backend
+    # The batched backend always takes the decode-time resize path
+    INFERENCE_WIDTH = INFERENCE_WIDTH or 256
+elif POSE_BACKEND == "procpool":
+    from procpool import get_inference_pool, close_inference_pool
+    # Frames must fit a ring slot
+    INFERENCE_WIDTH = INFERENCE_WIDTH or 320
+
+# Landmark propagation on frames that skip pose inference: "off", "flow"
+# (optical flow on the key joints) or "linear" (constant velocity model)
+LANDMARK_PROPAGATION = os.environ.get("LANDMARK_PROPAGATION", "off")
+
+# Skip pose inference on frames with no motion since the last inference and
+# reuse the previous landmarks (see motion.py). Off unless MOTION_GATING=1,
+# it changes which frames are analyzed
+MOTION_GATING = os.environ.get("MOTION_GATING", "0") != "0"
+
+# Record the annotated video of every session (see recording.py). Offers can
+# also ask for it with "record": true.
+RECORD_SESSIONS = os.environ.get("RECORD_SESSIONS", "0") != "0"
+
+# Track attributes carried over when a dropped session reconnects
+RESUMABLE_STATE = (
+    "processors", "processor", "detector", "recognizer", "analytics", "exercise_analytics", "earlier_reps",
+    "exercise_seconds", "exercise_since", "last_analysis", "user_id", "started_at", "accounting"
+)
 
 # Video processing track
 class VideoProcessTrack(MediaStreamTrack):
     """Custom video stream track to process incoming frames."""
     kind = "video"
 
-    def __init__(self, track, exercise_type):
+    def __init__(self, track, exercise_type, session_id=DEFAULT_SESSION, resume=None, record=False, user_id=None):
         super().__init__()
         self.track = relay.subscribe(track)
+        self.session_id = session_id
         self.last_feedback_time = 0
+        self.last_analysis_time = 0
         
         # Initialize last analysis results
         self.last_analysis = {
@@ -75,14 +148,71 @@ class VideoProcessTrack(MediaStreamTrack):
         # Create a task queue for analysis
         self.processing_queue = asyncio.Queue(maxsize=1)
         
-        # Initialize exercise processor
-        self.processor = get_exercise_processor(exercise_type)
+        if resume:
+            # Reconnect of a dropped session: keep its warm pose graphs,
+            # rep count and analyzer state
+            for name in RESUMABLE_STATE:
+                setattr(self, name, resume[name])
+        else:
+            # Trainee and wall clock start, for the workout summary
+            self.user_id = user_id
+            self.started_at = time.time()
+            
+            # Initialize exercise processor. With "auto" the exercise is recognized
+            # from the landmarks and the analyzer is swapped in place.
+            self.processors = {}
+            self.processor = self._get_processor("pushup" if exercise_type == "auto" else exercise_type)
+            self.recognizer = None
+            if exercise_type == "auto":
+                self.recognizer = ExerciseRecognizer()
+            
+            # Pose graph used for inference, kept across exercise switches so
+            # tracking isn't restarted
+            self.detector = self.processor
+            
+            # Per-rep analytics (tempo, range of motion, accuracy), one per
+            # exercise so a circuit keeps the totals of every exercise
+            self.exercise_analytics = {}
+            self.analytics = self._get_analytics(self.processor.exercise_type)
+            
+            # Reps of earlier stints of an exercise, its processor starts over
+            # when the session switches back to it
+            self.earlier_reps = {}
+            
+            # Wall clock seconds spent on each exercise before the current one
+            self.exercise_seconds = {}
+            self.exercise_since = self.started_at
+            
+            # CPU time and latency per stage, by exercise and input resolution
+            self.accounting = SessionAccounting(self.processor.exercise_type)
         
-        # Start the background processing task
-        self.processing_task = asyncio.create_task(self._background_processor())
-
-        # Start a connection monitor task
-        self.connection_monitor = asyncio.create_task(self._monitor_connection())
+        # Cached HUD and lightweight skeleton drawing for the output frame
+        self.hud = HudOverlay()
+        self.skeleton = SkeletonRenderer()
+        
+        # Full-rate landmark signal between inference frames
+        self.propagator = None
+        if LANDMARK_PROPAGATION != "off":
+            self.propagator = LandmarkPropagator(LANDMARK_PROPAGATION)
+        
+        # Motion gate in front of pose inference
+        self.motion_gate = MotionGate() if MOTION_GATING else None
+        
+        # Server-driven sender resolution
+        self.resolution = ResolutionController(session_id)
+        
+        # Monotonic time of the last received frame, for idle detection
+        self.last_frame_time = None
+        
+        # Wall clock arrival time of the frame being handled. Landmarks carry
+        # it instead of the time inference finished, so hold timing and the
+        # feedback latency include decode and inference.
+        self.frame_received_at = None
+        
+        # Background recording, the live path only hands frames over
+        self.recorder = SessionRecorder(session_id) if record else None
+        
+        # The background loops are started by the owning Session
 
     async def _monitor_frame_flow(self):
         """Monitors if frames are flowing and attempts recovery if needed"""
@@ -90,8 +220,8 @@ class VideoProcessTrack(MediaStreamTrack):
             await asyncio.sleep(3)
             
             # If connection is established but no frames received recently
-            current_time = asyncio.get_event_loop().time()
-            if self.connection_phase == "established" and current_time - getattr(self, 'last_frame_time', 0) > 5:
+            current_time = time.monotonic()
+            if self.connection_phase == "established" and current_time - (self.last_frame_time or 0) > 5:
                 print("No frames received recently - attempting recovery")
                 # Emit an event to request frames again
                 if sio.connected:
@@ -103,13 +233,33 @@ class VideoProcessTrack(MediaStreamTrack):
             try:
                 # Get landmarks from queue (will wait if queue is empty)
                 landmarks = await self.processing_queue.get()
+                frame_time = landmarks.timestamp
+                
+                # Route to the analyzer of the recognized exercise
+                if self.recognizer:
+                    with self._stage("analysis"):
+                        detected = self.recognizer.update(landmarks)
+                    if detected:
+                        self.set_exercise(detected, keep_recognizer=True)
+                        asyncio.create_task(send_exercise_detected(
+                            self.session_id, detected, self.recognizer.confidence()))
                 
                 # Process the landmarks
-                analysis = self.processor.analyze_exercise(landmarks)
+                with self._stage("analysis"):
+                    analysis = self.processor.analyze_exercise(landmarks)
+                self.accounting.count("analyzed")
                 
                 # Update the shared analysis results
                 async with self.analysis_lock:
                     self.last_analysis = analysis
+                    self.last_analysis_time = frame_time
+                dashboard.update(self.session_id, analysis, self.rep_counts())
+                
+                # Emit a rep event whenever a rep completes
+                with self._stage("analysis"):
+                    rep_event = self.analytics.update(analysis, frame_time)
+                if rep_event:
+                    asyncio.create_task(send_rep_event(rep_event, self.session_id))
                 
                 # Mark task as done
                 self.processing_queue.task_done()
@@ -121,6 +271,85 @@ class VideoProcessTrack(MediaStreamTrack):
             except Exception as e:
                 await asyncio.sleep(0.1)  # Prevent tight loop on errors
 
+    @contextmanager
+    def _stage(self, stage):
+        """Charge a synchronous block to an accounting stage and its profiler
+        samples to this session. The block must not await."""
+        with session_scope(self.session_id), self.accounting.stage(stage):
+            yield
+
+    def pose_graphs(self):
+        """Number of MediaPipe graphs this track holds open"""
+        return len(self.processors)
+
+    def export_state(self):
+        """Hand the analyzer state to a later track of the same session"""
+        state = {name: getattr(self, name) for name in RESUMABLE_STATE}
+        # Wall clock time of the last frame, where the workout ended if the
+        # session is not resumed
+        state["ended_at"] = time.time() - (time.monotonic() - (self.last_frame_time or time.monotonic()))
+        # The pose graphs belong to the exported state now
+        self.processors = {}
+        return state
+
+    def release(self):
+        """Stop the track and close every pose graph, called by Session.close"""
+        self.stop()
+        self.track.stop()
+        # An exported state keeps its processors, finish_session closes them later
+        if POSE_BACKEND == "procpool" and self.processors:
+            get_inference_pool().close_session(self.session_id)
+        elif POSE_BACKEND == "onnx":
+            get_pose_backend().forget(self.session_id)
+        release_processors(self.processors)
+        self.processor = self.detector = None
+        if self.recorder:
+            self.recorder.close()
+
+    def _get_processor(self, exercise_type):
+        """Processor for an exercise, created once per session"""
+        exercise_type = exercise_type.lower()
+        if exercise_type not in self.processors:
+            self.processors[exercise_type] = get_exercise_processor(exercise_type)
+        return self.processors[exercise_type]
+
+    def _get_analytics(self, exercise_type):
+        """Rep analytics for an exercise, kept for the whole session"""
+        if exercise_type not in self.exercise_analytics:
+            self.exercise_analytics[exercise_type] = RepAnalytics(exercise_type)
+        return self.exercise_analytics[exercise_type]
+
+    def rep_counts(self):
+        """Reps per exercise over the whole session"""
+        return exercise_rep_counts(self.processors, self.earlier_reps)
+
+    def set_exercise(self, exercise_type, keep_recognizer=False):
+        """Switch the analyzer without renegotiating the connection"""
+        if exercise_type == "auto":
+            if self.recognizer is None:
+                self.recognizer = ExerciseRecognizer(self.processor.exercise_type)
+            return
+        if not keep_recognizer:
+            self.recognizer = None
+        
+        processor = self._get_processor(exercise_type)
+        if processor is self.processor:
+            return
+        print(f"Session {self.session_id} switching to {processor.exercise_type}")
+        now = time.time()
+        previous = self.processor.exercise_type
+        self.exercise_seconds[previous] = self.exercise_seconds.get(previous, 0) + now - self.exercise_since
+        self.exercise_since = now
+        # The processor starts over, its reps so far stay in the session totals
+        self.earlier_reps[processor.exercise_type] = (
+            self.earlier_reps.get(processor.exercise_type, 0) + processor.rep_count)
+        processor.reset_state()
+        self.processor = processor
+        self.analytics = self._get_analytics(processor.exercise_type)
+        self.analytics.restart()
+        self.accounting.set_exercise(processor.exercise_type)
+        dashboard.set_exercise(self.session_id, processor.exercise_type)
+
     async def _monitor_connection(self):
         """Monitors connection status and adjusts timeouts accordingly"""
         while True:
@@ -133,9 +362,224 @@ class VideoProcessTrack(MediaStreamTrack):
                 print("Still initializing connection...")
                 self.connection_phase = "connecting"
 
+    def _to_bgr(self, frame):
+        """Convert frame to OpenCV format with error handling"""
+        try:
+            with self._stage("decode"):
+                return frame.to_ndarray(format="bgr24")
+        except Exception as e:
+            print(f"Error converting frame to numpy array: {e}")
+            return np.zeros((480, 640, 3), dtype=np.uint8)
+
+    async def _process_full(self, frame, process_this_frame):
+        """Full-resolution path: BGR conversion, then MediaPipe resizes for inference"""
+        processed_img = self._to_bgr(frame)
+        
+        landmarks = None
+        if process_this_frame:
+            try:
+                with self._stage("decode"):
+                    img_rgb = cv2.cvtColor(processed_img, cv2.COLOR_BGR2RGB)
+                landmarks = await self._detect_landmarks(img_rgb)
+                if landmarks:
+                    with self._stage("overlay"):
+                        self.skeleton.draw(processed_img, landmarks)
+            except Exception as e:
+                print(f"Error processing frame: {e}")
+                # Continue with unprocessed image if processing fails
+        
+        return processed_img, landmarks
+
+    async def _detect_landmarks(self, img_rgb):
+        """Run pose inference on the configured backend, returns a LandmarkFrame or None"""
+        start = time.perf_counter()
+        held = self.accounting.loop_seconds
+        if POSE_BACKEND == "onnx":
+            landmarks = await get_pose_backend().detect(img_rgb, self.session_id)
+        elif POSE_BACKEND == "procpool":
+            landmarks = await get_inference_pool().detect(self.session_id, img_rgb, self.detector.pose_options)
+        else:
+            with self._stage("inference"):
+                landmarks = self.detector.detect_landmarks(img_rgb)
+        elapsed = time.perf_counter() - start
+        # Admission budgets the event loop: awaited backends infer off the
+        # loop, their queueing and inference time is not charged
+        if POSE_BACKEND in ("onnx", "procpool"):
+            admission.record_inference(self.session_id, 0.0)
+        else:
+            admission.record_inference(self.session_id, self.accounting.loop_seconds - held)
+        if landmarks:
+            landmarks.timestamp = self.frame_received_at
+        # Awaited backends infer outside the loop, the session only sees their latency
+        if POSE_BACKEND in ("onnx", "procpool"):
+            self.accounting.add("inference", wall=elapsed)
+        self.accounting.count("inferred")
+        return landmarks
+
+    async def _process_resized(self, frame, process_this_frame):
+        """Decode-time resize path: PyAV scales straight to the inference size in RGB"""
+        landmarks = None
+        
+        if process_this_frame:
+            try:
+                # Keep the aspect ratio, swscale wants even dimensions
+                height = int(frame.height * INFERENCE_WIDTH / frame.width) // 2 * 2
+                with self._stage("decode"):
+                    img_rgb = frame.reformat(width=INFERENCE_WIDTH, height=height, format="rgb24").to_ndarray()
+                landmarks = await self._detect_landmarks(img_rgb)
+            except Exception as e:
+                print(f"Error processing frame: {e}")
+        
+        # Full-resolution image only when the output frame is annotated
+        if not (ANNOTATE_OUTPUT and watchdog.annotate):
+            return None, landmarks
+        
+        processed_img = self._to_bgr(frame)
+        if landmarks:
+            # Landmarks are normalized so they map onto the full-size frame
+            with self._stage("overlay"):
+                self.skeleton.draw(processed_img, landmarks)
+        
+        return processed_img, landmarks
+
+    def _propagate(self, frame, landmarks, process_this_frame):
+        """Update the propagator with known landmarks, estimate them on the other frames"""
+        try:
+            gray = None
+            if self.propagator.needs_image():
+                height = int(frame.height * FLOW_WIDTH / frame.width) // 2 * 2
+                with self._stage("decode"):
+                    gray = frame.reformat(width=FLOW_WIDTH, height=height, format="gray").to_ndarray()
+            
+            # Propagated landmarks stand in for inference
+            with self._stage("inference"):
+                if process_this_frame:
+                    self.propagator.update(landmarks, gray)
+                    return landmarks
+                return self.propagator.propagate(self.frame_received_at, gray)
+        except Exception as e:
+            print(f"Error propagating landmarks: {e}")
+            return landmarks
+
+    async def _handle_frame(self, frame):
+        """Runs inference, analysis handoff and annotation for one received frame"""
+        # Increment frame counter
+        self.frame_count += 1
+        
+        # Process every Nth frame, N is set by admission control QoS and
+        # stretched further while the event loop is lagging
+        interval = admission.sample_interval(self.session_id) * watchdog.sampling_factor
+        process_this_frame = (self.frame_count % interval == 0)
+        
+        # Get current time for feedback timing
+        current_time = asyncio.get_event_loop().time()
+        
+        # Static frames skip inference, motion resuming forces it
+        infer_this_frame = process_this_frame
+        if self.motion_gate:
+            try:
+                with self._stage("decode"):
+                    infer_this_frame = self.motion_gate.should_infer(frame, process_this_frame, self.frame_received_at)
+            except Exception as e:
+                print(f"Error measuring motion: {e}")
+        
+        # Process frame if needed
+        if INFERENCE_WIDTH:
+            processed_img, landmarks = await self._process_resized(frame, infer_this_frame)
+        else:
+            processed_img, landmarks = await self._process_full(frame, infer_this_frame)
+        
+        reused = False
+        if self.motion_gate:
+            if infer_this_frame:
+                self.motion_gate.remember(landmarks)
+            elif process_this_frame:
+                # Nothing moved, analysis keeps its cadence on the last landmarks
+                landmarks = self.motion_gate.reuse(self.frame_received_at)
+                reused = True
+                if landmarks and processed_img is not None:
+                    with self._stage("overlay"):
+                        self.skeleton.draw(processed_img, landmarks)
+        
+        # Fill skipped frames with propagated landmarks. Reused landmarks
+        # rebase the propagator, so the old velocity is not carried on, and
+        # frames the gate finds static are not extrapolated at all
+        if self.propagator:
+            if infer_this_frame or reused:
+                landmarks = self._propagate(frame, landmarks, True)
+            elif not (self.motion_gate and not self.motion_gate.moving):
+                landmarks = self._propagate(frame, landmarks, False)
+        
+        # Add landmarks to processing queue if available
+        if landmarks and not self.processing_queue.full():
+            try:
+                self.processing_queue.put_nowait(landmarks)
+            except asyncio.QueueFull:
+                pass  # Skip if queue is full
+        
+        # Get latest analysis results with lock
+        try:
+            async with self.analysis_lock:
+                analysis = dict(self.last_analysis)
+                analysis_time = self.last_analysis_time
+        except Exception as e:
+            print(f"Error getting analysis: {e}")
+            analysis = {
+                'repCount': 0, 
+                'form': 'Error', 
+                'accuracy': 0, 
+                'position': 'unknown'
+            }
+            analysis_time = 0
+        
+        # Send feedback at a lower frequency
+        if current_time - self.last_feedback_time > 0.5:
+            self.last_feedback_time = current_time
+            asyncio.create_task(send_feedback(analysis, self.session_id, analysis_time, self.rep_counts()))
+        
+        # Nothing to draw on or overlays shed under loop lag, pass the
+        # incoming frame through
+        if processed_img is None or not watchdog.annotate:
+            self.accounting.count("passthrough")
+            if self.recorder:
+                self.recorder.submit_frame(frame, landmarks, analysis, time.time())
+            return frame
+        
+        # Draw feedback on frame (with try/except for safety)
+        try:
+            with self._stage("overlay"):
+                self.hud.render(processed_img, analysis)
+        except Exception as e:
+            print(f"Error drawing text on frame: {e}")
+        self.accounting.count("annotated")
+        
+        # The output frame below is a copy, so the recorder can keep this array
+        if self.recorder:
+            self.recorder.submit(processed_img, time.time())
+        
+        # Convert back to WebRTC-compatible frame
+        try:
+            with self._stage("encode"):
+                new_frame = VideoFrame.from_ndarray(processed_img, format="bgr24")
+            new_frame.pts = frame.pts
+            new_frame.time_base = frame.time_base
+        except Exception as e:
+            print(f"Error creating output frame: {e}")
+            # Return original frame if conversion fails
+            return frame
+        
+        print("Frame processed successfully")
+        return new_frame
+
+    def _on_frame_handled(self, frame, seconds):
+        """Feed the loop time a frame took into sender resolution adaptation"""
+        constraints = self.resolution.record_frame(frame.width, seconds)
+        if constraints:
+            print(f"Requesting {constraints['width']}x{constraints['height']} from session {self.session_id}")
+            asyncio.create_task(send_video_constraints(self.session_id, constraints))
+
     async def recv(self):
         """Receives and processes video frames in real-time with improved error handling."""
-        global last_feedback_time
         print("Attempting to receive frame")
         
         # Set shorter timeout and add retry logic
@@ -155,91 +599,20 @@ class VideoProcessTrack(MediaStreamTrack):
                 frame = await asyncio.wait_for(self.track.recv(), timeout=timeout)
                 print("Frame received successfully")
                 self.frames_received += 1
+                self.last_frame_time = time.monotonic()
+                self.frame_received_at = time.time()
+                self.accounting.frame(frame.width, frame.height)
                 
                 # Store frame timing info for potential future fallbacks
                 self.last_pts = frame.pts
                 self.last_time_base = frame.time_base
                 
-                # Convert frame to OpenCV format with error handling
-                try:
-                    img = frame.to_ndarray(format="bgr24")
-                except Exception as e:
-                    print(f"Error converting frame to numpy array: {e}")
-                    img = np.zeros((480, 640, 3), dtype=np.uint8)
-                
-                # Increment frame counter
-                self.frame_count += 1
-                
-                # Process every Nth frame
-                process_this_frame = (self.frame_count % 5 == 0)
-                
-                # Get current time for feedback timing
-                current_time = asyncio.get_event_loop().time()
-                
-                # Process frame if needed
-                landmarks = None
-                processed_img = img.copy()  # Default to original image
-                
-                if process_this_frame:
-                    try:
-                        processed_img, landmarks = self.processor.process_frame(img)
-                        
-                        # Add landmarks to processing queue if available
-                        if landmarks and not self.processing_queue.full():
-                            try:
-                                self.processing_queue.put_nowait(landmarks)
-                            except asyncio.QueueFull:
-                                pass  # Skip if queue is full
-                        
-                    except Exception as e:
-                        print(f"Error processing frame: {e}")
-                        # Continue with unprocessed image if processing fails
-                
-                # Get latest analysis results with lock
-                try:
-                    async with self.analysis_lock:
-                        analysis = dict(self.last_analysis)
-                except Exception as e:
-                    print(f"Error getting analysis: {e}")
-                    analysis = {
-                        'repCount': 0, 
-                        'form': 'Error', 
-                        'accuracy': 0, 
-                        'position': 'unknown'
-                    }
-                
-                # Draw feedback on frame (with try/except for safety)
-                try:
-                    cv2.putText(processed_img, f"Reps: {analysis['repCount']}", (10, 30),
-                                cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-                    cv2.putText(processed_img, f"Form: {analysis['form']}", (10, 70),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
-                    cv2.putText(processed_img, f"Accuracy: {analysis.get('accuracy', 0):.1f}%", (10, 110),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 0), 2)
-                                
-                    position_str = analysis.get('position', 'unknown')
-                    cv2.putText(processed_img, f"Position: {position_str}", (10, 150),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 255), 2)
-                except Exception as e:
-                    print(f"Error drawing text on frame: {e}")
-                
-                # Send feedback at a lower frequency
-                if current_time - last_feedback_time > 0.5:
-                    last_feedback_time = current_time
-                    asyncio.create_task(send_feedback(analysis))
-                
-                # Convert back to WebRTC-compatible frame
-                try:
-                    new_frame = VideoFrame.from_ndarray(processed_img, format="bgr24")
-                    new_frame.pts = frame.pts
-                    new_frame.time_base = frame.time_base
-                except Exception as e:
-                    print(f"Error creating output frame: {e}")
-                    # Return original frame if conversion fails
-                    return frame
-                
-                print("Frame processed successfully")
-                return new_frame
+                # Only the time this session's stages held the loop counts
+                # against the loop budget, not the awaited off-loop inference
+                held = self.accounting.loop_seconds
+                out_frame = await self._handle_frame(frame)
+                self._on_frame_handled(frame, self.accounting.loop_seconds - held)
+                return out_frame
                 
             except asyncio.TimeoutError:
                 retry_count += 1
@@ -269,48 +642,216 @@ class VideoProcessTrack(MediaStreamTrack):
                 # Short delay before retry
                 await asyncio.sleep(0.1)
 
-async def send_feedback(analysis):
+async def send_feedback(analysis, session_id=DEFAULT_SESSION, frame_time=0, rep_counts=None):
     """Send exercise feedback to Node.js server"""
+    if not sio.connected:
+        return
+    await sio.emit("exercise-feedback", {
+        "sessionId": session_id,
+        "feedback": {
+            "form": analysis["form"],
+            "accuracy": analysis["accuracy"],
+            "position": analysis["position"]
+        },
+        "repCount": analysis["repCount"],
+        # Session totals per exercise, an auto-mode session saves each of them
+        "repCounts": rep_counts or {},
+        "angles": analysis.get("angles", {}),
+        # Wall-clock arrival time of the analyzed frame, for latency tracking
+        "frameTime": frame_time
+    })
+
+async def send_rep_event(rep_event, session_id=DEFAULT_SESSION):
+    """Send per-rep analytics to Node.js server"""
     if sio.connected:
-        await sio.emit("exercise-feedback", {
-            "feedback": {
-                "form": analysis["form"],
-                "accuracy": analysis["accuracy"],
-                "position": analysis["position"]
-            },
-            "repCount": analysis["repCount"],
-            "angles": analysis.get("angles", {})
+        await sio.emit("rep-event", dict(rep_event, sessionId=session_id))
+
+async def send_exercise_detected(session_id, exercise_type, confidence):
+    """Tell the client which exercise is being analyzed now"""
+    if sio.connected:
+        await sio.emit("exercise-detected", {
+            "sessionId": session_id,
+            "exerciseType": exercise_type,
+            "confidence": confidence
         })
 
+async def send_video_constraints(session_id, constraints):
+    """Ask the client to change its sender resolution, frame rate and bitrate"""
+    message = dict(constraints, sessionId=session_id)
+    
+    # Prefer the data channel when the client opened one, it skips the relay
+    session = sessions.get(session_id)
+    channel = getattr(session.pc, "_controlChannel", None) if session else None
+    if channel and channel.readyState == "open":
+        channel.send(json.dumps(dict(message, type="video-constraints")))
+    elif sio.connected:
+        await sio.emit("video-constraints", message)
+
+def get_video_track(session_id):
+    """Returns the processing track of a session if it has one"""
+    session = sessions.get(session_id)
+    return session.track if session else None
+
+def exercise_rep_counts(processors, earlier_reps):
+    """Reps per exercise of a session, from its processors and earlier stints"""
+    counts = dict(earlier_reps)
+    for processor in processors.values():
+        counts[processor.exercise_type] = counts.get(processor.exercise_type, 0) + processor.rep_count
+    return {exercise_type: reps for exercise_type, reps in counts.items() if reps}
+
+def session_summary(session_id, state):
+    """Workout summary of a finished session for the daily rollups, or None.
+    An auto-mode session reports every exercise it went through."""
+    counts = exercise_rep_counts(state["processors"], state["earlier_reps"])
+    if not state.get("user_id") or not counts:
+        return None
+    seconds = dict(state["exercise_seconds"])
+    if state["processor"] is not None:
+        current = state["processor"].exercise_type
+        seconds[current] = seconds.get(current, 0) + state["ended_at"] - state["exercise_since"]
+    return {
+        "sessionId": session_id,
+        "userId": state["user_id"],
+        "exercises": [
+            {
+                "exercise": exercise_type,
+                "repCount": reps,
+                "duration": seconds.get(exercise_type, 0),
+                "accuracy": state["exercise_analytics"][exercise_type].summary()["avgAccuracy"]
+                if exercise_type in state["exercise_analytics"] else 0
+            }
+            for exercise_type, reps in counts.items()
+        ],
+        "startTime": state["started_at"],
+        "stopTime": state["ended_at"]
+    }
+
+async def send_session_summary(summary):
+    if sio.connected:
+        await sio.emit("session-summary", summary)
+
+def finish_session(session_id, state):
+    """Report a session that will not be resumed and close its pose graphs"""
+    summary = session_summary(session_id, state)
+    if summary:
+        asyncio.create_task(send_session_summary(summary))
+    worker_accounting.finish(session_id, state["accounting"], userId=state.get("user_id"),
+                             startTime=state["started_at"], stopTime=state["ended_at"])
+    release_processors(state["processors"])
+    if POSE_BACKEND == "procpool":
+        get_inference_pool().close_session(session_id)
+
+async def close_peer_connection(session_id, reason="", resumable=False):
+    """Tears down a session: tasks, pose graphs, peer connection and capacity.
+    
+    A resumable close keeps the analyzer state and warm pose graphs parked
+    for a reconnect with the same session id.
+    """
+    session = sessions.pop(session_id)
+    if session:
+        # The state is kept either for a reconnect or for the workout summary
+        state = await session.close(reason, keep_state=True)
+        if state and resumable:
+            sessions.park(session_id, state)
+        elif state:
+            sessions.discard(session_id, state)
+    dashboard.unregister(session_id)
+    await admission.release(session_id)
+
+async def shed_newest_session():
+    """Close the most recently opened standard session to relieve the event loop"""
+    for session_id in reversed(list(sessions)):
+        session = sessions.get(session_id)
+        if session and session.tier != "trainer":
+            print(f"Shedding session {session_id}: event loop lag {watchdog.lag * 1000:.0f} ms")
+            # Resumable, so the client keeps its reps when it retries
+            await close_peer_connection(session_id, "loop lag", resumable=True)
+            if sio.connected:
+                await sio.emit("webrtc-rejected", {
+                    "sessionId": session_id,
+                    "reason": "overload",
+                    "retryAfter": admission.retry_after()
+                })
+            return
+
+watchdog = LoopWatchdog(shed=shed_newest_session)
+
+async def reap_idle_sessions():
+    """Closes sessions whose media stopped without the peer connection noticing"""
+    while True:
+        await asyncio.sleep(SESSION_IDLE_TIMEOUT / 3)
+        for session_id in sessions.idle():
+            await close_peer_connection(session_id, "idle timeout", resumable=True)
+        sessions.expire_parked()
+
 @sio.event
 async def connect():
     """Handles WebSocket connection to Node.js"""
-    await sio.emit("connect-python")
+    await sio.emit("connect-python", {"workerId": worker_id(), "draining": draining})
 
 @sio.event
 async def disconnect():
     """Handles WebSocket disconnection."""
-    # Clean up any existing peer connection
-    global pc
-    if pc:
-        await pc.close()
-        pc = None
+    # Media flows peer to peer, so sessions keep running through a signaling
+    # blip. Sessions whose media also stopped are closed by the idle reaper.
+    print(f"Signaling disconnected, keeping {len(sessions)} sessions")
 
 @sio.on("webrtc-offer")
 async def on_offer(data):
     """Receives SDP Offer from Node.js and sends SDP Answer."""
-    global pc, current_exercise
-    
-    # Extract exercise type from offer
+    # Extract exercise type and session from offer
     exercise_type = data.get("exerciseType", "pushup")
-    current_exercise = exercise_type
+    session_id = data.get("sessionId", DEFAULT_SESSION)
     
-    # Close any existing peer connection
-    if pc:
-        await pc.close()
+    # Replace any existing peer connection for this session, keeping its
+    # analyzer state, and pick up state parked after a dropped connection
+    await close_peer_connection(session_id, "renegotiation", resumable=True)
+    resume_state = sessions.resume(session_id)
+    
+    # The relay sets userId from the authenticated socket. A session is only
+    # resumed by the user it belongs to, so nobody else inherits its reps.
+    user_id = data.get("userId")
+    if resume_state and resume_state["user_id"] != user_id:
+        print(f"Not resuming session {session_id}: it belongs to another user")
+        sessions.discard(session_id, resume_state)
+        resume_state = None
+    
+    # A draining worker only takes its own sessions back
+    if draining and resume_state is None:
+        await sio.emit("webrtc-rejected", {"sessionId": session_id, "reason": "draining", "retryAfter": 1})
+        return
+    
+    # Trainer-led sessions keep full rate when the worker is loaded. The relay
+    # sets trainerId from the authenticated trainee's record, clients can't claim it.
+    tier = "trainer" if data.get("trainerId") else "standard"
+    record = bool(data.get("record", RECORD_SESSIONS))
+    
+    # Queue or reject the offer when the worker is at capacity
+    if not admission.has_capacity():
+        await sio.emit("webrtc-queued", {"sessionId": session_id, **admission.stats()})
+    if not await admission.admit(session_id, tier):
+        print(f"Rejecting session {session_id}: worker at capacity")
+        if resume_state:
+            sessions.park(session_id, resume_state)
+        await sio.emit("webrtc-rejected", {
+            "sessionId": session_id,
+            "reason": "capacity",
+            "retryAfter": admission.retry_after()
+        })
+        return
     
     # Create new peer connection
     pc = RTCPeerConnection()
+    session = Session(session_id, pc, tier)
+    session.resume_state = resume_state
+    sessions.add(session)
+    dashboard.register(
+        session_id,
+        trainer_id=data.get("trainerId"),
+        group_id=data.get("groupId"),
+        trainee_id=data.get("userId"),
+        exercise=exercise_type
+    )
     
     # Set up track event handler
     @pc.on("track")
@@ -318,16 +859,19 @@ async def on_offer(data):
         if track.kind == "video":
             print("received video track")
             # Create video processing track with the specified exercise type
-            processed_track = VideoProcessTrack(track, exercise_type)
+            processed_track = VideoProcessTrack(
+                track, exercise_type, session_id, session.take_resume_state(), record=record, user_id=user_id
+            )
             pc.addTrack(processed_track)
-            # Store reference to track for easier access
-            pc._videoProcessTrack = processed_track
-            # Start the frame flow monitor
-            asyncio.create_task(processed_track._monitor_frame_flow())
+            # The session owns the track and starts its background loops
+            session.attach(processed_track)
     
     # Set up data channel for additional communication
     @pc.on("datachannel")
     def on_datachannel(channel):
+        # Keep the channel for worker-to-client control messages
+        pc._controlChannel = channel
+        
         @channel.on("message")
         def on_message(message):
             pass
@@ -340,6 +884,14 @@ async def on_offer(data):
             # Wait a moment for media to start flowing
             await asyncio.sleep(1)
             print("WebRTC connection fully established")
+        elif pc.connectionState in ("failed", "closed"):
+            # Give the capacity back as soon as the peer goes away
+            if sessions.get(session_id) is session:
+                await close_peer_connection(
+                    session_id,
+                    f"connection {pc.connectionState}",
+                    resumable=pc.connectionState == "failed"
+                )
         
     # Process SDP offer
     offer = RTCSessionDescription(sdp=data["sdp"], type=data["type"])
@@ -349,10 +901,18 @@ async def on_offer(data):
     answer = await pc.createAnswer()
     await pc.setLocalDescription(answer)
     
-    # Send SDP Answer back to Node.js
+    # Request the sender settings we want at negotiation time: the bitrate
+    # cap goes into the SDP, the resolution and frame rate ride along
+    constraints = ResolutionController(session_id).constraints()
+    
+    # Send SDP Answer back to Node.js, a resumed session keeps its rep count
     await sio.emit("webrtc-answer", {
         "type": "answer", 
-        "sdp": pc.localDescription.sdp
+        "sdp": limit_video_bitrate(pc.localDescription.sdp, constraints["maxBitrate"]),
+        "sessionId": session_id,
+        "videoConstraints": constraints,
+        "resumed": resume_state is not None,
+        "repCount": resume_state["last_analysis"].get("repCount", 0) if resume_state else 0
     })
 
 @sio.on("ice-candidate")
@@ -396,20 +956,105 @@ async def on_ice_candidate(data):
                 type=candidate_type
             )
             
-            # Pass the candidate to the PeerConnection
-            await pc.addIceCandidate(candidate)
+            # Pass the candidate to the session's PeerConnection
+            session = sessions.get(data.get("sessionId", DEFAULT_SESSION))
+            if session:
+                await session.pc.addIceCandidate(candidate)
         except Exception as e:
             print(f"Error adding ICE candidate: {e}")
             
+@sio.on("profiler-start")
+async def on_profiler_start(data):
+    """Admin request to start sampling a single session or the whole worker"""
+    data = data if isinstance(data, dict) else {}
+    session_id = data.get("sessionId")
+    try:
+        interval = float(data.get("interval", DEFAULT_INTERVAL))
+    except (TypeError, ValueError):
+        interval = DEFAULT_INTERVAL
+    started = start_profiler(session_id, interval)
+    print(f"Profiler {'started' if started else 'already running'} for {session_id or 'worker'}")
+    if not started:
+        return
+    
+    # Always stopped automatically so a forgotten profiler doesn't run forever
+    started_at = profiler_started()
+    await asyncio.sleep(profile_duration(data.get("duration")))
+    await stop_and_report_profiler(started_at)
+
+@sio.on("profiler-stop")
+async def on_profiler_stop(data):
+    """Admin request to stop sampling and dump folded stacks"""
+    await stop_and_report_profiler()
+
+async def stop_and_report_profiler(started_at=None):
+    result = stop_profiler(started_at)
+    if result is None:
+        return
+    path, samples = result
+    print(f"Profiler stopped, {samples} samples written to {path}")
+    if sio.connected:
+        await sio.emit("profiler-result", {"path": os.path.abspath(path), "samples": samples})
+
+@sio.on("exercise-change")
+async def on_exercise_change(data):
+    """Switch a running session to another exercise or to "auto" """
+    if not isinstance(data, dict) or not data.get("exerciseType"):
+        return
+    track = get_video_track(data.get("sessionId", DEFAULT_SESSION))
+    if track:
+        track.set_exercise(data["exerciseType"])
+
+@sio.on("dashboard-subscribe")
+async def on_dashboard_subscribe(data):
+    """A trainer dashboard starts following a trainer's or a group's sessions"""
+    if not isinstance(data, dict) or not data.get("subscriberId"):
+        return
+    subscribed = dashboard.subscribe(
+        data["subscriberId"],
+        trainer_id=data.get("trainerId"),
+        group_id=data.get("groupId"),
+        max_rate=subscriber_rate(data.get("maxRate"))
+    )
+    if not subscribed:
+        print(f"Ignoring dashboard subscription {data['subscriberId']} without a trainer or group")
+
+@sio.on("dashboard-unsubscribe")
+async def on_dashboard_unsubscribe(data):
+    if isinstance(data, dict):
+        dashboard.unsubscribe(data.get("subscriberId"))
+
+@sio.on("session-stats")
+async def on_session_stats(data):
+    """Live session, task and pose graph counts for leak checks"""
+    stats = sessions.stats()
+    if POSE_BACKEND == "procpool":
+        stats["inferencePool"] = get_inference_pool().stats()
+    stats["loopLag"] = watchdog.stats()
+    recorders = {}
+    accounting = {}
+    for session_id in sessions:
+        track = get_video_track(session_id)
+        if track and track.recorder:
+            recorders[session_id] = track.recorder.stats()
+        if track:
+            accounting[session_id] = track.accounting.summary()
+    if recorders:
+        stats["recordings"] = recorders
+    stats["accounting"] = {"sessions": accounting, "ended": worker_accounting.stats()}
+    if sio.connected:
+        await sio.emit("worker-stats", stats)
+
 @sio.on("frames-ready")
 async def on_frames_ready(data):
     """Handle notification that frames are ready to flow"""
     print("Client reports frames are ready to flow")
-    global pc
     # Reset any frame timeouts or counters that might be causing delays
-    if pc and hasattr(pc, "_videoProcessTrack") and pc._videoProcessTrack:
-        pc._videoProcessTrack.frames_received = 0
-        pc._videoProcessTrack.connection_phase = "ready"
+    session_id = data.get("sessionId", DEFAULT_SESSION) if isinstance(data, dict) else DEFAULT_SESSION
+    track = get_video_track(session_id)
+    if track:
+        track.frames_received = 0
+        track.connection_phase = "ready"
         print("Reset frame reception counters")
 
 @sio.on("connection-ready") 
@@ -417,9 +1062,10 @@ async def on_connection_ready(data):
     """Handle notification that WebRTC connection is fully established"""
     print("Client reports WebRTC connection is fully established")
     # Any initialization needed for a smooth start
-    global pc
-    if pc and hasattr(pc, "_videoProcessTrack") and pc._videoProcessTrack:
-        pc._videoProcessTrack.connection_phase = "established"
+    session_id = data.get("sessionId", DEFAULT_SESSION) if isinstance(data, dict) else DEFAULT_SESSION
+    track = get_video_track(session_id)
+    if track:
+        track.connection_phase = "established"
         print("Set connection phase to established")            
             
             
@@ -427,47 +1073,77 @@ async def connect_to_server():
     """Connects to the WebSocket signaling server."""
     try:
         await sio.connect(
-            "http://localhost:5002",
+            SIGNALING_URL,
             socketio_path="/socket.io/",
             transports=["websocket"],
+            auth={"workerToken": WORKER_TOKEN} if WORKER_TOKEN else None,
             wait_timeout=15
         )
         return True
     except socketio.exceptions.ConnectionError as e:
         return False
 
+def backoff_delays(base=RECONNECT_BASE_DELAY, cap=RECONNECT_MAX_DELAY):
+    """Exponential backoff with full jitter, so restarted workers don't retry in lockstep"""
+    attempt = 0
+    while True:
+        yield random.uniform(0, min(cap, base * 2 ** attempt))
+        attempt += 1
 
+async def connect_with_backoff():
+    """Keeps trying to reach the signaling server until it succeeds"""
+    for delay in backoff_delays():
+        if await connect_to_server():
+            return
+        print(f"Signaling server unreachable, retrying in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+async def drain(timeout=DRAIN_TIMEOUT):
+    """Stop taking new sessions and wait for the live ones to end"""
+    global draining
+    draining = True
+    print(f"Draining {len(sessions)} sessions")
+    if sio.connected:
+        await sio.emit("worker-draining")
+    deadline = time.monotonic() + timeout
+    while len(sessions) and time.monotonic() < deadline:
+        await asyncio.sleep(1)
 
 async def main():
     """Main function to initiate WebSocket connection and keep it alive."""
-    connected = False
-    retry_count = 0
+    if POSE_BACKEND == "procpool":
+        # Start the inference processes before any session needs them
+        get_inference_pool()
+    elif POSE_BACKEND == "onnx":
+        # Fails right away for a model that did not pass the accuracy check
+        get_pose_backend()
     
-    while not connected and retry_count < 5:
-        connected = await connect_to_server()
-        if not connected:
-            retry_count += 1
-            await asyncio.sleep(20)
+    await connect_with_backoff()
     
-    if not connected:
-        return
+    dashboard_task = asyncio.create_task(dashboard.run())
+    reaper_task = asyncio.create_task(reap_idle_sessions())
+    watchdog_task = asyncio.create_task(watchdog.run())
         
     try:
-        # Keep connection alive
+        # Keep connection alive: the client reconnects on its own, wait()
+        # only returns once it has given up
         while True:
-            await asyncio.sleep(30)  # Keep-alive check
-            if not sio.connected:
-                await connect_to_server()
+            await sio.wait()
+            await connect_with_backoff()
     except asyncio.CancelledError:
         pass
     except KeyboardInterrupt:
         pass
     finally:
         # Cleanup
-        global pc
-        if pc:
-            await pc.close()
-            pc = None
+        dashboard_task.cancel()
+        reaper_task.cancel()
+        watchdog_task.cancel()
+        for session_id in sessions:
+            await close_peer_connection(session_id, "shutdown")
+        sessions.release_parked()
+        if POSE_BACKEND == "procpool":
+            close_inference_pool()
             
         if sio.connected:
             await sio.disconnect()
@@ -0,0 +1,87 @@
+import os
+
+import cv2
+import numpy as np
+
+# Width of the grayscale thumbnail motion is measured on
+MOTION_WIDTH = 64
+
+# A thumbnail pixel counts as changed past this many gray levels, and a frame
+# is moving when this share of pixels changed since the last inference
+PIXEL_DELTA = 15
+MOTION_THRESHOLD = float(os.environ.get("MOTION_THRESHOLD", "0.01"))
+
+# Re-run inference at least this often while static, so slow drift and
+# lighting changes can't keep stale landmarks around forever
+MAX_IDLE_SECONDS = 2.0
+
+
+class MotionGate:
+    """Skips pose inference on frames that barely differ from the last inferred one.
+
+    Each frame is scaled to a tiny grayscale thumbnail by PyAV and compared
+    with the thumbnail of the frame that last went through inference. While
+    the trainee is still, scheduled inference is skipped and the previous
+    landmarks are reused; the first frame that moves again is inferred right
+    away, even if it is off the sampling schedule.
+    """
+
+    def __init__(self, threshold=MOTION_THRESHOLD, max_idle=MAX_IDLE_SECONDS):
+        self.threshold = threshold
+        self.max_idle = max_idle
+        self.reference = None
+        self.last_landmarks = None
+        self.last_inference = 0
+        self.moving = True
+        self.motion = 1.0
+
+        # Counters for the share of inference saved
+        self.inferred = 0
+        self.skipped = 0
+
+    def _thumbnail(self, frame):
+        height = max(2, int(frame.height * MOTION_WIDTH / frame.width) // 2 * 2)
+        return frame.reformat(width=MOTION_WIDTH, height=height, format="gray").to_ndarray()
+
+    def should_infer(self, frame, scheduled, timestamp):
+        """Decide whether this frame needs pose inference"""
+        thumbnail = self._thumbnail(frame)
+        if self.reference is None or self.reference.shape != thumbnail.shape:
+            self.motion = 1.0
+        else:
+            self.motion = float(np.count_nonzero(cv2.absdiff(thumbnail, self.reference) > PIXEL_DELTA)) / thumbnail.size
+
+        moving = self.motion >= self.threshold
+        if moving:
+            # Motion resuming forces inference, otherwise follow the schedule
+            infer = scheduled or not self.moving
+        else:
+            infer = scheduled and timestamp - self.last_inference >= self.max_idle
+        self.moving = moving
+
+        if infer:
+            self.reference = thumbnail
+            self.last_inference = timestamp
+            self.inferred += 1
+        elif scheduled:
+            self.skipped += 1
+        return infer
+
+    def remember(self, landmarks):
+        """Keep the result of an inference for reuse on static frames"""
+        self.last_landmarks = landmarks
+
+    def reuse(self, timestamp):
+        """The last landmarks restamped for a skipped frame, or None"""
+        if self.last_landmarks is None:
+            return None
+        return self.last_landmarks.copy(timestamp)
+
+    def stats(self):
+        scheduled = self.inferred + self.skipped
+        return {
+            "inferred": self.inferred,
+            "skipped": self.skipped,
+            "skipRatio": self.skipped / scheduled if scheduled else 0,
+            "motion": self.motion
+        }
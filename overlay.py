@@ -0,0 +1,89 @@
+import cv2
+import numpy as np
+import mediapipe as mp
+
+POSE_CONNECTIONS = np.array(sorted(mp.solutions.pose.POSE_CONNECTIONS), dtype=np.int32)
+VISIBILITY_THRESHOLD = 0.5
+
+# HUD lines: label, value formatter, baseline y, font scale, BGR color
+HUD_LINES = [
+    ("Reps", lambda a: f"{a['repCount']}", 30, 1, (0, 255, 0)),
+    ("Form", lambda a: f"{a['form']}", 70, 0.7, (0, 255, 255)),
+    ("Accuracy", lambda a: f"{a.get('accuracy', 0):.1f}%", 110, 0.7, (255, 255, 0)),
+    ("Position", lambda a: f"{a.get('position', 'unknown')}", 150, 0.7, (255, 0, 255)),
+]
+HUD_MARGIN = 10
+
+
+class HudOverlay:
+    """Caches the rendered HUD and only re-rasterizes text when values change.
+
+    The text is drawn once into a small sprite with a mask of the lit pixels.
+    Every frame then only copies those pixels into the top-left corner.
+    """
+
+    def __init__(self):
+        self.key = None
+        self.sprite = None
+        self.mask = None
+
+    def _render_sprite(self, texts):
+        sizes = [cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, 2)
+                 for text, (_, _, _, scale, _) in zip(texts, HUD_LINES)]
+        width = HUD_MARGIN + max(w for (w, _), _ in sizes) + 2
+        height = HUD_LINES[-1][2] + max(baseline for _, baseline in sizes) + 2
+
+        sprite = np.zeros((height, width, 3), dtype=np.uint8)
+        for text, (_, _, y, scale, color) in zip(texts, HUD_LINES):
+            cv2.putText(sprite, text, (HUD_MARGIN, y), cv2.FONT_HERSHEY_SIMPLEX, scale, color, 2)
+
+        self.sprite = sprite
+        self.mask = sprite.any(axis=2)
+
+    def render(self, img, analysis):
+        """Blend the HUD for this analysis into the frame in place"""
+        texts = [f"{label}: {value(analysis)}" for label, value, _, _, _ in HUD_LINES]
+        key = tuple(texts)
+        if key != self.key:
+            self._render_sprite(texts)
+            self.key = key
+
+        # Clip the sprite to the frame for very small inputs
+        h = min(self.sprite.shape[0], img.shape[0])
+        w = min(self.sprite.shape[1], img.shape[1])
+        roi = img[:h, :w]
+        np.copyto(roi, self.sprite[:h, :w], where=self.mask[:h, :w, None])
+        return img
+
+
+class SkeletonRenderer:
+    """Draws the pose skeleton with two vectorized OpenCV calls.
+
+    mp_draw.draw_landmarks walks every landmark and connection in Python and
+    draws each circle and line separately; here all bones go through a
+    single polylines call and all joints through a second one.
+    """
+
+    def __init__(self, line_color=(255, 255, 255), joint_color=(0, 0, 255), thickness=2, joint_size=6):
+        self.line_color = line_color
+        self.joint_color = joint_color
+        self.thickness = thickness
+        self.joint_size = joint_size
+
+    def draw(self, img, landmarks):
+        """Draw a LandmarkFrame onto a BGR frame of any resolution"""
+        h, w = img.shape[:2]
+        coords = landmarks.coords
+        points = (coords[:, :2] * (w, h)).astype(np.int32)
+        visible = coords[:, 3] >= VISIBILITY_THRESHOLD
+
+        bones = POSE_CONNECTIONS[visible[POSE_CONNECTIONS[:, 0]] & visible[POSE_CONNECTIONS[:, 1]]]
+        if len(bones):
+            cv2.polylines(img, list(points[bones]), False, self.line_color, self.thickness)
+
+        joints = points[visible]
+        if len(joints):
+            # A zero-length polyline with a thick pen renders as a dot
+            cv2.polylines(img, list(np.repeat(joints[:, None, :], 2, axis=1)), False,
+                          self.joint_color, self.joint_size)
+        return img
@@ -0,0 +1,278 @@
+"""
+Pipelined processing of recorded workout videos.
+
+Decoding, color conversion, pose inference and analysis each run on their own
+thread, connected by bounded queues. OpenCV and MediaPipe release the GIL in
+native code, so the stages overlap and a long recording takes about as long
+as its slowest stage instead of the sum of all of them. The bounded queues
+keep memory flat: a fast decoder blocks once it is a few frames ahead.
+
+Usage: python pipeline.py <video> [--exercise pushup] [--display]
+"""
+import argparse
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+from analytics import RepAnalytics
+from exercises import get_exercise_processor
+
+QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", "8"))
+REPORT_INTERVAL = 5.0  # Seconds between progress lines
+
+_DONE = object()
+
+
+class StageError(Exception):
+    """Raised on the consumer side when a pipeline stage failed"""
+
+
+class Stage:
+    """One step of the pipeline running on its own thread"""
+
+    def __init__(self, name, func):
+        self.name = name
+        self.func = func
+        self.items = 0
+        self.busy = 0.0  # Seconds spent inside func
+
+    def stats(self, elapsed):
+        return {
+            "stage": self.name,
+            "items": self.items,
+            "busySeconds": round(self.busy, 3),
+            # Rate the stage could sustain on its own vs the share of wall time it was working
+            "fps": round(self.items / self.busy, 1) if self.busy else 0,
+            "utilization": round(self.busy / elapsed, 3) if elapsed else 0
+        }
+
+
+class Pipeline:
+    """Feeds items from a source through a chain of stages, in order.
+
+    Each stage takes an item and returns the item for the next stage, or
+    None to drop it. Iterating the pipeline yields the output of the last
+    stage on the caller's thread, which is where anything that must stay
+    on the main thread (cv2.imshow) belongs.
+    """
+
+    def __init__(self, source, stages, queue_size=QUEUE_SIZE):
+        self.source = Stage("decode", None)
+        self.source_iter = source
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+        self.stop_event = threading.Event()
+        self.threads = []
+        self.start_time = None
+        self.end_time = None
+
+    def _put(self, q, item):
+        """Blocking put that gives up when the pipeline is being closed"""
+        while not self.stop_event.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run_source(self):
+        out = self.queues[0]
+        iterator = iter(self.source_iter)
+        try:
+            while not self.stop_event.is_set():
+                start = time.perf_counter()
+                item = next(iterator, _DONE)
+                self.source.busy += time.perf_counter() - start
+                if item is _DONE:
+                    break
+                self.source.items += 1
+                if not self._put(out, item):
+                    return
+        except Exception as e:
+            self._put(out, StageError(f"decode: {e}"))
+            return
+        finally:
+            # Lets a generator source release its capture when stopped early
+            if hasattr(iterator, "close"):
+                iterator.close()
+        self._put(out, _DONE)
+
+    def _run_stage(self, stage, inbox, out):
+        while True:
+            item = inbox.get()
+            if item is _DONE or isinstance(item, StageError):
+                self._put(out, item)
+                return
+            try:
+                start = time.perf_counter()
+                result = stage.func(item)
+                stage.busy += time.perf_counter() - start
+            except Exception as e:
+                self._put(out, StageError(f"{stage.name}: {e}"))
+                return
+            stage.items += 1
+            if result is not None and not self._put(out, result):
+                return
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        self.threads = [threading.Thread(target=self._run_source, name="pipeline-decode", daemon=True)]
+        for i, stage in enumerate(self.stages):
+            self.threads.append(threading.Thread(
+                target=self._run_stage,
+                args=(stage, self.queues[i], self.queues[i + 1]),
+                name=f"pipeline-{stage.name}",
+                daemon=True
+            ))
+        for thread in self.threads:
+            thread.start()
+
+    def __iter__(self):
+        if self.start_time is None:
+            self.start()
+        try:
+            while True:
+                item = self.queues[-1].get()
+                if item is _DONE:
+                    break
+                if isinstance(item, StageError):
+                    raise item
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+        """Stop all stages, also used when the consumer quits early"""
+        self.stop_event.set()
+        # Unblock stages waiting on an input queue
+        for q in self.queues:
+            try:
+                q.put_nowait(_DONE)
+            except queue.Full:
+                pass
+        for thread in self.threads:
+            thread.join(timeout=1)
+        if self.end_time is None:
+            self.end_time = time.perf_counter()
+
+    def elapsed(self):
+        if self.start_time is None:
+            return 0
+        return (self.end_time or time.perf_counter()) - self.start_time
+
+    def stats(self):
+        """Per-stage throughput; the stage with the highest utilization is the bottleneck"""
+        elapsed = self.elapsed()
+        stages = [self.source.stats(elapsed)] + [stage.stats(elapsed) for stage in self.stages]
+        return {
+            "elapsed": round(elapsed, 3),
+            "frames": self.source.items,
+            "fps": round(self.source.items / elapsed, 1) if elapsed else 0,
+            "stages": stages,
+            "queueDepths": [q.qsize() for q in self.queues]
+        }
+
+
+def video_source(path):
+    """Yields {"index", "timestamp", "bgr"} for each frame of a video file"""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"Cannot open video {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    index = 0
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            # Media time rather than wall time, so analysis is independent of processing speed
+            yield {"index": index, "timestamp": index / fps, "bgr": frame}
+            index += 1
+    finally:
+        cap.release()
+
+
+def convert_stage(item):
+    item["rgb"] = cv2.cvtColor(item["bgr"], cv2.COLOR_BGR2RGB)
+    return item
+
+
+def inference_stage(detect_landmarks, keep_image=False):
+    """Pose inference stage around a detect_landmarks(img_rgb) callable"""
+    def infer(item):
+        landmarks = detect_landmarks(item.pop("rgb"))
+        if landmarks is not None:
+            landmarks.timestamp = item["timestamp"]
+        item["landmarks"] = landmarks
+        if not keep_image:
+            del item["bgr"]
+        return item
+    return infer
+
+
+def analyze_video(path, exercise_type="pushup", display=False, queue_size=QUEUE_SIZE):
+    """Runs a whole video through the pipeline, returns rep events and stage stats"""
+    processor = get_exercise_processor(exercise_type)
+    analytics = RepAnalytics(exercise_type)
+    rep_events = []
+
+    def analyze(item):
+        landmarks = item["landmarks"]
+        if landmarks is not None:
+            item["analysis"] = processor.analyze_exercise(landmarks)
+            rep_event = analytics.update(item["analysis"], landmarks.timestamp)
+            if rep_event:
+                rep_events.append(rep_event)
+        return item
+
+    pipeline = Pipeline(video_source(path), [
+        Stage("convert", convert_stage),
+        Stage("infer", inference_stage(processor.detect_landmarks, keep_image=display)),
+        Stage("analyze", analyze)
+    ], queue_size=queue_size)
+
+    next_report = time.perf_counter() + REPORT_INTERVAL
+    for item in pipeline:
+        if display:
+            analysis = item.get("analysis")
+            if analysis:
+                cv2.putText(item["bgr"], f'Reps: {analysis["repCount"]}', (20, 50),
+                            cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 255), 2, cv2.LINE_AA)
+            cv2.imshow("FitTrack Pipeline", item["bgr"])
+            if cv2.waitKey(1) & 0xFF == ord("q"):
+                break
+
+        if time.perf_counter() >= next_report:
+            next_report += REPORT_INTERVAL
+            stats = pipeline.stats()
+            print(f"{stats['frames']} frames, {stats['fps']} fps, queues {stats['queueDepths']}")
+
+    if display:
+        cv2.destroyAllWindows()
+
+    return {"reps": rep_events, "summary": analytics.summary(), "pipeline": pipeline.stats()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze a recorded workout with a pipelined reader")
+    parser.add_argument("video")
+    parser.add_argument("--exercise", default="pushup")
+    parser.add_argument("--display", action="store_true")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE)
+    args = parser.parse_args()
+
+    result = analyze_video(args.video, args.exercise, args.display, args.queue_size)
+    stats = result["pipeline"]
+    print(f"Processed {stats['frames']} frames in {stats['elapsed']}s ({stats['fps']} fps)")
+    for stage in stats["stages"]:
+        print(f"  {stage['stage']:<8} {stage['items']:>7} items  {stage['fps']:>8} fps  "
+              f"{stage['utilization'] * 100:5.1f}% busy")
+    print(f"Reps: {result['summary']['reps']}, avg accuracy {result['summary']['avgAccuracy']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+Prefork supervisor for mlModels.py workers.
+
+The supervisor imports mlModels (and with it MediaPipe, OpenCV, aiortc and
+NumPy) once, reads the pose model files into the page cache and forks the
+workers from that state, so the imported code and data are shared
+copy-on-write instead of loaded by every worker. gc.freeze() moves the
+preloaded objects out of the collector's reach, otherwise the first
+collection in a child would touch and copy their pages.
+
+Pose graphs and ONNX Runtime sessions are not created before the fork: both
+start threads, which do not survive it. They are per session or per worker
+anyway, and their model files are already in the page cache when a child
+builds them. With POSE_BACKEND=procpool every child starts its own inference
+pool, so set POSE_POOL_WORKERS to split the cores between them.
+
+Every child is a normal worker with its own signaling connection and worker
+id. The supervisor restarts children that die, backing off when they crash
+right after start, and recycles a child once it has opened
+WORKER_MAX_SESSIONS sessions or its private memory exceeds WORKER_MAX_RSS_MB:
+the replacement is started first, then the old child drains (no new
+sessions, live ones run to their end) and exits.
+
+Usage:
+    python prefork.py --workers 4
+"""
+import argparse
+import asyncio
+import gc
+import glob
+import multiprocessing
+import os
+import random
+import signal
+import time
+
+import mlModels
+
+WORKER_PROCESSES = int(os.environ.get("WORKER_PROCESSES", "0")) or max(1, (os.cpu_count() or 2) // 2)
+WORKER_MAX_SESSIONS = int(os.environ.get("WORKER_MAX_SESSIONS", "0"))  # 0: no limit
+WORKER_MAX_RSS_MB = float(os.environ.get("WORKER_MAX_RSS_MB", "0"))  # 0: no limit
+
+CHECK_INTERVAL = 1.0
+REPORT_INTERVAL = 1.0
+
+# Children that exit sooner than this after start count as crash looping
+MIN_UPTIME = 10.0
+MAX_RESTART_DELAY = 30.0
+
+# Time a draining child gets on top of its drain timeout before it is killed
+KILL_GRACE = 10.0
+
+
+def model_files():
+    """Pose model files the workers will load"""
+    import mediapipe as mp
+    root = os.path.dirname(mp.__file__)
+    files = glob.glob(os.path.join(root, "modules", "pose_*", "*.tflite"))
+    if mlModels.POSE_BACKEND == "onnx":
+        from batchpose import POSE_MODEL_PATH
+        files.append(POSE_MODEL_PATH)
+    return [path for path in files if os.path.isfile(path)]
+
+
+def warm_models():
+    """Read the model files once so every child maps them from the page cache"""
+    total = 0
+    for path in model_files():
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(1 << 20)
+                if not chunk:
+                    break
+                total += len(chunk)
+    return total
+
+
+def private_memory_mb(pid):
+    """Memory a child does not share with its siblings, in MB"""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            kb = sum(int(line.split()[1]) for line in f if line.startswith("Private_"))
+        return kb / 1024
+    except (OSError, ValueError):
+        pass
+    # No smaps_rollup (older kernels): resident size, which overstates it
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0
+
+
+async def _child_run(opened):
+    loop = asyncio.get_running_loop()
+    worker_task = asyncio.create_task(mlModels.main())
+
+    async def drain_and_stop():
+        await mlModels.drain()
+        worker_task.cancel()
+
+    drain_task = None
+
+    def on_term():
+        nonlocal drain_task
+        if drain_task is None:
+            drain_task = asyncio.create_task(drain_and_stop())
+
+    loop.add_signal_handler(signal.SIGTERM, on_term)
+
+    while not worker_task.done():
+        opened.value = mlModels.sessions.opened
+        await asyncio.wait({worker_task}, timeout=REPORT_INTERVAL)
+
+
+def _child_main(index, opened):
+    """Worker process entry point, runs mlModels.main() until drained"""
+    # Forked children start from the supervisor's random state
+    random.seed()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The supervisor handles Ctrl-C
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # Worker ids must be unique, the relay pins sessions to them
+    if os.environ.get("WORKER_ID"):
+        os.environ["WORKER_ID"] = f"{os.environ['WORKER_ID']}-{os.getpid()}"
+
+    print(f"Worker {index} started as pid {os.getpid()}")
+    try:
+        asyncio.run(_child_run(opened))
+    except KeyboardInterrupt:
+        pass
+
+
+class Child:
+    """One forked worker and its bookkeeping"""
+
+    def __init__(self, context, index):
+        self.index = index
+        self.opened = context.Value("i", 0, lock=False)
+        self.process = context.Process(target=_child_main, args=(index, self.opened),
+                                       name=f"worker-{index}")
+        self.process.start()
+        self.started = time.monotonic()
+        self.stopping_at = None  # Set once asked to drain
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    def stop(self):
+        """Ask the child to drain and exit"""
+        if self.stopping_at is None and self.process.is_alive():
+            self.stopping_at = time.monotonic()
+            os.kill(self.pid, signal.SIGTERM)
+
+
+class Supervisor:
+    """Keeps a fixed number of forked workers alive and recycles worn ones"""
+
+    def __init__(self, workers=WORKER_PROCESSES, max_sessions=WORKER_MAX_SESSIONS,
+                 max_rss_mb=WORKER_MAX_RSS_MB):
+        self.context = multiprocessing.get_context("fork")
+        self.workers = workers
+        self.max_sessions = max_sessions
+        self.max_rss_mb = max_rss_mb
+        self.slots = [None] * workers
+        self.retiring = []  # Children draining after being replaced
+        self.restart_delay = [0.0] * workers
+        self.restart_at = [0.0] * workers
+        self.running = True
+
+        # Counters
+        self.restarts = 0
+        self.recycles = 0
+
+    def _start(self, index):
+        self.slots[index] = Child(self.context, index)
+
+    def _worn_out(self, child):
+        """Reason to recycle a child, or None"""
+        if self.max_sessions and child.opened.value >= self.max_sessions:
+            return f"opened {child.opened.value} sessions"
+        if self.max_rss_mb:
+            private = private_memory_mb(child.pid)
+            if private > self.max_rss_mb:
+                return f"private memory {private:.0f} MB"
+        return None
+
+    def _check(self):
+        now = time.monotonic()
+        for index, child in enumerate(self.slots):
+            if child is None:
+                if now >= self.restart_at[index]:
+                    self._start(index)
+                continue
+
+            if not child.process.is_alive():
+                child.process.join()
+                uptime = now - child.started
+                print(f"Worker {index} (pid {child.pid}) exited with {child.process.exitcode} after {uptime:.0f}s")
+                # Back off while a child keeps dying right after start
+                if uptime < MIN_UPTIME:
+                    self.restart_delay[index] = min(max(1.0, self.restart_delay[index] * 2), MAX_RESTART_DELAY)
+                else:
+                    self.restart_delay[index] = 0.0
+                self.restart_at[index] = now + self.restart_delay[index]
+                self.slots[index] = None
+                self.restarts += 1
+                if self.restart_delay[index]:
+                    print(f"Restarting worker {index} in {self.restart_delay[index]:.0f}s")
+                continue
+
+            reason = self._worn_out(child)
+            if reason:
+                # The replacement takes new sessions while the old child drains
+                print(f"Recycling worker {index} (pid {child.pid}): {reason}")
+                child.stop()
+                self.retiring.append(child)
+                self._start(index)
+                self.recycles += 1
+
+        for child in list(self.retiring):
+            if not child.process.is_alive():
+                child.process.join()
+                self.retiring.remove(child)
+            elif now - child.stopping_at > mlModels.DRAIN_TIMEOUT + KILL_GRACE:
+                print(f"Worker pid {child.pid} did not drain in time, killing it")
+                child.process.kill()
+
+    def _shutdown(self, signum, frame):
+        self.running = False
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._shutdown)
+        signal.signal(signal.SIGINT, self._shutdown)
+
+        if mlModels.POSE_BACKEND == "onnx":
+            from batchpose import checked
+            if not checked():
+                raise SystemExit("The ONNX pose model has not passed the accuracy check, "
+                                 "run: python batchpose.py --check <video>")
+
+        warmed = warm_models()
+        # Everything imported so far is shared with the children, keep the
+        # collector from writing to those pages
+        gc.collect()
+        gc.freeze()
+        print(f"Preloaded {warmed / 1e6:.1f} MB of models, forking {self.workers} workers")
+
+        for index in range(self.workers):
+            self._start(index)
+
+        while self.running:
+            time.sleep(CHECK_INTERVAL)
+            self._check()
+
+        self.stop()
+
+    def stop(self):
+        """Drain every child and wait for them"""
+        children = [child for child in self.slots if child] + self.retiring
+        print(f"Stopping {len(children)} workers")
+        for child in children:
+            child.stop()
+        deadline = time.monotonic() + mlModels.DRAIN_TIMEOUT + KILL_GRACE
+        for child in children:
+            child.process.join(timeout=max(0, deadline - time.monotonic()))
+            if child.process.is_alive():
+                child.process.kill()
+                child.process.join()
+        print(f"Workers stopped after {self.restarts} restarts and {self.recycles} recycles")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run mlModels.py workers forked from one preloaded supervisor")
+    parser.add_argument("--workers", type=int, default=WORKER_PROCESSES, help="Worker processes")
+    parser.add_argument("--max-sessions", type=int, default=WORKER_MAX_SESSIONS,
+                        help="Recycle a worker after this many sessions (0: never)")
+    parser.add_argument("--max-rss-mb", type=float, default=WORKER_MAX_RSS_MB,
+                        help="Recycle a worker above this much private memory (0: never)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    Supervisor(args.workers, args.max_sessions, args.max_rss_mb).run()
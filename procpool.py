@@ -0,0 +1,338 @@
+"""
+Multiprocess pose inference fed through a shared-memory frame ring.
+
+The event loop process keeps WebRTC receive, encode and analysis. Decoded
+RGB frames are copied once into a fixed slot of a shared-memory ring, and
+only (slot, sequence, session) goes through the task queue to an inference
+process. The process runs MediaPipe on a view of the slot and answers with a
+small status tuple carrying the 33x4 landmarks. Every session sticks to one
+process so its pose graph keeps tracking state, built with the confidence
+settings of the session's exercise processor.
+
+A frame without an answer after RESULT_TIMEOUT gives its slot back right
+away, so a wedged process cannot hold the ring. Its late answer is dropped
+by sequence number, and a slot it still reads is overwritten under it at
+worst, which only spoils that dropped answer.
+"""
+import asyncio
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from landmarks import LandmarkFrame, NUM_LANDMARKS
+
+# Pool configuration
+POOL_WORKERS = int(os.environ.get("POSE_POOL_WORKERS", "0")) or max(1, (os.cpu_count() or 2) - 1)
+SLOTS_PER_WORKER = int(os.environ.get("POSE_POOL_SLOTS", "4"))
+MAX_FRAME_WIDTH = int(os.environ.get("POSE_POOL_MAX_WIDTH", "640"))
+MAX_FRAME_HEIGHT = int(os.environ.get("POSE_POOL_MAX_HEIGHT", "640"))
+RESULT_TIMEOUT = 2.0
+GRAPH_IDLE_SECONDS = 120.0  # Graphs of sessions that stopped sending are closed
+
+# Graph options of sessions that open without their processor's settings
+POSE_OPTIONS = dict(min_detection_confidence=0.5, min_tracking_confidence=0.5)
+
+# Slot header columns
+SEQ, HEIGHT, WIDTH = 0, 1, 2
+
+# Result status codes
+FOUND, NOT_FOUND, STALE, FAILED = 0, 1, 2, 3
+
+
+class FrameRing:
+    """Frame slots and their headers in one shared memory block"""
+
+    def __init__(self, slots, slot_bytes, name=None):
+        header_bytes = slots * 3 * 8
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=header_bytes + slots * slot_bytes)
+        else:
+            # Inference processes share the parent's resource tracker, which
+            # unlinks the block only once the parent has
+            self.shm = shared_memory.SharedMemory(name=name)
+
+        buf = self.shm.buf
+        self.headers = np.ndarray((slots, 3), dtype=np.int64, buffer=buf)
+        self.frames = np.ndarray((slots, slot_bytes), dtype=np.uint8, buffer=buf, offset=header_bytes)
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.name = self.shm.name
+
+    def write(self, slot, seq, img):
+        """Copy a frame into a slot, the only copy on the way to inference"""
+        height, width = img.shape[:2]
+        self.frames[slot, :img.size] = img.reshape(-1)
+        self.headers[slot] = (seq, height, width)
+
+    def read(self, slot):
+        """Sequence number and a contiguous (h, w, 3) view of a slot"""
+        seq, height, width = (int(v) for v in self.headers[slot])
+        return seq, self.frames[slot, :height * width * 3].reshape(height, width, 3)
+
+    def close(self):
+        # The numpy views must go before the buffer can be released
+        del self.headers, self.frames
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _worker_main(ring_name, slots, slot_bytes, tasks, results, options):
+    """Inference process: pose graphs per session, frames read in place from the ring"""
+    import mediapipe as mp
+
+    ring = FrameRing(slots, slot_bytes, name=ring_name)
+    graphs = {}  # session key -> [pose, last used]
+    session_options = {}  # session key -> Pose options
+    next_eviction = time.monotonic() + GRAPH_IDLE_SECONDS
+
+    while True:
+        message = tasks.get()
+        if message is None:
+            break
+
+        if message[0] == "open":
+            session_options[message[1]] = message[2]
+            continue
+
+        if message[0] == "close":
+            session_options.pop(message[1], None)
+            entry = graphs.pop(message[1], None)
+            if entry:
+                entry[0].close()
+            continue
+
+        _, slot, seq, session_key = message
+        frame_seq, img = ring.read(slot)
+        if frame_seq != seq:
+            results.put((slot, seq, STALE, 0.0, None))
+            continue
+
+        now = time.monotonic()
+        entry = graphs.get(session_key)
+        if entry is None:
+            entry = graphs[session_key] = [mp.solutions.pose.Pose(**session_options.get(session_key, options)), now]
+        entry[1] = now
+
+        try:
+            start = time.perf_counter()
+            output = entry[0].process(img)
+            elapsed = time.perf_counter() - start
+        except Exception as e:
+            print(f"Inference process error: {e}")
+            results.put((slot, seq, FAILED, 0.0, None))
+            continue
+
+        if output.pose_landmarks:
+            coords = np.array([(lm.x, lm.y, lm.z, lm.visibility) for lm in output.pose_landmarks.landmark],
+                              dtype=np.float32)
+            results.put((slot, seq, FOUND, elapsed, coords.tobytes()))
+        else:
+            results.put((slot, seq, NOT_FOUND, elapsed, None))
+
+        if now >= next_eviction:
+            next_eviction = now + GRAPH_IDLE_SECONDS
+            for key, (pose, last_used) in list(graphs.items()):
+                if now - last_used > GRAPH_IDLE_SECONDS:
+                    pose.close()
+                    del graphs[key]
+
+    for pose, _ in graphs.values():
+        pose.close()
+    ring.close()
+
+
+class InferencePool:
+    """Pose inference processes behind a shared-memory ring.
+
+    detect() never blocks the event loop: when every slot is in flight the
+    frame is skipped and None is returned, the same as a frame the sampling
+    schedule skipped.
+    """
+
+    def __init__(self, workers=POOL_WORKERS, slots_per_worker=SLOTS_PER_WORKER,
+                 max_width=MAX_FRAME_WIDTH, max_height=MAX_FRAME_HEIGHT, options=POSE_OPTIONS):
+        self.context = multiprocessing.get_context("spawn")
+        self.ring = FrameRing(workers * slots_per_worker, max_width * max_height * 3)
+        self.options = options
+        self.results = self.context.Queue()
+        self.processes = [None] * workers
+        self.tasks = [None] * workers
+        for index in range(workers):
+            self._start_worker(index)
+
+        self.free_slots = list(range(self.ring.slots))
+        self.sequence = itertools.count(1)
+        self.in_flight = {}  # seq -> (slot, worker)
+        self.pending = {}  # seq -> future
+        self.assignments = {}  # session key -> worker
+        self.session_options = {}  # session key -> Pose options
+        self.loop = None
+
+        # Counters
+        self.frames = 0
+        self.dropped = 0
+        self.timeouts = 0
+        self.inference_time = 0
+
+        self.reader = threading.Thread(target=self._read_results, name="pose-pool-results", daemon=True)
+        self.reader.start()
+
+    def _start_worker(self, index):
+        self.tasks[index] = self.context.Queue()
+        process = self.context.Process(
+            target=_worker_main,
+            args=(self.ring.name, self.ring.slots, self.ring.slot_bytes, self.tasks[index], self.results, self.options),
+            name=f"pose-worker-{index}",
+            daemon=True
+        )
+        process.start()
+        self.processes[index] = process
+
+    def _worker_for(self, session_key, options=None):
+        """Sticky assignment, new sessions go to the least loaded process"""
+        worker = self.assignments.get(session_key)
+        if worker is None:
+            counts = [0] * len(self.processes)
+            for assigned in self.assignments.values():
+                counts[assigned] += 1
+            worker = counts.index(min(counts))
+            self.assignments[session_key] = worker
+            if options:
+                self.session_options[session_key] = options
+                self.tasks[worker].put(("open", session_key, options))
+        return worker
+
+    def _read_results(self):
+        """Blocks on the result queue and hands results to the event loop"""
+        while True:
+            message = self.results.get()
+            if message is None:
+                return
+            if self.loop is not None:
+                self.loop.call_soon_threadsafe(self._complete, *message)
+
+    def _complete(self, slot, seq, status, elapsed, coords):
+        if self.in_flight.pop(seq, None) is None:
+            return  # Slot was already reclaimed after a timeout
+        landmarks = None
+        if status == FOUND:
+            coords = np.frombuffer(coords, dtype=np.float32).reshape(NUM_LANDMARKS, 4).copy()
+            landmarks = LandmarkFrame(coords, time.time())
+        self.free_slots.append(slot)
+        self.inference_time += elapsed
+
+        future = self.pending.pop(seq, None)
+        if future and not future.done():
+            future.set_result(landmarks)
+
+    async def detect(self, session_key, img_rgb, options=None):
+        """Pose landmarks of an RGB frame as a LandmarkFrame, or None. The
+        session's graph is built with options (Pose keyword arguments) when
+        given on its first frame."""
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        if img_rgb.size > self.ring.slot_bytes:
+            raise ValueError(f"Frame {img_rgb.shape} is larger than a pool slot")
+        if not self.free_slots:
+            # A dead process holds slots until it is restarted
+            for worker in range(len(self.processes)):
+                self._check_worker(worker)
+        if not self.free_slots:
+            self.dropped += 1
+            return None
+
+        slot = self.free_slots.pop()
+        seq = next(self.sequence)
+        worker = self._worker_for(session_key, options)
+        self.ring.write(slot, seq, img_rgb)
+
+        future = self.loop.create_future()
+        self.pending[seq] = future
+        self.in_flight[seq] = (slot, worker)
+        self.tasks[worker].put(("frame", slot, seq, session_key))
+        self.frames += 1
+
+        try:
+            return await asyncio.wait_for(future, RESULT_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.pending.pop(seq, None)
+            # Reclaim the slot now, the late answer is dropped by _complete
+            if self.in_flight.pop(seq, None) is not None:
+                self.free_slots.append(slot)
+                self.timeouts += 1
+            self._check_worker(worker)
+            return None
+
+    def _check_worker(self, worker):
+        """Restart a dead inference process and reclaim the slots it held"""
+        if self.processes[worker].is_alive():
+            return
+        print(f"Inference process {worker} died, restarting")
+        for seq, (slot, assigned) in list(self.in_flight.items()):
+            if assigned == worker:
+                del self.in_flight[seq]
+                self.free_slots.append(slot)
+                future = self.pending.pop(seq, None)
+                if future and not future.done():
+                    future.set_result(None)
+        self._start_worker(worker)
+        # The new process builds the graphs of its sessions with their settings
+        for session_key, assigned in self.assignments.items():
+            if assigned == worker and session_key in self.session_options:
+                self.tasks[worker].put(("open", session_key, self.session_options[session_key]))
+
+    def close_session(self, session_key):
+        """Close the pose graph a session holds in its inference process"""
+        worker = self.assignments.pop(session_key, None)
+        self.session_options.pop(session_key, None)
+        if worker is not None:
+            self.tasks[worker].put(("close", session_key))
+
+    def stats(self):
+        return {
+            "workers": len(self.processes),
+            "alive": sum(process.is_alive() for process in self.processes),
+            "sessions": len(self.assignments),
+            "inFlight": len(self.in_flight),
+            "freeSlots": len(self.free_slots),
+            "frames": self.frames,
+            "dropped": self.dropped,
+            "timeouts": self.timeouts,
+            "msPerFrame": 1000 * self.inference_time / self.frames if self.frames else 0
+        }
+
+    def close(self):
+        for tasks in self.tasks:
+            tasks.put(None)
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.results.put(None)
+        self.reader.join(timeout=1)
+        self.ring.close()
+
+
+_pool = None
+
+
+def get_inference_pool():
+    """Shared pool for all sessions in this worker"""
+    global _pool
+    if _pool is None:
+        _pool = InferencePool()
+    return _pool
+
+
+def close_inference_pool():
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool = None
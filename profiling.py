@@ -0,0 +1,159 @@
+"""
+Opt-in sampling profiler that can be toggled at runtime.
+
+A background thread samples the event loop thread's Python stack at a fixed
+interval and aggregates the stacks in the folded format read by
+flamegraph.pl, speedscope and similar tools. Sessions mark the code they run
+with session_scope so samples can be attributed to a single session or
+grouped per session for the whole worker. The marker is one global for the
+loop thread, so scopes only go around synchronous blocks: across an await
+other sessions' code would run under it. Nothing is sampled while the
+profiler is off; the only steady cost is setting the active session marker.
+"""
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+DEFAULT_INTERVAL = 0.005
+MIN_INTERVAL = 0.001  # Shorter intervals turn the sampler into a busy loop
+MAX_DEPTH = 64
+
+# A profiler started without a duration stops after DEFAULT_DURATION, and
+# none runs longer than MAX_DURATION
+DEFAULT_DURATION = float(os.environ.get("PROFILE_DEFAULT_DURATION", "30"))
+MAX_DURATION = float(os.environ.get("PROFILE_MAX_DURATION", "300"))
+
+# Session whose code the event loop is currently running
+_active_session = None
+
+
+@contextmanager
+def session_scope(session_id):
+    """Attribute samples taken inside this block to a session, the block must not await"""
+    global _active_session
+    previous = _active_session
+    _active_session = session_id
+    try:
+        yield
+    finally:
+        _active_session = previous
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+class SamplingProfiler:
+    """Samples one thread's stack and keeps folded stack counts"""
+
+    def __init__(self, thread_id, session_id=None, interval=DEFAULT_INTERVAL):
+        self.thread_id = thread_id
+        self.session_id = session_id
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self.started = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.started = time.time()
+        self.thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            session = _active_session
+            if frame is None:
+                continue
+            if self.session_id is not None and session != self.session_id:
+                continue
+
+            names = []
+            while frame is not None and len(names) < MAX_DEPTH:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            names.reverse()
+
+            # Group by session at the root so one flamegraph shows every session
+            if self.session_id is None:
+                names.insert(0, f"session:{session or 'idle'}")
+
+            key = ";".join(names)
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def dump(self, path=None):
+        """Write folded stacks, returns the file path"""
+        if path is None:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            scope = self.session_id or "worker"
+            path = os.path.join(PROFILE_DIR, f"{scope}-{int(self.started)}.folded")
+
+        with open(path, "w") as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+_profiler = None
+_lock = threading.Lock()
+
+
+def start_profiler(session_id=None, interval=DEFAULT_INTERVAL):
+    """Start sampling the calling thread (the event loop). Returns False if already running."""
+    global _profiler
+    with _lock:
+        if _profiler is not None:
+            return False
+        _profiler = SamplingProfiler(threading.get_ident(), session_id,
+                                     interval if interval >= MIN_INTERVAL else MIN_INTERVAL)
+        _profiler.start()
+        return True
+
+
+def profile_duration(requested=None):
+    """Run time of a profiler, the default when none was asked for, capped at MAX_DURATION"""
+    try:
+        duration = float(requested) if requested else DEFAULT_DURATION
+    except (TypeError, ValueError):
+        duration = DEFAULT_DURATION
+    # Also catches NaN
+    if not duration > 0:
+        return DEFAULT_DURATION
+    return min(duration, MAX_DURATION)
+
+
+def stop_profiler(started=None):
+    """Stop sampling and dump the result, returns (path, samples) or None.
+
+    With started (the profiler's start time) only that profiler is stopped,
+    so a delayed stop doesn't end a profiler started after it.
+    """
+    global _profiler
+    with _lock:
+        if _profiler is None or (started is not None and _profiler.started != started):
+            return None
+        profiler, _profiler = _profiler, None
+    profiler.stop()
+    return profiler.dump(), profiler.samples
+
+
+def profiler_running():
+    return _profiler is not None
+
+
+def profiler_started():
+    """Start time of the running profiler, or None"""
+    profiler = _profiler
+    return profiler.started if profiler else None
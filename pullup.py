@@ -1,10 +1,10 @@
-import cv2
-import numpy as np
+import time
 import mediapipe as mp
+from landmarks import LandmarkFrame, LEFT_ELBOW, LEFT_HIP, LEFT_KNEE, LEFT_SHOULDER, LEFT_WRIST
+from kinematics import BilateralKinematics, FrameClock
 
 # Initialize MediaPipe Pose
 mp_pose = mp.solutions.pose
-mp_draw = mp.solutions.drawing_utils
 
 # Define ideal angles and thresholds
 IDEAL_ANGLES = {
@@ -17,43 +17,59 @@ IDEAL_ANGLES = {
 
 THRESHOLD = 20  # Acceptable deviation in degrees
 
+# MediaPipe Pose confidence, the inference pool builds this session's graph with it too
+POSE_OPTIONS = dict(min_detection_confidence=0.9, min_tracking_confidence=0.9)
+
 class PullUpExerciseProcessor:
+    pose_options = POSE_OPTIONS
+    
     def __init__(self):
-        self.pose = mp_pose.Pose(min_detection_confidence=0.9, min_tracking_confidence=0.90, static_image_mode=False)
+        self._pose = None  # MediaPipe graph, created on first inference
         self.rep_count = 0
         self.pose_history = []
+        self.exercise_type = "pullup"
         self.last_position = None
         
         # Pull-up specific variables
-        self.hold_frames = 0
-        self.frame_hold_threshold = 5
+        self.hold_time = 0
+        # Time hanging extended before a pull counts: the old 5-frame hold at the
+        # live analysis rate (every 5th frame of 30 fps)
+        self.hold_seconds = 0.83
         self.cumulative_accuracy = 0
         self.accuracy_frames = 0
         self.accuracy_per_rep = 0
+        self.clock = FrameClock()
+        
+        # Angles for both sides in one pass, the more visible side is used
+        self.kinematics = BilateralKinematics({
+            "elbow_angle": (LEFT_SHOULDER, LEFT_ELBOW, LEFT_WRIST),
+            "hip_angle": (LEFT_SHOULDER, LEFT_HIP, LEFT_KNEE)
+        })
+    
+    @property
+    def pose(self):
+        """MediaPipe graph, analysis-only instances never create one"""
+        if self._pose is None:
+            self._pose = mp_pose.Pose(static_image_mode=False, **self.pose_options)
+        return self._pose
+    
+    def close(self):
+        """Close the MediaPipe graph if one was created"""
+        if self._pose is not None:
+            self._pose.close()
+            self._pose = None
     
     def reset_state(self):
         """Reset exercise state"""
         self.rep_count = 0
         self.pose_history = []
         self.last_position = None
-        self.hold_frames = 0
+        self.hold_time = 0
         self.cumulative_accuracy = 0
         self.accuracy_frames = 0
         self.accuracy_per_rep = 0
-    
-    def calculate_angle(self, a, b, c):
-        """Calculate angle between three points"""
-        a = np.array(a)  # Point A
-        b = np.array(b)  # Point B
-        c = np.array(c)  # Point C
-
-        ba = a - b
-        bc = c - b
-
-        cosine_angle = np.dot(ba, bc) / (np.linalg.norm(ba) * np.linalg.norm(bc))
-        angle = np.arccos(np.clip(cosine_angle, -1.0, 1.0))
-
-        return np.degrees(angle)
+        self.clock.reset()
+        self.kinematics.reset()
     
     def calculate_angle_accuracy(self, actual_angle, target_angle, threshold=THRESHOLD):
         """Calculate accuracy based on angle deviation"""
@@ -66,26 +82,13 @@ class PullUpExerciseProcessor:
 
         return accuracy
     
-    def calculate_posture_accuracy(self, landmarks, position):
+    def calculate_posture_accuracy(self, angles, position):
         """Calculate posture accuracy based on exercise type"""
-        if not landmarks:
+        if not angles:
             return 0
         
-        # Extract key landmarks
-        shoulder = [landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x,
-                    landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y]
-        elbow = [landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].x,
-                 landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].y]
-        wrist = [landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].x,
-                 landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].y]
-        hip = [landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].x,
-               landmarks[mp_pose.PoseLandmark.LEFT_HIP.value].y]
-        knee = [landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value].x,
-                landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value].y]
-
-        # Calculate angles
-        elbow_angle = self.calculate_angle(shoulder, elbow, wrist)
-        hip_angle = self.calculate_angle(shoulder, hip, knee)
+        elbow_angle = angles["elbow_angle"]
+        hip_angle = angles["hip_angle"]
 
         # Get target angle based on position
         if position == "up":
@@ -108,24 +111,12 @@ class PullUpExerciseProcessor:
             "hip_angle": hip_angle
         }
     
-    def process_frame(self, img):
-        """Process video frame using MediaPipe Pose"""
-        
-        # Convert to RGB for MediaPipe
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        
-        # Process the image
+    def detect_landmarks(self, img_rgb):
+        """Run MediaPipe Pose on an RGB frame already scaled to inference size"""
         results = self.pose.process(img_rgb)
-        
-        # Convert back to BGR
-        processed_img = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2BGR)
-        
-        landmarks = None
-        if results.pose_landmarks:
-            landmarks = results.pose_landmarks.landmark
-            mp_draw.draw_landmarks(processed_img, results.pose_landmarks, mp_pose.POSE_CONNECTIONS)
-        
-        return processed_img, landmarks
+        if not results.pose_landmarks:
+            return None
+        return LandmarkFrame.from_mediapipe(results.pose_landmarks.landmark, time.time())
     
     def analyze_exercise(self, landmarks):
         """Analyze exercise form and count reps"""
@@ -140,37 +131,44 @@ class PullUpExerciseProcessor:
                 "angles": {}
             }
         
-        # Extract exercise-specific angles for rep counting
-        shoulder = [landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].x,
-                   landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value].y]
-        elbow = [landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].x,
-                landmarks[mp_pose.PoseLandmark.LEFT_ELBOW.value].y]
-        wrist = [landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].x,
-                landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value].y]
+        # Time since the previous analyzed frame
+        frame_time = self.clock.tick(landmarks.timestamp)
+        
+        # Extract exercise-specific angles for rep counting, skip occluded frames
+        kinematics = self.kinematics.compute(landmarks)
+        if kinematics is None:
+            return {
+                "form": "Joints not visible",
+                "accuracy": self.accuracy_per_rep,
+                "position": None,
+                "repCount": self.rep_count,
+                "angles": {}
+            }
         
-        elbow_angle = self.calculate_angle(shoulder, elbow, wrist)
+        angles = kinematics["angles"]
+        elbow_angle = angles["elbow_angle"]
         
         # Pull-up thresholds
         UP_THRESHOLD = 50    # Elbow flexion for the up position
         DOWN_THRESHOLD = 160  # Elbow extension for the down position
         
         # Calculate accuracy
-        accuracy_data = self.calculate_posture_accuracy(landmarks, self.last_position)
+        accuracy_data = self.calculate_posture_accuracy(angles, self.last_position)
         accuracy = accuracy_data["overall"] if isinstance(accuracy_data, dict) and "overall" in accuracy_data else 0
         
         # Pull-up counting logic
         if elbow_angle > DOWN_THRESHOLD and self.last_position != "down":
             self.last_position = "down"
-            self.hold_frames = 0
+            self.hold_time = 0
             position = "down"
 
         if self.last_position == "down" and elbow_angle > DOWN_THRESHOLD:
-            self.hold_frames += 1
+            self.hold_time += frame_time
             self.cumulative_accuracy += accuracy
             self.accuracy_frames += 1
             position = "down"
 
-        if self.last_position == "down" and elbow_angle <= UP_THRESHOLD and self.hold_frames >= self.frame_hold_threshold:
+        if self.last_position == "down" and elbow_angle <= UP_THRESHOLD and self.hold_time >= self.hold_seconds:
             accuracy_up = accuracy
             if self.accuracy_frames > 0:
                 accuracy_down = self.cumulative_accuracy / self.accuracy_frames
@@ -204,5 +202,7 @@ class PullUpExerciseProcessor:
             "accuracy": self.accuracy_per_rep,
             "position": position,
             "repCount": self.rep_count,
-            "angles": accuracy_data if isinstance(accuracy_data, dict) else {}
+            "angles": accuracy_data if isinstance(accuracy_data, dict) else {},
+            "side": kinematics["side"],
+            "symmetry": kinematics["symmetry"]
         }
\ No newline at end of file
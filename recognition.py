@@ -0,0 +1,158 @@
+from collections import deque
+
+import numpy as np
+
+from kinematics import joint_angles
+from landmarks import (
+    LEFT_SHOULDER, RIGHT_SHOULDER, LEFT_ELBOW, RIGHT_ELBOW, LEFT_WRIST, RIGHT_WRIST,
+    LEFT_HIP, RIGHT_HIP, LEFT_KNEE, RIGHT_KNEE, LEFT_ANKLE, RIGHT_ANKLE
+)
+
+# Shared angle features for every candidate: elbow, hip and knee on both sides
+TRIPLETS = np.array([
+    (LEFT_SHOULDER, LEFT_ELBOW, LEFT_WRIST),
+    (LEFT_SHOULDER, LEFT_HIP, LEFT_KNEE),
+    (LEFT_HIP, LEFT_KNEE, LEFT_ANKLE),
+    (RIGHT_SHOULDER, RIGHT_ELBOW, RIGHT_WRIST),
+    (RIGHT_SHOULDER, RIGHT_HIP, RIGHT_KNEE),
+    (RIGHT_HIP, RIGHT_KNEE, RIGHT_ANKLE)
+], dtype=np.int32)
+SIDE_JOINTS = np.array([
+    (LEFT_SHOULDER, LEFT_ELBOW, LEFT_WRIST, LEFT_HIP, LEFT_KNEE, LEFT_ANKLE),
+    (RIGHT_SHOULDER, RIGHT_ELBOW, RIGHT_WRIST, RIGHT_HIP, RIGHT_KNEE, RIGHT_ANKLE)
+], dtype=np.int32)
+
+# Window features, each scaled to 0..1:
+# elbow/hip/knee motion (angle range over the window), torso horizontal,
+# share of frames with the wrists above the shoulders
+FEATURES = ("elbow_motion", "hip_motion", "knee_motion", "horizontal", "wrists_up")
+MOTION_SCALE = np.array([60.0, 40.0, 40.0])  # Degrees of range that count as full motion
+
+# Expected feature values per exercise and how much each feature matters,
+# checked against the synthetic sets in benchmark.py
+CANDIDATES = ("pushup", "crunch", "pullup", "bicepcurl")
+TEMPLATES = np.array([
+    [1.0, 0.0, 0.0, 0.9, 0.0],  # pushup: elbows work, body horizontal
+    [0.0, 1.0, 0.0, 0.5, 0.0],  # crunch: hips work, torso rises from the floor
+    [1.0, 0.0, 0.0, 0.0, 1.0],  # pullup: elbows work, upright, hands overhead
+    [1.0, 0.0, 0.0, 0.0, 0.0]   # bicepcurl: elbows work, upright, hands low
+])
+# Crunch ignores the arms, they are held anywhere. A still hip sets the
+# elbow exercises apart from it.
+WEIGHTS = np.array([
+    [1.0, 1.0, 0.5, 1.0, 0.5],
+    [0.0, 1.0, 0.5, 0.5, 0.0],
+    [1.0, 1.0, 0.5, 1.0, 1.0],
+    [1.0, 1.0, 0.5, 1.0, 1.0]
+])
+
+WINDOW_SECONDS = 4.0
+EVALUATE_INTERVAL = 1.0
+MIN_FRAMES = 8
+MIN_VISIBILITY = 0.5
+MIN_ACTIVITY = 0.3  # Below this the trainee is resting, keep the current exercise
+MIN_SCORE = 0.7
+MIN_MARGIN = 0.1  # Lead over the runner-up
+CONFIRMATIONS = 3  # Consecutive evaluations before switching
+
+
+class ExerciseRecognizer:
+    """Classifies the current exercise from a sliding window of landmarks.
+
+    The window is evaluated about once a second: angle features for all
+    frames and both sides are computed in one pass, reduced to a handful of
+    window features and scored against every candidate template at once.
+    A switch needs a confident winner over several evaluations, so a
+    transition or a rest between sets doesn't flip the analyzer.
+    """
+
+    def __init__(self, current=None, candidates=CANDIDATES):
+        rows = [CANDIDATES.index(name) for name in candidates]
+        self.candidates = tuple(candidates)
+        self.templates = TEMPLATES[rows]
+        self.weights = WEIGHTS[rows]
+        self.current = current
+        self.window = deque()
+        self.next_evaluation = None
+        self.pending = None
+        self.pending_count = 0
+        self.last_scores = {}
+
+    def reset(self):
+        self.window.clear()
+        self.next_evaluation = None
+        self.pending = None
+        self.pending_count = 0
+
+    def features(self, coords):
+        """Window features from a (frames, 33, 4) array, or None if too few usable frames"""
+        # Use the side that is better visible over the whole window
+        visibility = coords[:, SIDE_JOINTS, 3]
+        side = int(np.argmax(visibility.mean(axis=(0, 2))))
+        usable = visibility[:, side].min(axis=1) >= MIN_VISIBILITY
+        if usable.sum() < MIN_FRAMES:
+            return None
+        coords = coords[usable]
+
+        angles = joint_angles(coords, TRIPLETS[side * 3:side * 3 + 3])
+        low, high = np.percentile(angles, [10, 90], axis=0)
+        motion = np.minimum((high - low) / MOTION_SCALE, 1.0)
+
+        shoulder = coords[:, SIDE_JOINTS[side, 0], :2]
+        wrist = coords[:, SIDE_JOINTS[side, 2], :2]
+        hip = coords[:, SIDE_JOINTS[side, 3], :2]
+        torso = shoulder - hip
+        horizontal = np.degrees(np.arctan2(np.abs(torso[:, 0]), np.abs(torso[:, 1]))).mean() / 90
+        wrists_up = (wrist[:, 1] < shoulder[:, 1]).mean()  # Image y grows downward
+
+        return np.concatenate([motion, [horizontal, wrists_up]])
+
+    def score(self, features):
+        """Similarity of the window to every candidate, 1 is a perfect match"""
+        distance = (self.weights * np.abs(self.templates - features)).sum(axis=1)
+        return 1 - distance / self.weights.sum(axis=1)
+
+    def update(self, landmarks):
+        """Add a frame, returns the new exercise when a switch is confirmed"""
+        timestamp = landmarks.timestamp
+        self.window.append((timestamp, landmarks.coords))
+        while self.window and self.window[0][0] < timestamp - WINDOW_SECONDS:
+            self.window.popleft()
+
+        if self.next_evaluation is None:
+            self.next_evaluation = timestamp + EVALUATE_INTERVAL
+        if timestamp < self.next_evaluation:
+            return None
+        self.next_evaluation = timestamp + EVALUATE_INTERVAL
+
+        features = self.features(np.stack([coords for _, coords in self.window]))
+        if features is None or features[:3].max() < MIN_ACTIVITY:
+            self.pending_count = 0
+            return None
+
+        scores = self.score(features)
+        self.last_scores = dict(zip(self.candidates, scores.round(3).tolist()))
+        order = np.argsort(scores)[::-1]
+        best = self.candidates[order[0]]
+        margin = scores[order[0]] - scores[order[1]] if len(order) > 1 else 1.0
+
+        if best == self.current or scores[order[0]] < MIN_SCORE or margin < MIN_MARGIN:
+            self.pending_count = 0
+            return None
+
+        if best == self.pending:
+            self.pending_count += 1
+        else:
+            self.pending = best
+            self.pending_count = 1
+
+        if self.pending_count < CONFIRMATIONS:
+            return None
+
+        self.current = best
+        self.pending = None
+        self.pending_count = 0
+        return best
+
+    def confidence(self):
+        return self.last_scores.get(self.current, 0)
@@ -0,0 +1,186 @@
+"""
+Background recording of the annotated session video.
+
+The live track only hands a frame reference to the recorder; conversion,
+annotation of unannotated frames and encoding all happen on the recorder's
+own thread. The queue between them is bounded: when the disk or the encoder
+falls behind, the recorder lowers its frame rate and finally drops frames,
+it never makes the live track wait. Output is split into fixed-length
+segments so a crash loses at most the segment being written.
+"""
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+from overlay import HudOverlay, SkeletonRenderer
+
+RECORDING_DIR = os.environ.get("RECORDING_DIR", "recordings")
+RECORD_FPS = float(os.environ.get("RECORD_FPS", "15"))
+RECORD_SEGMENT_SECONDS = float(os.environ.get("RECORD_SEGMENT_SECONDS", "300"))
+RECORD_QUEUE_SIZE = int(os.environ.get("RECORD_QUEUE_SIZE", "30"))
+RECORD_FOURCC = os.environ.get("RECORD_FOURCC", "mp4v")
+
+# The frame rate is halved while the queue is above the high mark, down to
+# RECORD_FPS / MAX_STRIDE, and doubled again once it drained below the low mark
+QUEUE_HIGH = 0.75
+QUEUE_LOW = 0.25
+MAX_STRIDE = 8
+
+
+class SessionRecorder:
+    """Writes one session's frames to segmented video files on a worker thread"""
+
+    def __init__(self, session_id, directory=RECORDING_DIR, fps=RECORD_FPS,
+                 segment_seconds=RECORD_SEGMENT_SECONDS, queue_size=RECORD_QUEUE_SIZE):
+        self.session_id = session_id
+        self.directory = os.path.join(directory, session_id)
+        self.fps = fps
+        self.segment_seconds = segment_seconds
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.closed = False
+
+        # Frame rate gate, only touched by the live side
+        self.stride = 1
+        self.next_time = 0
+
+        # Writer state, only touched by the recorder thread
+        self.writer = None
+        self.segment_start = 0
+        self.segment_size = None
+        self.segment_index = 0
+        self.written_index = -1
+        self.hud = None
+        self.skeleton = None
+
+        # Counters
+        self.submitted = 0
+        self.dropped = 0
+        self.written = 0
+        self.segments = []
+
+        self.thread = threading.Thread(target=self._run, name=f"recorder-{session_id}", daemon=True)
+        self.thread.start()
+
+    def _admit(self, timestamp):
+        """Frame rate gate, lowered while the encoder is behind"""
+        depth = self.queue.qsize() / self.queue.maxsize
+        if depth >= QUEUE_HIGH and self.stride < MAX_STRIDE:
+            self.stride *= 2
+        elif depth <= QUEUE_LOW and self.stride > 1:
+            self.stride //= 2
+
+        if timestamp < self.next_time:
+            return False
+        self.next_time = timestamp + self.stride / self.fps
+        return True
+
+    def _hand_off(self, item):
+        try:
+            self.queue.put_nowait(item)
+            self.submitted += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def submit(self, img_bgr, timestamp):
+        """Record an annotated BGR frame. The array must not be modified afterwards."""
+        if not self.closed and self._admit(timestamp):
+            self._hand_off(("image", img_bgr, timestamp))
+
+    def submit_frame(self, frame, landmarks, analysis, timestamp):
+        """Record a received VideoFrame, annotated on the recorder thread"""
+        if not self.closed and self._admit(timestamp):
+            self._hand_off(("frame", frame, landmarks, dict(analysis), timestamp))
+
+    def _annotate(self, frame, landmarks, analysis):
+        if self.hud is None:
+            self.hud = HudOverlay()
+            self.skeleton = SkeletonRenderer()
+        img = frame.to_ndarray(format="bgr24")
+        if landmarks:
+            self.skeleton.draw(img, landmarks)
+        self.hud.render(img, analysis)
+        return img
+
+    def _open_segment(self, size, timestamp):
+        self._close_segment()
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(timestamp))
+        path = os.path.join(self.directory, f"{self.session_id}-{stamp}-{self.segment_index:03d}.mp4")
+        self.writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*RECORD_FOURCC), self.fps, size)
+        if not self.writer.isOpened():
+            raise IOError(f"Cannot open {path} for writing")
+        self.segment_start = timestamp
+        self.segment_size = size
+        self.segment_index += 1
+        self.written_index = -1
+        self.segments.append(path)
+
+    def _close_segment(self):
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+
+    def _write(self, img, timestamp):
+        size = (img.shape[1], img.shape[0])
+        # A resolution change needs a new file, the writer has a fixed size
+        if (self.writer is None or size != self.segment_size
+                or timestamp - self.segment_start >= self.segment_seconds):
+            self._open_segment(size, timestamp)
+
+        # The file has a constant frame rate, frames skipped by the gate are
+        # filled by repeating this one so playback keeps real time
+        index = int((timestamp - self.segment_start) * self.fps)
+        if index <= self.written_index:
+            return
+        repeats = min(index - self.written_index, MAX_STRIDE)
+        for _ in range(repeats):
+            self.writer.write(img)
+        self.written_index = index
+        self.written += 1
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            try:
+                if item[0] == "frame":
+                    _, frame, landmarks, analysis, timestamp = item
+                    img = self._annotate(frame, landmarks, analysis)
+                else:
+                    _, img, timestamp = item
+                self._write(img, timestamp)
+            except Exception as e:
+                print(f"Recording error in session {self.session_id}: {e}")
+        self._close_segment()
+
+    def close(self):
+        """Stop accepting frames, the thread finishes the queue and closes the file"""
+        if self.closed:
+            return
+        self.closed = True
+        # Make room for the sentinel rather than block the caller
+        while True:
+            try:
+                self.queue.put_nowait(None)
+                break
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+        print(f"Recording of session {self.session_id} stopped: {self.stats()}")
+
+    def stats(self):
+        return {
+            "submitted": self.submitted,
+            "written": self.written,
+            "dropped": self.dropped,
+            "queued": self.queue.qsize(),
+            "fps": self.fps / self.stride,
+            "segments": len(self.segments)
+        }
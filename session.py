@@ -0,0 +1,191 @@
+import asyncio
+import os
+import time
+
+# A session whose track has not delivered a frame for this long is closed
+SESSION_IDLE_TIMEOUT = 30.0
+
+# How long the analyzer state of a dropped session is kept for the client
+# to reconnect with the same session id
+RESUME_GRACE = float(os.environ.get("SESSION_RESUME_GRACE", "60"))
+
+
+def release_processors(processors):
+    """Close the MediaPipe graphs of a set of exercise processors"""
+    for processor in processors.values():
+        try:
+            processor.close()
+        except Exception as e:
+            print(f"Error closing pose graph: {e}")
+    processors.clear()
+
+
+class Session:
+    """Everything the worker allocates for one client, torn down in one place.
+
+    The peer connection, the processing track with its pose graphs and every
+    long-running task belong to the session. Tasks must be started through
+    spawn() so close() can cancel and await them; close() is idempotent and
+    safe to call from one of the session's own tasks.
+    """
+
+    def __init__(self, session_id, pc, tier="standard"):
+        self.session_id = session_id
+        self.pc = pc
+        self.tier = tier
+        self.track = None
+        self.tasks = set()
+        self.closed = False
+        self.resume_state = None  # Parked analyzer state waiting for the new track
+        self.created = time.time()
+        self.started = time.monotonic()
+
+    def spawn(self, coro, name):
+        task = asyncio.create_task(coro, name=f"{self.session_id}:{name}")
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    def attach(self, track):
+        """Take ownership of a processing track and start its loops"""
+        self.track = track
+        self.spawn(track._background_processor(), "analysis")
+        self.spawn(track._monitor_connection(), "connection-monitor")
+        self.spawn(track._monitor_frame_flow(), "frame-flow-monitor")
+
+    def take_resume_state(self):
+        state, self.resume_state = self.resume_state, None
+        return state
+
+    def pose_graphs(self):
+        if self.closed:
+            return 0
+        if self.track:
+            return self.track.pose_graphs()
+        return len(self.resume_state["processors"]) if self.resume_state else 0
+
+    def idle_seconds(self):
+        last_frame = getattr(self.track, "last_frame_time", None) if self.track else None
+        return time.monotonic() - (last_frame or self.started)
+
+    async def close(self, reason="", keep_state=False):
+        """Tear everything down, returns the analyzer state when keep_state is set"""
+        if self.closed:
+            return None
+        self.closed = True
+        print(f"Closing session {self.session_id}{f' ({reason})' if reason else ''}")
+
+        # Cancel and wait for every task except the one doing the closing
+        current = asyncio.current_task()
+        tasks = [task for task in self.tasks if task is not current]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        state = None
+        if self.track:
+            if keep_state:
+                state = self.track.export_state()
+            self.track.release()
+        elif self.resume_state:
+            # The new connection never produced a track, hand the old state on
+            state = self.take_resume_state()
+            if not keep_state:
+                release_processors(state["processors"])
+                state = None
+        if self.pc:
+            await self.pc.close()
+        return state
+
+
+class SessionRegistry:
+    """Live sessions of this worker keyed by session id, plus the parked
+    analyzer state of recently dropped ones"""
+
+    def __init__(self, grace=RESUME_GRACE, on_discard=None):
+        self.sessions = {}
+        self.parked = {}  # session_id -> (expiry, analyzer state)
+        self.grace = grace
+        self.on_discard = on_discard  # Called with (session_id, state) instead of releasing it
+        self.opened = 0
+        self.closed = 0
+        self.resumed = 0
+
+    def __contains__(self, session_id):
+        return session_id in self.sessions
+
+    def __iter__(self):
+        return iter(list(self.sessions))
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def get(self, session_id):
+        return self.sessions.get(session_id)
+
+    def add(self, session):
+        self.sessions[session.session_id] = session
+        self.opened += 1
+
+    def pop(self, session_id):
+        session = self.sessions.pop(session_id, None)
+        if session:
+            self.closed += 1
+        return session
+
+    def discard(self, session_id, state):
+        """Let go of an analyzer state that will not be resumed"""
+        if self.on_discard:
+            self.on_discard(session_id, state)
+        else:
+            release_processors(state["processors"])
+
+    def park(self, session_id, state):
+        """Keep a dropped session's analyzer state for a reconnect"""
+        previous = self.parked.pop(session_id, None)
+        if previous:
+            self.discard(session_id, previous[1])
+        self.parked[session_id] = (time.monotonic() + self.grace, state)
+
+    def resume(self, session_id):
+        """Parked state for a reconnecting session, or None"""
+        entry = self.parked.pop(session_id, None)
+        if entry is None:
+            return None
+        expiry, state = entry
+        if time.monotonic() > expiry:
+            self.discard(session_id, state)
+            return None
+        self.resumed += 1
+        return state
+
+    def expire_parked(self):
+        """Drop parked states past their grace period and close their graphs"""
+        now = time.monotonic()
+        for session_id, (expiry, state) in list(self.parked.items()):
+            if now > expiry:
+                del self.parked[session_id]
+                self.discard(session_id, state)
+
+    def release_parked(self):
+        for session_id, (_, state) in list(self.parked.items()):
+            self.discard(session_id, state)
+        self.parked.clear()
+
+    def idle(self, timeout=SESSION_IDLE_TIMEOUT):
+        """Session ids whose media stopped flowing"""
+        return [sid for sid, session in self.sessions.items() if session.idle_seconds() > timeout]
+
+    def stats(self):
+        """Live counts for leak checks, every number should return to baseline"""
+        return {
+            "sessions": len(self.sessions),
+            "sessionTasks": sum(len(session.tasks) for session in self.sessions.values()),
+            "loopTasks": len(asyncio.all_tasks()),
+            "poseGraphs": sum(session.pose_graphs() for session in self.sessions.values()),
+            "parked": len(self.parked),
+            "parkedPoseGraphs": sum(len(state["processors"]) for _, state in self.parked.values()),
+            "opened": self.opened,
+            "closed": self.closed,
+            "resumed": self.resumed
+        }
@@ -0,0 +1,153 @@
+"""
+Connect/disconnect soak run against the worker.
+
+Reuses the load test harness: a local signaling stand-in, the mlModels.py
+worker as a subprocess and aiortc clients streaming a video file. Clients
+are opened and closed in cycles. After a warmup the worker's RSS and its
+live session/task/pose graph counts must stay flat, otherwise the run fails.
+Before every measurement the run waits for closed sessions to leave the
+idle reaper and the resume park, whose grace is shortened for the worker,
+so parked pose graphs are part of the check.
+
+Usage:
+    python soak.py --video squat1.mp4 --cycles 2000 --concurrency 4
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+
+from loadtest import SignalingStandIn, LoadClient, WorkerSampler
+from session import SESSION_IDLE_TIMEOUT
+
+
+class SoakSignaling(SignalingStandIn):
+    """Signaling stand-in that can also query the worker's live counts"""
+
+    def __init__(self, port):
+        super().__init__(port)
+        self.stats_reply = None
+        self.sio.on("worker-stats", self.on_worker_stats)
+
+    async def on_worker_stats(self, sid, data):
+        if self.stats_reply and not self.stats_reply.done():
+            self.stats_reply.set_result(data)
+
+    async def worker_stats(self, timeout=5):
+        self.stats_reply = asyncio.get_running_loop().create_future()
+        await self.sio.emit("session-stats", {}, to=self.worker_sid)
+        return await asyncio.wait_for(self.stats_reply, timeout)
+
+
+def settle_timeout(resume_grace):
+    """Longest a closed session can take to go: the idle timeout, the park
+    grace and a pass of the reaper (every third of the idle timeout) after each"""
+    return SESSION_IDLE_TIMEOUT + resume_grace + 2 * SESSION_IDLE_TIMEOUT / 3 + 5
+
+
+async def settle(signaling, timeout):
+    """Wait until the worker has torn down every session and parked state"""
+    deadline = asyncio.get_running_loop().time() + timeout
+    while True:
+        stats = await signaling.worker_stats()
+        if stats["sessions"] == 0 and stats["parked"] == 0:
+            return stats
+        if asyncio.get_running_loop().time() > deadline:
+            return stats
+        await asyncio.sleep(0.5)
+
+
+async def run(args):
+    signaling = SoakSignaling(args.port)
+    await signaling.start()
+    url = f"http://127.0.0.1:{args.port}"
+
+    env = dict(os.environ, SIGNALING_URL=url, SESSION_RESUME_GRACE=str(args.resume_grace))
+    worker = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "mlModels.py")],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL if not args.verbose else None
+    )
+    sampler = WorkerSampler(worker.pid)
+    baseline = None
+    samples = []
+    failures = []
+    rejected = 0
+
+    try:
+        await asyncio.wait_for(signaling.worker_connected.wait(), timeout=60)
+
+        for cycle in range(1, args.cycles + 1):
+            clients = [LoadClient(url, args.video, args.exercise) for _ in range(args.concurrency)]
+            await asyncio.gather(*(client.start() for client in clients))
+            await asyncio.sleep(args.hold)
+            await asyncio.gather(*(client.stop() for client in clients))
+            rejected += sum(1 for client in clients if client.rejected)
+
+            if cycle % args.sample_every and cycle != args.cycles:
+                continue
+
+            stats = await settle(signaling, settle_timeout(args.resume_grace))
+            rss = sampler._rss()
+            samples.append((cycle, rss, stats))
+            print(f"cycle={cycle:5d} rss={rss / 2**20:.0f}MB sessions={stats['sessions']} "
+                  f"tasks={stats['loopTasks']} graphs={stats['poseGraphs']} "
+                  f"parked={stats['parked']} parkedGraphs={stats['parkedPoseGraphs']} rejected={rejected}")
+
+            if cycle >= args.warmup and baseline is None:
+                baseline = (rss, stats)
+    finally:
+        worker.terminate()
+        try:
+            worker.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            worker.kill()
+        await signaling.stop()
+
+    if baseline is None:
+        print("Not enough cycles past warmup to judge growth")
+        return 1
+
+    base_rss, base_stats = baseline
+    last_cycle, last_rss, last_stats = samples[-1]
+    growth = (last_rss - base_rss) / 2**20
+    if growth > args.max_rss_growth:
+        failures.append(f"RSS grew {growth:.0f}MB after warmup (limit {args.max_rss_growth}MB)")
+    if (last_stats["sessions"] or last_stats["sessionTasks"] or last_stats["poseGraphs"]
+            or last_stats["parked"] or last_stats["parkedPoseGraphs"]):
+        failures.append(f"Sessions not torn down: {last_stats}")
+    if last_stats["loopTasks"] > base_stats["loopTasks"] + args.task_slack:
+        failures.append(f"Event loop tasks grew from {base_stats['loopTasks']} to {last_stats['loopTasks']}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print(f"OK: {last_cycle} cycles, RSS {growth:+.0f}MB, tasks {last_stats['loopTasks']}")
+    return 1 if failures else 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Cycle sessions against the worker and check for leaks")
+    parser.add_argument("--video", required=True, help="Recorded video file each client streams")
+    parser.add_argument("--exercise", default="pushup", help="exerciseType sent with every offer")
+    parser.add_argument("--cycles", type=int, default=1000, help="Connect/disconnect cycles")
+    parser.add_argument("--concurrency", type=int, default=2, help="Sessions opened per cycle")
+    parser.add_argument("--hold", type=float, default=1.0, help="Seconds each session streams")
+    parser.add_argument("--warmup", type=int, default=50, help="Cycles before the baseline is taken")
+    parser.add_argument("--sample-every", type=int, default=25, help="Cycles between measurements")
+    parser.add_argument("--max-rss-growth", type=float, default=50, help="Allowed RSS growth after warmup in MB")
+    parser.add_argument("--task-slack", type=int, default=5, help="Allowed event loop task growth")
+    parser.add_argument("--resume-grace", type=float, default=2.0,
+                        help="Seconds the worker keeps a dropped session parked")
+    parser.add_argument("--port", type=int, default=5103, help="Port of the local signaling stand-in")
+    parser.add_argument("--verbose", action="store_true", help="Show worker stderr")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(asyncio.run(run(parse_args())))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,99 @@
+import cv2
+import numpy as np
+
+from landmarks import LandmarkFrame
+
+# Joints the analyzers read: nose, shoulders, elbows, wrists, hips, knees, ankles
+KEY_JOINTS = np.array([0, 11, 12, 13, 14, 15, 16, 23, 24, 25, 26, 27, 28], dtype=np.int32)
+
+# Width of the grayscale copy optical flow runs on
+FLOW_WIDTH = 160
+
+# Linear extrapolation goes at most this far past the last inference, a
+# stalled inference must not turn into a pose flying off the frame
+MAX_EXTRAPOLATION = 0.5
+
+LK_PARAMS = dict(
+    winSize=(15, 15),
+    maxLevel=2,
+    criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03)
+)
+
+
+class LandmarkPropagator:
+    """Carries the last inferred landmarks across frames skipped by pose inference.
+
+    "flow" tracks the key joints with sparse Lucas-Kanade optical flow on a
+    small grayscale copy of each frame. "linear" needs no image at all and
+    extrapolates each joint with the velocity between the last two
+    inference results.
+    """
+
+    def __init__(self, mode="flow"):
+        self.mode = mode
+        self.reset()
+
+    def reset(self):
+        self.base = None  # (33, 4) x, y, z, visibility of the last inference
+        self.velocity = None
+        self.base_time = None
+        self.prev_gray = None
+        self.points = None  # Key joints in gray-frame pixels
+
+    def needs_image(self):
+        return self.mode == "flow"
+
+    def update(self, landmarks, gray=None):
+        """Record a fresh inference result"""
+        if not landmarks:
+            self.reset()
+            return
+
+        coords = landmarks.coords
+        timestamp = landmarks.timestamp
+
+        if self.mode == "linear":
+            if self.base is not None and timestamp > self.base_time:
+                self.velocity = (coords[:, :3] - self.base[:, :3]) / (timestamp - self.base_time)
+            else:
+                self.velocity = None
+        elif gray is not None:
+            h, w = gray.shape[:2]
+            self.points = (coords[KEY_JOINTS, :2] * (w, h)).reshape(-1, 1, 2).astype(np.float32)
+            self.prev_gray = gray
+
+        self.base = coords
+        self.base_time = timestamp
+
+    def propagate(self, timestamp, gray=None):
+        """Estimate landmarks for a frame that skipped inference"""
+        if self.base is None:
+            return None
+
+        if self.mode == "linear":
+            if self.velocity is None:
+                return None
+            coords = self.base.copy()
+            coords[:, :3] += self.velocity * min(timestamp - self.base_time, MAX_EXTRAPOLATION)
+            return LandmarkFrame(coords, timestamp)
+
+        if gray is None or self.prev_gray is None or self.points is None:
+            return None
+
+        points, status, _ = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, self.points, None, **LK_PARAMS)
+        tracked = status.reshape(-1) == 1
+        if not tracked.any():
+            return None
+
+        h, w = gray.shape[:2]
+        coords = self.base.copy()
+        joints = KEY_JOINTS[tracked]
+        coords[joints, :2] = points.reshape(-1, 2)[tracked] / (w, h)
+        # Joints lost by the tracker keep their old position but are marked unreliable
+        coords[KEY_JOINTS[~tracked], 3] = 0
+
+        # Track from this frame next time so drift doesn't accumulate per step
+        self.points[tracked] = points[tracked]
+        self.prev_gray = gray
+        self.base = coords
+        return LandmarkFrame(coords.copy(), timestamp)